@@ -1,3 +1,4 @@
 from django.contrib import admin
+from .models import Entry
 
-# Register your models here.
+admin.site.register(Entry)
\ No newline at end of file
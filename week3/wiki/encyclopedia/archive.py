@@ -0,0 +1,117 @@
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+
+FORMATS = ("tar", "tar.gz", "zip", "jsonl")
+
+_SUFFIXES = (
+    (".tar.gz", "tar.gz"),
+    (".tgz", "tar.gz"),
+    (".tar", "tar"),
+    (".zip", "zip"),
+    (".jsonl", "jsonl"),
+)
+
+
+def guess_format(path):
+    """
+    Returns the archive format implied by a file name, or None.
+    """
+    for suffix, fmt in _SUFFIXES:
+        if path.endswith(suffix):
+            return fmt
+    return None
+
+
+def valid_title(title):
+    """
+    Returns True if a title can be used as an entry file name.
+    """
+    return bool(title) and "/" not in title and "\0" not in title and not title.startswith(".")
+
+
+def _title(name):
+    directory, base = os.path.split(name)
+    if not base.endswith(".md"):
+        return None
+    if os.path.isabs(name) or ".." in directory.split("/"):
+        # Keep the path, so that valid_title rejects the member.
+        return name[:-3]
+    return base[:-3]
+
+
+def read_entries(path, fmt):
+    """
+    Yields the (title, content) pairs stored in an archive one at a
+    time, without loading the whole archive. "-" reads standard input
+    (tar and JSONL only).
+    """
+    if fmt == "jsonl":
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        with f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["title"], record["content"]
+    elif fmt in ("tar", "tar.gz"):
+        if path == "-":
+            archive = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*")
+        else:
+            archive = tarfile.open(path, mode="r|*")
+        with archive:
+            for member in archive:
+                title = _title(member.name)
+                if member.isfile() and title is not None:
+                    yield title, archive.extractfile(member).read().decode("utf-8")
+    elif fmt == "zip":
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                title = _title(info.filename)
+                if not info.is_dir() and title is not None:
+                    yield title, archive.read(info).decode("utf-8")
+    else:
+        raise ValueError(f"Unknown archive format: {fmt}")
+
+
+def write_entries(path, fmt, entries):
+    """
+    Writes (title, raw UTF-8 content) pairs to an archive as they are
+    produced and returns how many were written. "-" writes to standard
+    output (tar and JSONL only).
+    """
+    count = 0
+    if fmt == "jsonl":
+        f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+        try:
+            for title, raw in entries:
+                f.write(json.dumps({"title": title, "content": str(raw, "utf-8")}) + "\n")
+                count += 1
+        finally:
+            if f is not sys.stdout:
+                f.close()
+    elif fmt in ("tar", "tar.gz"):
+        mode = "w|gz" if fmt == "tar.gz" else "w|"
+        if path == "-":
+            archive = tarfile.open(fileobj=sys.stdout.buffer, mode=mode)
+        else:
+            archive = tarfile.open(path, mode=mode)
+        now = time.time()
+        with archive:
+            for title, raw in entries:
+                info = tarfile.TarInfo(f"entries/{title}.md")
+                info.size = len(raw)
+                info.mtime = now
+                archive.addfile(info, io.BytesIO(raw))
+                count += 1
+    elif fmt == "zip":
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for title, raw in entries:
+                archive.writestr(f"entries/{title}.md", bytes(raw))
+                count += 1
+    else:
+        raise ValueError(f"Unknown archive format: {fmt}")
+    return count
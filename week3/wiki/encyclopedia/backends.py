@@ -0,0 +1,280 @@
+import mmap
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import Length
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    "filesystem": "encyclopedia.backends.FileSystemBackend",
+    "database": "encyclopedia.backends.DatabaseBackend",
+}
+
+
+def load_backend(name):
+    """
+    Instantiates a storage backend given its alias ("filesystem",
+    "database") or dotted class path.
+    """
+    return import_string(BACKENDS.get(name, name))()
+
+
+class MappedFiles:
+    """
+    Cache of memory-mapped entry files, holding at most
+    WIKI_MMAP_CACHE_SIZE mappings and dropping the least recently used.
+
+    Every lookup stats the file and remaps it if it was replaced (atomic
+    saves swap in a new inode) or modified since it was mapped. Evicted
+    mappings are not closed explicitly: callers may still hold views into
+    them, and they are unmapped once the last view is released.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = OrderedDict()
+
+    @property
+    def max_files(self):
+        return getattr(settings, "WIKI_MMAP_CACHE_SIZE", 128)
+
+    def get(self, path):
+        """
+        Returns a read-only memoryview of the file at `path`, or None if
+        it doesn't exist.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.files.get(path)
+            if cached is not None and cached[0] == key:
+                self.files.move_to_end(path)
+                return cached[1]
+        if stat.st_size == 0:
+            return memoryview(b"")
+        try:
+            with open(path, "rb") as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            self.files[path] = (key, view)
+            self.files.move_to_end(path)
+            while len(self.files) > self.max_files:
+                self.files.popitem(last=False)
+        return view
+
+    def clear(self):
+        with self.lock:
+            self.files.clear()
+
+
+def write_file(path, data):
+    """
+    Atomically replaces the file at `path` with `data`: the new content
+    is written to a temporary file in the same directory, which is then
+    renamed over the old one. Readers see either the old or the new
+    file, never a missing or partial one.
+
+    WIKI_FSYNC controls durability: "never" leaves flushing to the OS,
+    "file" (the default) syncs the data before the rename, and "always"
+    also syncs the directory so the rename itself survives a crash.
+
+    The file gets FILE_UPLOAD_PERMISSIONS, like files saved through
+    default_storage (temporary files are only readable by their owner).
+    """
+    policy = getattr(settings, "WIKI_FSYNC", "file")
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        os.chmod(tmp, getattr(settings, "FILE_UPLOAD_PERMISSIONS", None) or 0o644)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if policy in ("file", "always"):
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    if policy == "always":
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class FileSystemBackend:
+    """
+    Stores each entry as entries/<title>.md in default_storage's
+    directory. Reads are served from memory-mapped files and writes are
+    atomic renames.
+    """
+
+    concurrent_writes = True
+
+    def __init__(self, directory="entries"):
+        self.directory = directory
+        self.mapped = MappedFiles()
+        # Stands in for file locks where fcntl isn't available.
+        self.local_lock = threading.Lock()
+
+    def path(self, title):
+        return default_storage.path(f"{self.directory}/{title}.md")
+
+    def lock_path(self, title):
+        return default_storage.path(f"{self.directory}/.locks/{title}.lock")
+
+    @contextmanager
+    def lock(self, title):
+        """
+        Holds an exclusive lock on an entry, shared by every process
+        using the same entries directory: an flock() on a lock file of
+        its own. Without fcntl the lock only covers this process.
+        """
+        if fcntl is None:
+            with self.local_lock:
+                yield
+            return
+        path = self.lock_path(title)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            # Released when the file is closed.
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def version(self):
+        """
+        Returns a token that changes whenever an entry is added or
+        removed: the modification time of the entries directory.
+        """
+        try:
+            return os.stat(default_storage.path(self.directory)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def list_titles(self):
+        try:
+            _, filenames = default_storage.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [re.sub(r"\.md$", "", filename)
+                for filename in filenames if filename.endswith(".md")]
+
+    def read(self, title):
+        return self.mapped.get(self.path(title))
+
+    def write(self, title, data):
+        write_file(self.path(title), data)
+
+    def delete(self, title):
+        try:
+            os.unlink(self.path(title))
+        except FileNotFoundError:
+            pass
+
+    def signature(self, title):
+        """
+        Returns the (modification time, size) of an entry's file, which
+        changes whenever the entry is rewritten, or None if it doesn't
+        exist.
+        """
+        try:
+            stat = os.stat(self.path(title))
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def signatures(self):
+        """
+        Returns a dict mapping every entry title to its signature.
+        """
+        signatures = {}
+        try:
+            with os.scandir(default_storage.path(self.directory)) as it:
+                for item in it:
+                    if item.name.endswith(".md") and item.is_file():
+                        stat = item.stat()
+                        signatures[item.name[:-3]] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return signatures
+
+    def clear(self):
+        self.mapped.clear()
+
+
+class DatabaseBackend:
+    """
+    Stores entries as rows of the Entry model, i.e. in the project's
+    SQLite database file, with a unique index on the title. Entries are
+    kept in an ordinary rowid table so an FTS5 external-content table
+    can be layered on top of it later.
+    """
+
+    # SQLite allows a single writer at a time.
+    concurrent_writes = False
+
+    def _entries(self):
+        from .models import Entry
+        return Entry.objects
+
+    def version(self):
+        stats = self._entries().aggregate(count=Count("id"), updated=Max("updated_at"))
+        return (stats["count"], stats["updated"])
+
+    def list_titles(self):
+        return list(self._entries().values_list("title", flat=True))
+
+    @contextmanager
+    def lock(self, title):
+        """
+        Holds an exclusive lock on an entry's row until the block ends,
+        by updating it in a transaction. On SQLite, which ignores
+        SELECT ... FOR UPDATE, this takes the database's write lock. On
+        other databases an entry that doesn't exist yet isn't locked;
+        concurrent creations of it are left to the unique index.
+        """
+        with transaction.atomic():
+            self._entries().filter(title=title).update(title=title)
+            yield
+
+    def read(self, title):
+        content = self._entries().filter(title=title).values_list("content", flat=True).first()
+        return None if content is None else memoryview(content.encode("utf-8"))
+
+    def write(self, title, data):
+        self._entries().update_or_create(title=title, defaults={"content": str(data, "utf-8")})
+
+    def delete(self, title):
+        self._entries().filter(title=title).delete()
+
+    def signature(self, title):
+        row = (self._entries().filter(title=title)
+               .annotate(size=Length("content")).values_list("updated_at", "size").first())
+        return None if row is None else (row[0].isoformat(), row[1])
+
+    def signatures(self):
+        rows = self._entries().annotate(size=Length("content")).values_list("title", "updated_at", "size")
+        return {title: (updated_at.isoformat(), size) for title, updated_at, size in rows}
+
+    def clear(self):
+        pass
@@ -0,0 +1,148 @@
+import math
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import util
+
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class CorpusGenerator:
+    """
+    Produces a reproducible synthetic corpus of Markdown entries.
+
+    Entry sizes (in bytes, approximately) follow the chosen distribution
+    around `mean_size`; "lognormal" gives the long tail of a real wiki,
+    with a few very large articles among many short ones. Bodies are
+    made of headings, paragraphs, lists and links to other entries,
+    drawn from a fixed vocabulary so search queries have realistic
+    document frequencies.
+    """
+
+    def __init__(self, count, mean_size=2000, distribution="lognormal", seed=0,
+                 vocabulary_size=5000):
+        self.count = count
+        self.mean_size = mean_size
+        self.distribution = distribution
+        self.seed = seed
+        rng = random.Random(seed)
+        self.vocabulary = [self._word(rng) for _ in range(vocabulary_size)]
+
+    @staticmethod
+    def _word(rng):
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+
+    def title(self, i):
+        return f"Entry{i:07d}"
+
+    def _size(self, rng):
+        if self.distribution == "fixed":
+            return self.mean_size
+        if self.distribution == "uniform":
+            return rng.randint(1, 2 * self.mean_size)
+        # Lognormal with sigma 1 has mean exp(mu + 1/2).
+        return max(1, int(rng.lognormvariate(math.log(self.mean_size) - 0.5, 1.0)))
+
+    def _sentence(self, rng):
+        words = rng.choices(self.vocabulary, k=rng.randint(6, 16))
+        if rng.random() < 0.2:
+            words[rng.randrange(len(words))] = f"[{self.title(rng.randrange(self.count))}](/{self.title(rng.randrange(self.count))})"
+        if rng.random() < 0.2:
+            words[0] = f"**{words[0]}**"
+        return " ".join(words).capitalize() + "."
+
+    def content(self, i):
+        rng = random.Random(self.seed * 1_000_003 + i)
+        size = self._size(rng)
+        parts = [f"# {self.title(i)}\n"]
+        length = len(parts[0])
+        while length < size:
+            roll = rng.random()
+            if roll < 0.1:
+                part = f"## {' '.join(rng.choices(self.vocabulary, k=3)).title()}\n"
+            elif roll < 0.25:
+                part = "".join(f"* {self._sentence(rng)}\n" for _ in range(rng.randint(2, 5)))
+            else:
+                part = " ".join(self._sentence(rng) for _ in range(rng.randint(2, 6))) + "\n"
+            parts.append(part)
+            length += len(part) + 1
+        return "\n".join(parts)
+
+    def entries(self):
+        for i in range(self.count):
+            yield self.title(i), self.content(i)
+
+    def query(self, rng):
+        """
+        Returns a search query of one or two vocabulary words, sometimes
+        with the last one truncated to a prefix.
+        """
+        words = rng.choices(self.vocabulary, k=rng.randint(1, 2))
+        if rng.random() < 0.3:
+            words[-1] = words[-1][:3]
+        return " ".join(words)
+
+
+def write_corpus(generator, workers=8):
+    """
+    Writes a generated corpus through util.save_entry and rebuilds the
+    indexes once at the end.
+    """
+    if not util.get_backend().concurrent_writes:
+        workers = 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(lambda entry: util.save_entry(*entry, reindex=False),
+                          generator.entries(), chunksize=256):
+            pass
+    util.rebuild_indexes()
+
+
+def summarize(samples):
+    """
+    Returns latency percentiles (in milliseconds) and throughput for a
+    list of per-operation timings in seconds.
+    """
+    samples = sorted(samples)
+    n = len(samples)
+
+    def percentile(p):
+        return samples[min(n - 1, int(p / 100 * n))] * 1000
+
+    total = sum(samples)
+    return {
+        "count": n,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": samples[-1] * 1000,
+        "ops_per_sec": n / total if total else None,
+    }
+
+
+def measure(operation, arguments):
+    """
+    Calls `operation` once per item in `arguments` and returns the
+    timing summary.
+    """
+    samples = []
+    for argument in arguments:
+        start = time.perf_counter()
+        operation(argument)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def corpus_stats(directory):
+    sizes = [entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".md")]
+    if not sizes:
+        return {"entries": 0}
+    return {
+        "entries": len(sizes),
+        "total_bytes": sum(sizes),
+        "mean_bytes": statistics.fmean(sizes),
+        "max_bytes": max(sizes),
+    }
@@ -0,0 +1,155 @@
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+
+from encyclopedia import benchmark, rendering, search, util, views
+
+# Marks a corpus directory as made by this command, and so safe to wipe.
+MARKER = ".wiki-benchmark"
+
+
+class Command(BaseCommand):
+    help = ("Generates a synthetic wiki corpus and measures the latency of the main "
+            "encyclopedia operations, writing the results as JSON. The corpus is kept "
+            "in a separate directory with the filesystem backend, never in the database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=1000,
+                            help="Number of entries in the corpus (e.g. 1000 to 1000000).")
+        parser.add_argument("--mean-size", type=int, default=2000,
+                            help="Mean entry size in bytes.")
+        parser.add_argument("--distribution", choices=benchmark.SIZE_DISTRIBUTIONS, default="lognormal",
+                            help="Distribution of entry sizes.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--samples", type=int, default=1000,
+                            help="Number of timed calls per operation.")
+        parser.add_argument("--workers", type=int, default=8,
+                            help="Threads used to write the corpus.")
+        parser.add_argument("--corpus-dir",
+                            help="Keep the corpus in this directory and reuse it on later runs "
+                                 "(a temporary directory is used and removed otherwise).")
+        parser.add_argument("--output", help="File to write the JSON results to (default: stdout).")
+
+    def handle(self, *args, **options):
+        if options["entries"] < 1 or options["samples"] < 1:
+            raise CommandError("--entries and --samples must be at least 1.")
+        corpus_dir = options["corpus_dir"] or tempfile.mkdtemp(prefix="wiki-benchmark-")
+        marker = os.path.join(corpus_dir, MARKER)
+        if os.path.isdir(corpus_dir) and os.listdir(corpus_dir) and not os.path.exists(marker):
+            raise CommandError(f"{corpus_dir} is not empty and wasn't created by benchmark_wiki; "
+                               f"refusing to overwrite it.")
+        entries_dir = os.path.join(corpus_dir, "entries")
+        os.makedirs(entries_dir, exist_ok=True)
+        open(marker, "a").close()
+        generator = benchmark.CorpusGenerator(
+            options["entries"], options["mean_size"], options["distribution"], options["seed"])
+
+        try:
+            with override_settings(MEDIA_ROOT=corpus_dir, WIKI_STORAGE_BACKEND="filesystem",
+                                   WIKI_REVISIONS=False,
+                                   WIKI_SEARCH_INDEX=os.path.join(corpus_dir, "search_index.json")):
+                util.reset_caches()
+                results = {}
+                if len(util.list_entries()) != options["entries"]:
+                    shutil.rmtree(entries_dir)
+                    os.makedirs(entries_dir)
+                    start = time.perf_counter()
+                    benchmark.write_corpus(generator, options["workers"])
+                    elapsed = time.perf_counter() - start
+                    results["generate"] = {"seconds": elapsed, "entries_per_sec": options["entries"] / elapsed}
+                results.update(self.run(generator, options["samples"], options["seed"]))
+                corpus = benchmark.corpus_stats(entries_dir)
+        finally:
+            util.reset_caches()
+            if not options["corpus_dir"]:
+                shutil.rmtree(corpus_dir, ignore_errors=True)
+
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": self.commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "corpus": dict(corpus, distribution=options["distribution"],
+                           mean_size=options["mean_size"], seed=options["seed"]),
+            "results": results,
+        }
+        self.summary(results)
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def run(self, generator, samples, seed):
+        rng = random.Random(seed)
+        titles = [generator.title(rng.randrange(generator.count)) for _ in range(samples)]
+        queries = [generator.query(rng) for _ in range(samples)]
+        factory = RequestFactory()
+        results = {}
+
+        def cold_list(_):
+            util.reset_caches()
+            util.list_entries()
+
+        results["list_entries_cold"] = benchmark.measure(cold_list, range(min(samples, 10)))
+        results["list_entries"] = benchmark.measure(lambda _: util.list_entries(), range(samples))
+        results["get_entry"] = benchmark.measure(util.get_entry, titles)
+
+        def cold_render(title):
+            rendering.invalidate_entry(title)
+            rendering.render_entry(title, util.get_entry_bytes(title))
+
+        results["render_cold"] = benchmark.measure(cold_render, titles)
+
+        def entry_view(title):
+            response = views.entry(factory.get(f"/{title}"), title)
+            for _ in response if response.streaming else ():
+                pass
+
+        results["entry_view"] = benchmark.measure(entry_view, titles)
+
+        def cold_search_load(_):
+            search.reset()
+            search.get_index()
+
+        results["search_load"] = benchmark.measure(cold_search_load, range(3))
+        results["search"] = benchmark.measure(search.search, queries)
+        results["random_page"] = benchmark.measure(
+            lambda _: views.random_page(factory.get("/random_page")), range(samples))
+
+        edited = titles[:min(samples, 200)]
+        results["save_entry"] = benchmark.measure(
+            lambda title: util.save_entry(title, util.get_entry(title) + "\nEdited.\n"), edited)
+        # Put the corpus back the way it was so it can be reused.
+        for title in set(edited):
+            util.save_entry(title, generator.content(int(title[len("Entry"):])))
+        return results
+
+    def commit(self):
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def summary(self, results):
+        for name, result in results.items():
+            if "p50_ms" in result:
+                self.stderr.write(
+                    f"{name:<18} p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  "
+                    f"{result['ops_per_sec'] or 0:12.0f} ops/s")
+            else:
+                self.stderr.write(f"{name:<18} {result['seconds']:.2f} s  "
+                                  f"{result['entries_per_sec']:.0f} entries/s")
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encyclopedia import archive, util
+
+
+class Command(BaseCommand):
+    help = "Exports all encyclopedia entries to a tar, zip or JSONL archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help='Archive to write, or "-" for standard output.')
+        parser.add_argument("--format", choices=archive.FORMATS,
+                            help="Archive format (guessed from the file name by default).")
+
+    def handle(self, *args, **options):
+        path = options["archive"]
+        fmt = options["format"] or archive.guess_format(path)
+        if fmt is None:
+            raise CommandError("Can't tell the archive format; pass --format.")
+        if path == "-" and fmt == "zip":
+            raise CommandError("Zip archives can't be written to standard output.")
+
+        def entries():
+            for title in util.list_entries():
+                raw = util.get_entry_bytes(title)
+                if raw is not None:
+                    yield title, raw
+
+        start = time.perf_counter()
+        count = archive.write_entries(path, fmt, entries())
+        elapsed = time.perf_counter() - start
+
+        # Keep standard output clean when the archive is written to it.
+        out = self.stderr if path == "-" else self.stdout
+        out.write(self.style.SUCCESS(
+            f"Exported {count} entries in {elapsed:.2f}s "
+            f"({count / max(elapsed, 1e-9):.0f} entries/sec)"
+        ))
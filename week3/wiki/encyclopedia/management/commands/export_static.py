@@ -0,0 +1,70 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from encyclopedia import rendering, static_export, util
+
+
+class Command(BaseCommand):
+    help = ("Renders every encyclopedia entry into a static HTML tree that can be served "
+            "without Django. Only entries whose content changed since the last export are "
+            "rendered again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Directory to write the site to.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Number of rendering processes.")
+        parser.add_argument("--force", action="store_true",
+                            help="Render every entry, e.g. after changing the templates.")
+
+    def handle(self, *args, **options):
+        output = os.path.abspath(options["output"])
+        os.makedirs(output, exist_ok=True)
+        start = time.perf_counter()
+
+        manifest = {} if options["force"] else static_export.load_manifest(output)
+        signatures = {title: list(signature) for title, signature in util.entry_signatures().items()}
+        stale = []
+        for title, signature in signatures.items():
+            known = manifest.get(title)
+            if known is not None and known["signature"] == signature:
+                continue
+            content = util.get_entry_bytes(title)
+            if known is not None and content is not None and \
+                    known["digest"] == rendering.content_digest(content):
+                # Touched but not changed.
+                known["signature"] = signature
+                continue
+            stale.append(title)
+        removed = [title for title in manifest if title not in signatures]
+
+        # Forked workers must not share this process's database
+        # connections (the database backend reads entries through them).
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=max(1, options["workers"] or 1),
+                                 initializer=static_export.init_worker,
+                                 initargs=(os.environ["DJANGO_SETTINGS_MODULE"],)) as pool:
+            render = partial(static_export.render_page, output)
+            for title, digest in pool.map(render, stale, chunksize=32):
+                if digest is None:
+                    removed.append(title)
+                else:
+                    manifest[title] = {"signature": signatures[title], "digest": digest}
+
+        for title in removed:
+            static_export.remove_page(output, title)
+            manifest.pop(title, None)
+        if stale or removed or not os.path.exists(os.path.join(output, "index.html")):
+            static_export.render_index(output, sorted(manifest))
+        static_export.copy_static(output)
+        static_export.save_manifest(output, manifest)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {len(stale)} of {len(signatures)} entries, removed {len(removed)}, "
+            f"in {elapsed:.2f}s"
+        ))
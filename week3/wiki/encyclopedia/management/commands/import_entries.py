@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encyclopedia import archive, util
+
+
+class Command(BaseCommand):
+    help = "Imports encyclopedia entries from a tar, zip or JSONL archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help='Archive to read, or "-" for standard input.')
+        parser.add_argument("--format", choices=archive.FORMATS,
+                            help="Archive format (guessed from the file name by default).")
+        parser.add_argument("--workers", type=int, default=8,
+                            help="Number of entries written in parallel.")
+
+    def handle(self, *args, **options):
+        path = options["archive"]
+        fmt = options["format"] or archive.guess_format(path)
+        if fmt is None:
+            raise CommandError("Can't tell the archive format; pass --format.")
+        if path == "-" and fmt == "zip":
+            raise CommandError("Zip archives can't be read from standard input.")
+        workers = max(1, options["workers"]) if util.get_backend().concurrent_writes else 1
+
+        start = time.perf_counter()
+        imported = skipped = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for title, content in archive.read_entries(path, fmt):
+                if not archive.valid_title(title):
+                    self.stderr.write(f"Skipping entry with invalid title {title!r}")
+                    skipped += 1
+                    continue
+                pending.add(pool.submit(util.save_entry, title, content, reindex=False))
+                imported += 1
+                # Bound the number of entries held in memory at once.
+                if len(pending) >= workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+            for future in pending:
+                future.result()
+        written = time.perf_counter() - start
+
+        util.rebuild_indexes()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} entries in {elapsed:.2f}s "
+            f"({imported / max(written, 1e-9):.0f} entries/sec written, "
+            f"{imported / max(elapsed, 1e-9):.0f} entries/sec including reindexing)"
+        ))
+        if skipped:
+            self.stdout.write(f"Skipped {skipped} entries.")
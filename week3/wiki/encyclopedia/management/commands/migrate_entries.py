@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encyclopedia import backends, util
+
+
+class Command(BaseCommand):
+    help = "Copies every encyclopedia entry from one storage backend to another."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help='Backend to read from, e.g. "filesystem".')
+        parser.add_argument("destination", help='Backend to write to, e.g. "database".')
+        parser.add_argument("--delete", action="store_true",
+                            help="Remove the entries from the source once they are copied.")
+
+    def handle(self, *args, **options):
+        if options["source"] == options["destination"]:
+            raise CommandError("Source and destination must differ.")
+        try:
+            source = backends.load_backend(options["source"])
+            destination = backends.load_backend(options["destination"])
+        except ImportError as e:
+            raise CommandError(e)
+
+        start = time.perf_counter()
+        count = 0
+        for title in source.list_titles():
+            raw = source.read(title)
+            if raw is None:
+                continue
+            destination.write(title, bytes(raw))
+            if options["delete"]:
+                source.delete(title)
+            count += 1
+        util.rebuild_indexes()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {count} entries from {options['source']} to {options['destination']} "
+            f"in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} entries/sec)"
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encyclopedia', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Revision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('number', models.PositiveIntegerField()),
+                ('snapshot', models.BooleanField()),
+                ('data', models.BinaryField()),
+                ('stored_size', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('digest', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('title', 'number'), name='unique_revision_number')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encyclopedia', '0002_revision'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entry',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
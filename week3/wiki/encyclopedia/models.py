@@ -1,3 +1,37 @@
 from django.db import models
 
-# Create your models here.
+
+class Entry(models.Model):
+    """
+    An encyclopedia entry, as stored by backends.DatabaseBackend.
+    """
+    title = models.CharField(max_length=255, unique=True)
+    content = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return self.title
+
+
+class Revision(models.Model):
+    """
+    One saved version of an entry. Snapshots hold the full content; the
+    revisions in between hold a delta against the previous revision.
+    Both are zlib-compressed in `data`.
+    """
+    title = models.CharField(max_length=255)
+    number = models.PositiveIntegerField()
+    snapshot = models.BooleanField()
+    data = models.BinaryField()
+    stored_size = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    digest = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["title", "number"], name="unique_revision_number"),
+        ]
+
+    def __str__(self):
+        return f"{self.title} (revision {self.number})"
\ No newline at end of file
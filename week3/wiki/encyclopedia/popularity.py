@@ -0,0 +1,112 @@
+import random
+import threading
+
+
+class PopularityIndex:
+    """
+    Per-entry view counts supporting random sampling weighted by count.
+
+    Counts live in a dense array of slots (one per entry ever viewed) with
+    a Fenwick tree of partial sums on top, so recording a view and drawing
+    a weighted sample both take O(log n). The array doubles when full, so
+    adding new entries is amortized O(1).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.titles = []
+        self.weights = []
+        self.tree = [0]
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self.weights))
+        self.weights.extend([0] * (capacity - len(self.weights)))
+        # Rebuild the tree in O(n): each node passes its sum to its parent.
+        tree = [0] + self.weights
+        for i in range(1, capacity + 1):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _add(self, slot, amount):
+        self.weights[slot] += amount
+        i = slot + 1
+        while i < len(self.tree):
+            self.tree[i] += amount
+            i += i & -i
+
+    def hit(self, title, amount=1):
+        """
+        Adds `amount` views to an entry.
+        """
+        with self.lock:
+            slot = self.slots.get(title)
+            if slot is None:
+                slot = len(self.titles)
+                if slot == len(self.weights):
+                    self._grow()
+                self.slots[title] = slot
+                self.titles.append(title)
+            self._add(slot, amount)
+
+    def forget(self, title):
+        """
+        Resets an entry's count, e.g. because it no longer exists.
+        """
+        with self.lock:
+            slot = self.slots.get(title)
+            if slot is not None:
+                self._add(slot, -self.weights[slot])
+
+    def sample(self, rng=random):
+        """
+        Returns a title drawn with probability proportional to its view
+        count, or None if nothing has been viewed yet.
+        """
+        with self.lock:
+            size = len(self.tree) - 1
+            total = self._prefix(size)
+            if total <= 0:
+                return None
+            target = rng.randrange(total)
+            # Walk down the tree to the first slot whose prefix sum
+            # exceeds the target.
+            position = 0
+            step = 1 << size.bit_length()
+            while step:
+                nxt = position + step
+                if nxt <= size and self.tree[nxt] <= target:
+                    position = nxt
+                    target -= self.tree[nxt]
+                step >>= 1
+            return self.titles[position]
+
+    def _prefix(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+_popularity = PopularityIndex()
+
+
+def record_view(title):
+    """
+    Counts one view of an entry.
+    """
+    _popularity.hit(title)
+
+
+def forget(title):
+    _popularity.forget(title)
+
+
+def sample():
+    """
+    Returns a viewed entry's title, picked in proportion to its views.
+    """
+    return _popularity.sample()
@@ -0,0 +1,317 @@
+import codecs
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import markdown2
+from django.conf import settings
+from django.core.cache import caches
+
+
+def content_digest(content):
+    """
+    Returns a short hex digest identifying a version of an entry's
+    Markdown content.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class RenderCache:
+    """
+    In-process LRU cache of rendered entry HTML, bounded by the total
+    size of the cached HTML in bytes (WIKI_RENDER_CACHE_BYTES).
+
+    Only the latest rendering of each title is kept, so replacing an
+    entry's content also frees the memory used by its previous version.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    @property
+    def max_bytes(self):
+        return getattr(settings, "WIKI_RENDER_CACHE_BYTES", 32 * 1024 * 1024)
+
+    def get(self, title, digest):
+        with self.lock:
+            cached = self.entries.get(title)
+            if cached is None or cached[0] != digest:
+                return None
+            self.entries.move_to_end(title)
+            return cached[1]
+
+    def put(self, title, digest, html):
+        size = len(html.encode("utf-8"))
+        with self.lock:
+            self._discard(title)
+            if size > self.max_bytes:
+                return
+            self.entries[title] = (digest, html, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def evict(self, title):
+        """
+        Drops the cached rendering of an entry and returns its digest,
+        or None if it was not cached.
+        """
+        with self.lock:
+            return self._discard(title)
+
+    def _discard(self, title):
+        cached = self.entries.pop(title, None)
+        if cached is None:
+            return None
+        self.size -= cached[2]
+        return cached[0]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_cache = RenderCache()
+
+
+def _shared_cache():
+    """
+    Returns the Django cache named by WIKI_RENDER_CACHE_ALIAS, or None if
+    rendered pages are only cached in-process.
+    """
+    alias = getattr(settings, "WIKI_RENDER_CACHE_ALIAS", None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(digest):
+    return f"encyclopedia:html:{digest}"
+
+
+def render_entry(title, content):
+    """
+    Converts an entry's Markdown content to HTML, reusing a previous
+    rendering of the same title and content if one is cached.
+
+    `content` may be a str or the entry's raw UTF-8 bytes (e.g. a
+    memoryview of the mapped file), which are only decoded on a miss.
+    """
+    digest = content_digest(content)
+    html = _cache.get(title, digest)
+    if html is not None:
+        return html
+
+    shared = _shared_cache()
+    if shared is not None:
+        html = shared.get(_shared_key(digest))
+    if html is None:
+        if not isinstance(content, str):
+            content = str(content, "utf-8")
+        html = markdown2.markdown(content)
+        if shared is not None:
+            shared.set(_shared_key(digest), html)
+    _cache.put(title, digest, html)
+    return html
+
+
+def should_stream(content):
+    """
+    Returns True if an entry is large enough (WIKI_STREAM_THRESHOLD bytes)
+    to be rendered block by block instead of into one string.
+    """
+    threshold = getattr(settings, "WIKI_STREAM_THRESHOLD", 1024 * 1024)
+    return bool(threshold) and len(content) > threshold
+
+
+def cached_entry(title, content):
+    """
+    Returns the cached rendering of an entry's content, or None.
+    """
+    return _cache.get(title, content_digest(content))
+
+
+def _iter_lines(raw, window=64 * 1024):
+    """
+    Decodes UTF-8 bytes line by line, a window at a time, so the whole
+    text never has to exist as one str.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    for start in range(0, len(raw), window):
+        pending += decoder.decode(raw[start:start + window])
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+_FENCE = re.compile(r"[ \t]*(`{3,}|~{3,})")
+_LIST_ITEM = re.compile(r"[ \t]*([*+-]|\d+\.)[ \t]")
+_LINK_DEFINITION = re.compile(r" {0,3}\[[^\]]+\]:")
+_HTML_START = re.compile(r"<([A-Za-z][\w-]*)")
+_RULE = re.compile(r" {0,3}([-*_])( *\1){2,}\s*$")
+
+
+def _plain(line):
+    """
+    Whether a line can only be part of a paragraph or a heading, not of
+    a list, blockquote, code block, HTML block, horizontal rule or link
+    definition. markdown2 lets those run on past blank lines (and past
+    link definitions, which it strips first), or renders what follows
+    them differently, so pieces never end next to them.
+    """
+    return (not line[0].isspace() and line[0] not in "<>" and not _LIST_ITEM.match(line)
+            and not _FENCE.match(line) and not _LINK_DEFINITION.match(line) and not _RULE.match(line))
+
+
+class _PieceMarkdown(markdown2.Markdown):
+    """
+    Converts the pieces of one document so that they come out as if it
+    were converted whole: reference-style links resolve against the
+    link definitions of every piece, collected beforehand.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.document_urls = {}
+        self.document_titles = {}
+        self.collecting = False
+
+    def collect(self, piece):
+        """
+        Records the link definitions of a piece, without rendering it.
+        """
+        self.collecting = True
+        try:
+            self.convert(piece)
+        finally:
+            self.collecting = False
+        # As in a whole document, later definitions win, but keep the
+        # title of an earlier one if they have none.
+        self.document_urls.update(self.urls)
+        self.document_titles.update(self.titles)
+
+    def _strip_link_definitions(self, text):
+        text = super()._strip_link_definitions(text)
+        if not self.collecting:
+            self.urls = dict(self.document_urls)
+            self.titles = dict(self.document_titles)
+        return text
+
+    def convert(self, text):
+        self.top_level = True
+        return super().convert(text)
+
+    def _run_block_gamut(self, text):
+        if self.collecting:
+            return ""
+        if self.top_level:
+            self.top_level = False
+            # A piece of nothing but link definitions; markdown2 would
+            # make an empty paragraph of it.
+            if not text.strip():
+                return ""
+        return super()._run_block_gamut(text)
+
+
+def _pieces(content, chunk_size):
+    """
+    Splits UTF-8 Markdown into pieces of roughly `chunk_size` bytes that
+    render the same apart as together. A piece only ends at blank lines
+    between two plain blocks (paragraphs or headings, see _plain), and
+    never inside a fence or an HTML block or comment.
+    """
+    piece = []
+    size = 0
+    fence = None
+    html = None
+    blank = True
+    plain = False
+    for line in _iter_lines(content):
+        stripped = line.strip()
+        if stripped and blank:
+            # A block starts.
+            if piece and plain and _plain(line) and fence is None and html is None and size >= chunk_size:
+                yield "".join(piece)
+                piece = []
+                size = 0
+            plain = True
+        piece.append(line)
+        size += len(line.encode("utf-8"))
+        blank = not stripped
+        if stripped and not _plain(line):
+            plain = False
+        match = _FENCE.match(line)
+        if fence is not None:
+            # Closed by a fence of the same character, at least as long.
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) \
+                    and not line[match.end():].strip():
+                fence = None
+        elif match:
+            fence = match.group(1)
+        elif html is not None:
+            if html in line:
+                html = None
+        elif line.startswith("<!--"):
+            html = None if "-->" in line else "-->"
+        else:
+            match = _HTML_START.match(line)
+            if match and f"</{match.group(1)}>" not in line:
+                html = f"</{match.group(1)}>"
+    if piece:
+        yield "".join(piece)
+
+
+def render_blocks(content):
+    """
+    Converts an entry's Markdown to HTML piece by piece, yielding the
+    HTML of roughly WIKI_STREAM_CHUNK_BYTES of source at a time.
+
+    Pieces are only cut between paragraphs and headings (see _pieces),
+    and every piece knows the link definitions of the whole entry, so
+    the pieces joined are what render_entry would have made. That takes two passes over the source: the first only
+    collects link definitions.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    chunk_size = getattr(settings, "WIKI_STREAM_CHUNK_BYTES", 64 * 1024)
+    markdown = _PieceMarkdown()
+    for piece in _pieces(content, chunk_size):
+        markdown.collect(piece)
+    first = True
+    for piece in _pieces(content, chunk_size):
+        html = markdown.convert(piece)
+        if not html.strip():
+            continue
+        # markdown2 separates blocks with a blank line.
+        yield html if first else "\n" + html
+        first = False
+    if first:
+        # Nothing but whitespace and link definitions.
+        yield markdown2.markdown("")
+
+
+def clear():
+    """
+    Forgets every cached rendering held in-process.
+    """
+    _cache.clear()
+
+
+def invalidate_entry(title):
+    """
+    Forgets the cached rendering of an entry, e.g. because it was edited.
+    """
+    digest = _cache.evict(title)
+    shared = _shared_cache()
+    if digest is not None and shared is not None:
+        shared.delete(_shared_key(digest))
@@ -0,0 +1,142 @@
+import difflib
+import json
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Revision
+from .rendering import content_digest
+
+
+def _compress(obj):
+    return zlib.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+
+def _decompress(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def make_delta(base, content):
+    """
+    Encodes `content` as a list of operations against `base`, line by
+    line: [start, end] copies base lines start..end, a string inserts
+    literal text.
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j1 != j2:
+            ops.append("".join(lines[j1:j2]))
+    return ops
+
+
+def apply_delta(base, ops):
+    base_lines = base.splitlines(keepends=True)
+    return "".join(
+        "".join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op
+        for op in ops
+    )
+
+
+def _needs_snapshot(title, delta_size):
+    """
+    Decides whether the next revision should be a full snapshot: when
+    the deltas since the last snapshot, plus this one, would outweigh it
+    by WIKI_REVISION_CHAIN_FACTOR, or when the chain gets longer than
+    WIKI_REVISION_MAX_CHAIN. This bounds the work needed to rebuild any
+    revision while keeping the history close to the size of its deltas.
+    """
+    factor = getattr(settings, "WIKI_REVISION_CHAIN_FACTOR", 4)
+    max_chain = getattr(settings, "WIKI_REVISION_MAX_CHAIN", 500)
+    chain = list(Revision.objects.filter(title=title)
+                 .order_by("-number").values_list("snapshot", "stored_size")[:max_chain])
+    chain_size = delta_size
+    for snapshot, stored_size in chain:
+        if snapshot:
+            return chain_size > factor * stored_size
+        chain_size += stored_size
+    return True
+
+
+def _latest(title):
+    return Revision.objects.filter(title=title).order_by("-number").first()
+
+
+def record(title, content, previous=None):
+    """
+    Adds a revision holding `content` to an entry's history. `previous`
+    is the content the entry had before this save, if known; it is used
+    as the delta base (and recorded first if the history doesn't have
+    it yet, e.g. for entries created before history was kept).
+    """
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                head = _latest(title)
+                if previous is not None and (head is None or head.digest != content_digest(previous)):
+                    head = _store(title, previous, None, head)
+                return _store(title, content, previous, head)
+        except IntegrityError:
+            # Another process took the same revision number; retry.
+            continue
+    raise IntegrityError(f"Could not record a revision of {title}")
+
+
+def _store(title, content, base, head):
+    number = head.number + 1 if head else 1
+    digest = content_digest(content)
+    if head is not None and base is not None:
+        delta = _compress(make_delta(base, content))
+        if not _needs_snapshot(title, len(delta)):
+            return Revision.objects.create(
+                title=title, number=number, snapshot=False, data=delta,
+                stored_size=len(delta), size=len(content), digest=digest)
+    data = _compress(content)
+    return Revision.objects.create(
+        title=title, number=number, snapshot=True, data=data,
+        stored_size=len(data), size=len(content), digest=digest)
+
+
+def get_revision(title, number):
+    """
+    Returns the content of revision `number` of an entry, or None if it
+    doesn't exist, by applying the deltas since the closest snapshot.
+    """
+    if not Revision.objects.filter(title=title, number=number).exists():
+        return None
+    snapshot = (Revision.objects.filter(title=title, number__lte=number, snapshot=True)
+                .order_by("-number").first())
+    if snapshot is None:
+        return None
+    content = _decompress(snapshot.data)
+    deltas = (Revision.objects.filter(title=title, number__gt=snapshot.number, number__lte=number)
+              .order_by("number").values_list("data", flat=True))
+    for data in deltas:
+        content = apply_delta(content, _decompress(data))
+    return content
+
+
+def list_revisions(title):
+    """
+    Returns an entry's revisions, newest first, without their content.
+    """
+    return (Revision.objects.filter(title=title).order_by("-number")
+            .only("number", "size", "created_at"))
+
+
+def diff(title, a, b):
+    """
+    Returns the unified diff between two revisions of an entry as a list
+    of lines, or None if either revision doesn't exist.
+    """
+    old, new = get_revision(title, a), get_revision(title, b)
+    if old is None or new is None:
+        return None
+    return list(difflib.unified_diff(
+        old.splitlines(), new.splitlines(),
+        f"{title} (revision {a})", f"{title} (revision {b})", lineterm=""))
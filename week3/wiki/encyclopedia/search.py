@@ -0,0 +1,289 @@
+import atexit
+import bisect
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Title words count as this many occurrences in the body.
+TITLE_BOOST = 3
+
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+
+# Weight of a term that only matches a query word as a prefix, relative
+# to an exact match, and how many such terms one query word expands to.
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_TERMS = 50
+
+INDEX_FORMAT = 1
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase word tokens.
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def document_terms(title, content):
+    """
+    Returns the term frequencies of an entry, with its title boosted.
+    """
+    terms = Counter(tokenize(content))
+    for term in tokenize(title):
+        terms[term] += TITLE_BOOST
+    return terms
+
+
+class SearchIndex:
+    """
+    Inverted index over encyclopedia entries, ranked with BM25.
+
+    For every entry the index keeps its term frequencies and the
+    signature (modification time and size) of the file they were read
+    from. Both are persisted, so a restart only re-tokenizes the entries
+    whose signature changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.documents = {}
+        self.signatures = {}
+        self.lengths = {}
+        self.postings = {}
+        self.terms = []
+        self.total_length = 0
+        self.dirty = False
+
+    def add(self, title, terms, signature=None):
+        with self.lock:
+            self.remove(title)
+            terms = dict(terms)
+            self.documents[title] = terms
+            self.signatures[title] = signature
+            length = sum(terms.values())
+            self.lengths[title] = length
+            self.total_length += length
+            for term, frequency in terms.items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = {}
+                    bisect.insort(self.terms, term)
+                posting[title] = frequency
+            self.dirty = True
+
+    def remove(self, title):
+        with self.lock:
+            terms = self.documents.pop(title, None)
+            if terms is None:
+                return
+            self.signatures.pop(title, None)
+            self.total_length -= self.lengths.pop(title)
+            for term in terms:
+                posting = self.postings[term]
+                del posting[title]
+                if not posting:
+                    del self.postings[term]
+                    del self.terms[bisect.bisect_left(self.terms, term)]
+            self.dirty = True
+
+    def _expand(self, word):
+        """
+        Returns the indexed terms matching a query word, with their weights.
+        """
+        matches = {}
+        if word in self.postings:
+            matches[word] = 1.0
+        i = bisect.bisect_right(self.terms, word)
+        while i < len(self.terms) and len(matches) < MAX_PREFIX_TERMS:
+            term = self.terms[i]
+            if not term.startswith(word):
+                break
+            matches[term] = PREFIX_WEIGHT
+            i += 1
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Returns up to `limit` entry titles matching the query, best first.
+        """
+        with self.lock:
+            count = len(self.documents)
+            if not count:
+                return []
+            average_length = self.total_length / count
+            scores = Counter()
+            for word in set(tokenize(query)):
+                for term, weight in self._expand(word).items():
+                    posting = self.postings[term]
+                    idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for title, frequency in posting.items():
+                        norm = K1 * (1 - B + B * self.lengths[title] / average_length)
+                        scores[title] += weight * idf * frequency * (K1 + 1) / (frequency + norm)
+            return [title for title, _ in scores.most_common(limit)]
+
+    def load(self, path):
+        """
+        Fills an empty index from a file written by save().
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("format") != INDEX_FORMAT:
+            return
+        with self.lock:
+            for title, document in data["documents"].items():
+                signature = document["signature"]
+                terms = document["terms"]
+                self.documents[title] = terms
+                self.signatures[title] = tuple(signature) if signature else None
+                self.lengths[title] = length = sum(terms.values())
+                self.total_length += length
+                for term, frequency in terms.items():
+                    self.postings.setdefault(term, {})[title] = frequency
+            # Sorting once is much cheaper than inserting term by term.
+            self.terms = sorted(self.postings)
+            self.dirty = False
+
+    def save(self, path):
+        with self.lock:
+            data = {
+                "format": INDEX_FORMAT,
+                "documents": {
+                    title: {"signature": self.signatures[title], "terms": terms}
+                    for title, terms in self.documents.items()
+                },
+            }
+            self.dirty = False
+        directory = os.path.dirname(path) or "."
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+_index = None
+_index_lock = threading.Lock()
+_persisted_at = 0.0
+# The entry index generation (see util.index_generation) the search index
+# was last synced at.
+_synced_generation = None
+
+
+def _index_path():
+    return getattr(settings, "WIKI_SEARCH_INDEX",
+                   os.path.join(settings.BASE_DIR, "search_index.json"))
+
+
+def _sync(index):
+    """
+    Brings an index up to date with the entries on disk.
+    """
+    global _synced_generation
+    from . import util
+
+    # Read first: changes made while syncing are picked up next time.
+    _synced_generation = util.index_generation()
+    signatures = util.entry_signatures()
+    for title in list(index.documents):
+        if title not in signatures:
+            index.remove(title)
+    for title, signature in signatures.items():
+        if index.signatures.get(title) != signature:
+            content = util.get_entry(title)
+            if content is not None:
+                index.add(title, document_terms(title, content), signature)
+
+
+def get_index():
+    """
+    Returns the process-wide search index, loading it from disk (and
+    re-indexing entries changed since it was saved) on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = SearchIndex()
+                index.load(_index_path())
+                _sync(index)
+                _index = index
+                persist(force=True)
+                atexit.register(persist, force=True)
+    return _index
+
+
+def persist(force=False):
+    """
+    Writes the index to disk if it changed, at most once per
+    WIKI_SEARCH_PERSIST_INTERVAL seconds unless forced.
+    """
+    global _persisted_at
+    if _index is None or not _index.dirty:
+        return
+    interval = getattr(settings, "WIKI_SEARCH_PERSIST_INTERVAL", 30.0)
+    now = time.monotonic()
+    if not force and now - _persisted_at < interval:
+        return
+    _persisted_at = now
+    _index.save(_index_path())
+
+
+def refresh():
+    """
+    Re-indexes every entry that changed on disk since it was indexed and
+    writes the index out.
+    """
+    index = get_index()
+    _sync(index)
+    persist(force=True)
+
+
+def reset():
+    """
+    Drops the in-memory index without saving it; it is loaded again on
+    next use.
+    """
+    global _index, _synced_generation
+    with _index_lock:
+        _index = None
+        _synced_generation = None
+
+
+def update_entry(title, content, signature=None):
+    """
+    Re-indexes a single entry after it was saved. Does nothing if the
+    index has not been loaded yet; it will notice the change on load.
+    """
+    if _index is None:
+        return
+    _index.add(title, document_terms(title, content), signature)
+    persist()
+
+
+def search(query, limit=20):
+    """
+    Returns the titles of the entries best matching a query. Entries
+    added, removed or rewritten other than through save_entry are
+    re-indexed first, once the entry index notices them.
+    """
+    from . import util
+
+    index = get_index()
+    if util.index_generation() != _synced_generation:
+        _sync(index)
+    return index.search(query, limit)
@@ -0,0 +1,28 @@
+document.addEventListener('DOMContentLoaded', () => {
+    const input = document.querySelector('.search');
+    const suggestions = document.querySelector('#suggestions');
+    let controller = null;
+
+    input.addEventListener('input', () => {
+        const query = input.value.trim();
+        if (controller) {
+            controller.abort();
+        }
+        if (!query) {
+            suggestions.innerHTML = '';
+            return;
+        }
+        controller = new AbortController();
+        fetch(`${input.dataset.autocompleteUrl}?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+            .then(response => response.json())
+            .then(data => {
+                suggestions.innerHTML = '';
+                data.results.forEach(title => {
+                    const option = document.createElement('option');
+                    option.value = title;
+                    suggestions.append(option);
+                });
+            })
+            .catch(() => {});
+    });
+});
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+from urllib.parse import quote
+
+import django
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from . import rendering, util
+
+MANIFEST = "manifest.json"
+# Where the pages of entries whose titles clash with the site's own
+# files go instead.
+RENAMED = "_entries"
+
+
+def _write(path, text):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _reserved(title):
+    # Compared ignoring case, for case-insensitive filesystems.
+    names = {settings.STATIC_URL.strip("/").split("/")[0], "index.html", MANIFEST, RENAMED}
+    return title.casefold() in {name.casefold() for name in names}
+
+
+def page_directory(output, title):
+    """
+    Returns the directory of an entry's page: <output>/<title>, so that
+    the wiki's own /<title> URLs work when served as a directory, or
+    <output>/_entries/<title> if that would clash with the static files,
+    the index or the manifest.
+    """
+    if _reserved(title):
+        return os.path.join(output, RENAMED, title)
+    return os.path.join(output, title)
+
+
+def page_path(output, title):
+    return os.path.join(page_directory(output, title), "index.html")
+
+
+def page_url(title):
+    """
+    Returns the URL of an entry's page in the exported site.
+    """
+    if _reserved(title):
+        return f"{reverse('index')}{RENAMED}/{quote(title)}/"
+    return reverse("entry", args=[title])
+
+
+def init_worker(settings_module):
+    """
+    Sets Django up in a worker process (needed where workers are spawned
+    rather than forked).
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
+
+
+def render_page(output, title):
+    """
+    Renders one entry through the same template as views.entry and
+    writes it out. Returns the title and the digest of the content that
+    was rendered, or None if the entry disappeared.
+    """
+    content = util.get_entry_bytes(title)
+    if content is None:
+        return title, None
+    html = render_to_string("encyclopedia/entry.html", {
+        "entry_title": title,
+        "entry_content": rendering.render_entry(title, content),
+        "static_export": True
+    })
+    _write(page_path(output, title), html)
+    return title, rendering.content_digest(content)
+
+
+def render_index(output, titles):
+    _write(os.path.join(output, "index.html"), render_to_string("encyclopedia/index.html", {
+        "entry_links": [(title, page_url(title)) for title in titles],
+        "static_export": True
+    }))
+
+
+def copy_static(output):
+    """
+    Copies the encyclopedia's static files under STATIC_URL.
+    """
+    target = os.path.join(output, settings.STATIC_URL.strip("/"))
+    for finder in finders.get_finders():
+        for path, storage in finder.list([]):
+            if path.startswith("encyclopedia/"):
+                destination = os.path.join(target, path)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copyfile(storage.path(path), destination)
+
+
+def load_manifest(output):
+    try:
+        with open(os.path.join(output, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(output, manifest):
+    _write(os.path.join(output, MANIFEST), json.dumps(manifest, separators=(",", ":")))
+
+
+def remove_page(output, title):
+    shutil.rmtree(page_directory(output, title), ignore_errors=True)
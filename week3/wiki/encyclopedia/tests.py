@@ -1,3 +1,713 @@
-from django.test import TestCase
+import glob
+import json
+import os
+import random
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import archive, backends, popularity, rendering, revisions, search, util
+from .models import Revision
+
+
+class WikiTestCase(TestCase):
+    """
+    Keeps entries and the search index of each test in a directory of
+    its own, and the in-memory indexes from leaking between tests.
+    """
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(
+            MEDIA_ROOT=self.directory, WIKI_INDEX_POLL_INTERVAL=0,
+            WIKI_SEARCH_INDEX=os.path.join(self.directory, "search_index.json")))
+        util.reset_caches()
+        self.addCleanup(util.reset_caches)
+
+    def write_externally(self, title, content):
+        """
+        Writes an entry the way another process would, behind the back
+        of this one's indexes, and makes sure the entries directory
+        looks modified (its mtime may otherwise not have moved on).
+        """
+        path = util.get_backend().path(title)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        self.touch_entries()
+
+    def touch_entries(self):
+        directory = os.path.dirname(util.get_backend().path("x"))
+        mtime = os.stat(directory).st_mtime_ns + 1_000_000_000
+        os.utime(directory, ns=(mtime, mtime))
+
+
+class EntryIndexTests(WikiTestCase):
+    def test_save_adds_entry(self):
+        util.save_entry("Python", "# Python")
+        self.assertEqual(util.list_entries(), ("Python",))
+        util.save_entry("Django", "# Django")
+        self.assertEqual(util.list_entries(), ("Django", "Python"))
+        self.assertEqual(util.complete_entries("dj"), ["Django"])
+
+    def test_save_keeps_entries_added_externally(self):
+        util.save_entry("Python", "# Python")
+        self.assertEqual(util.list_entries(), ("Python",))
+        self.write_externally("Git", "# Git")
+        # Saved before the index was polled again.
+        util.save_entry("Django", "# Django")
+        self.assertEqual(util.list_entries(), ("Django", "Git", "Python"))
+        self.assertTrue(util.entry_exists("Git"))
+
+    def test_external_changes_are_polled(self):
+        util.save_entry("Python", "# Python")
+        self.assertEqual(util.list_entries(), ("Python",))
+        self.write_externally("Git", "# Git")
+        self.assertEqual(util.list_entries(), ("Git", "Python"))
+        util.get_backend().delete("Git")
+        self.touch_entries()
+        self.assertFalse(util.entry_exists("Git"))
+
+
+class SaveEntryTests(WikiTestCase):
+    def test_new_entry(self):
+        util.save_entry("Python", "A snake.", expected_version="")
+        self.assertEqual(util.get_entry("Python"), "A snake.")
+        with self.assertRaises(util.EntryConflict):
+            util.save_entry("Python", "A language.", expected_version="")
+        self.assertEqual(util.get_entry("Python"), "A snake.")
+
+    def test_conflict(self):
+        util.save_entry("Python", "A snake.")
+        loaded = util.entry_version("Python")
+        util.save_entry("Python", "A language.")
+        with self.assertRaises(util.EntryConflict):
+            util.save_entry("Python", "A snake, really.", expected_version=loaded)
+        self.assertEqual(util.get_entry("Python"), "A language.")
+        self.assertEqual(Revision.objects.filter(title="Python").count(), 2)
+        util.save_entry("Python", "A snake, really.", expected_version=util.entry_version("Python"))
+        self.assertEqual(util.get_entry("Python"), "A snake, really.")
+
+    def test_unchanged_content_is_not_saved(self):
+        util.save_entry("Python", "A snake.")
+        signature = util.entry_signature("Python")
+        util.save_entry("Python", "A snake.", expected_version=util.entry_version("Python"))
+        util.save_entry("Python", "A snake.")
+        self.assertEqual(util.entry_signature("Python"), signature)
+        self.assertEqual(Revision.objects.filter(title="Python").count(), 1)
+
+    def test_files_are_readable(self):
+        util.save_entry("Python", "A snake.")
+        mode = stat.S_IMODE(os.stat(util.get_backend().path("Python")).st_mode)
+        self.assertEqual(mode, 0o644)
+
+    @skipUnless(backends.fcntl, "needs fcntl")
+    def test_lock_is_held_across_processes(self):
+        backend = util.get_backend()
+        script = ("import fcntl, sys\n"
+                  "with open(sys.argv[1], 'a') as f:\n"
+                  "    try:\n"
+                  "        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)\n"
+                  "    except BlockingIOError:\n"
+                  "        sys.exit(1)\n")
+        with backend.lock("Python"):
+            held = subprocess.run([sys.executable, "-c", script, backend.lock_path("Python")])
+        self.assertEqual(held.returncode, 1)
+        free = subprocess.run([sys.executable, "-c", script, backend.lock_path("Python")])
+        self.assertEqual(free.returncode, 0)
+
+
+    @skipUnless(backends.fcntl, "needs fcntl")
+    def test_revision_is_recorded_under_lock(self):
+        backend = util.get_backend()
+        held = []
+
+        def record(title, content, previous):
+            with open(backend.lock_path(title), "a") as f:
+                try:
+                    backends.fcntl.flock(f.fileno(), backends.fcntl.LOCK_EX | backends.fcntl.LOCK_NB)
+                except BlockingIOError:
+                    held.append(title)
+
+        with mock.patch.object(revisions, "record", record):
+            util.save_entry("Python", "A snake.")
+        self.assertEqual(held, ["Python"])
+
+    def test_new_page_does_not_overwrite(self):
+        response = self.client.post(reverse("new_page"), {"title": "Python", "content": "A snake."})
+        self.assertRedirects(response, reverse("entry", args=["Python"]), fetch_redirect_response=False)
+        response = self.client.post(reverse("new_page"), {"title": "Python", "content": "A language."})
+        self.assertContains(response, "Python already exists")
+        # Created by another process since this one last polled.
+        self.write_externally("Git", "A tool.")
+        response = self.client.post(reverse("new_page"), {"title": "Git", "content": "A game."})
+        self.assertContains(response, "Git already exists")
+        self.assertEqual(util.get_entry("Python"), "A snake.")
+        self.assertEqual(util.get_entry("Git"), "A tool.")
+
+
+@override_settings(WIKI_STORAGE_BACKEND="database")
+class DatabaseSaveEntryTests(WikiTestCase):
+    def test_conflict(self):
+        util.save_entry("Python", "A snake.", expected_version="")
+        loaded = util.entry_version("Python")
+        util.save_entry("Python", "A language.", expected_version=loaded)
+        with self.assertRaises(util.EntryConflict):
+            util.save_entry("Python", "A snake, really.", expected_version=loaded)
+        self.assertEqual(util.get_entry("Python"), "A language.")
+        self.assertEqual(util.list_entries(), ("Python",))
+
+
+class MigrateEntriesTests(WikiTestCase):
+    def migrate(self, source, destination, **options):
+        stdout = StringIO()
+        call_command("migrate_entries", source, destination, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_filesystem_to_database_and_back(self):
+        filesystem = backends.load_backend("filesystem")
+        database = backends.load_backend("database")
+        entries = {"Python": "# Python\n\nA snäke.", "Git": "# Git"}
+        for title, content in entries.items():
+            util.save_entry(title, content)
+
+        self.assertIn("Copied 2 entries from filesystem to database", self.migrate("filesystem", "database"))
+        self.assertEqual(sorted(database.list_titles()), ["Git", "Python"])
+        self.assertEqual(bytes(database.read("Python")), entries["Python"].encode("utf-8"))
+        # Copies are left behind without --delete.
+        self.assertEqual(sorted(filesystem.list_titles()), ["Git", "Python"])
+
+        filesystem.delete("Python")
+        filesystem.delete("Git")
+        self.assertIn("Copied 2 entries from database to filesystem",
+                      self.migrate("database", "filesystem", delete=True))
+        self.assertEqual(list(database.list_titles()), [])
+        self.assertEqual({title: util.get_entry(title) for title in util.list_entries()}, entries)
+        self.assertEqual(search.search("snäke"), ["Python"])
+
+    def test_same_backend(self):
+        with self.assertRaises(CommandError):
+            self.migrate("database", "database")
+
+
+class RevisionTests(WikiTestCase):
+    def save_versions(self, title, count):
+        versions = []
+        for i in range(1, count + 1):
+            content = "".join(f"Line {n}\n" for n in range(20)) + f"Version {i}\n"
+            util.save_entry(title, content)
+            versions.append(content)
+        return versions
+
+    def test_delta_round_trip(self):
+        base = "one\ntwo\nthree\n"
+        content = "one\n2\nthree\nfour"
+        self.assertEqual(revisions.apply_delta(base, revisions.make_delta(base, content)), content)
+        self.assertEqual(revisions.make_delta(base, base), [[0, 3]])
+
+    @override_settings(WIKI_REVISION_MAX_CHAIN=2)
+    def test_get_revision_across_snapshots(self):
+        versions = self.save_versions("Python", 7)
+        snapshots = list(Revision.objects.filter(title="Python").order_by("number")
+                         .values_list("snapshot", flat=True))
+        self.assertEqual(snapshots, [True, False, False, True, False, False, True])
+        for number, content in enumerate(versions, 1):
+            self.assertEqual(revisions.get_revision("Python", number), content)
+        self.assertIsNone(revisions.get_revision("Python", 8))
+        self.assertIsNone(revisions.get_revision("Git", 1))
+
+    def test_needs_snapshot(self):
+        self.assertTrue(revisions._needs_snapshot("Python", 10))
+        content = self.save_versions("Python", 1)[0]
+        snapshot = Revision.objects.get(title="Python")
+        self.assertTrue(snapshot.snapshot)
+        factor = settings.WIKI_REVISION_CHAIN_FACTOR
+        self.assertFalse(revisions._needs_snapshot("Python", factor * snapshot.stored_size))
+        self.assertTrue(revisions._needs_snapshot("Python", factor * snapshot.stored_size + 1))
+        # Deltas since the snapshot count towards it.
+        util.save_entry("Python", content + "More\n")
+        util.save_entry("Python", content + "More\nAgain\n")
+        deltas = sum(Revision.objects.filter(title="Python", snapshot=False)
+                     .values_list("stored_size", flat=True))
+        self.assertEqual(Revision.objects.filter(title="Python", snapshot=False).count(), 2)
+        size = factor * snapshot.stored_size - deltas
+        self.assertFalse(revisions._needs_snapshot("Python", size))
+        self.assertTrue(revisions._needs_snapshot("Python", size + 1))
+
+    def test_record_retries_taken_numbers(self):
+        versions = self.save_versions("Python", 2)
+        latest = revisions._latest
+        # Another process is about to take number 3 when this one looks.
+        stale = mock.Mock(side_effect=[Revision.objects.get(title="Python", number=1), latest("Python")])
+        with mock.patch.object(revisions, "_latest", stale):
+            revision = revisions.record("Python", "Version 3\n", versions[-1])
+        self.assertEqual(stale.call_count, 2)
+        self.assertEqual(revision.number, 3)
+        self.assertEqual(revisions.get_revision("Python", 3), "Version 3\n")
+
+    def test_diff(self):
+        util.save_entry("Python", "A snake.\nIt bites.\n")
+        util.save_entry("Python", "A language.\nIt bites.\n")
+        self.assertEqual(revisions.diff("Python", 1, 2), [
+            "--- Python (revision 1)",
+            "+++ Python (revision 2)",
+            "@@ -1,2 +1,2 @@",
+            "-A snake.",
+            "+A language.",
+            " It bites.",
+        ])
+        self.assertEqual(revisions.diff("Python", 2, 2), [])
+        self.assertIsNone(revisions.diff("Python", 1, 3))
+
+    def test_save_without_revision_table(self):
+        with mock.patch.object(revisions, "record", side_effect=OperationalError("no such table")), \
+                self.assertLogs("encyclopedia.util", "WARNING"):
+            util.save_entry("Python", "A snake.")
+        self.assertEqual(util.get_entry("Python"), "A snake.")
+        self.assertEqual(search.search("snake"), ["Python"])
+
+
+class SearchIndexTests(TestCase):
+    def make_index(self, entries):
+        index = search.SearchIndex()
+        for title, content in entries.items():
+            index.add(title, search.document_terms(title, content), (len(content), 0))
+        return index
+
+    def test_ranks_with_bm25(self):
+        index = self.make_index({
+            "Python": "A language.",
+            "Snakes": "Python is a snake. " + "Other words here. " * 20,
+            "Reptiles": "Lizards and python and python and python.",
+            "Git": "Version control.",
+        })
+        # Title words are boosted; among bodies, more occurrences in a
+        # shorter entry rank higher.
+        self.assertEqual(index.search("python"), ["Python", "Reptiles", "Snakes"])
+        self.assertEqual(index.search("python", limit=1), ["Python"])
+        self.assertEqual(index.search("nothing"), [])
+        # Rarer terms weigh more.
+        self.assertEqual(index.search("version python")[0], "Git")
+
+    def test_expands_prefixes(self):
+        index = self.make_index({
+            "Frame": "A frame.",
+            "Framework": "A framework.",
+            "Frameworks": "Some frameworks.",
+        })
+        self.assertEqual(index._expand("frame"), {"frame": 1.0, "framework": search.PREFIX_WEIGHT,
+                                                  "frameworks": search.PREFIX_WEIGHT})
+        self.assertEqual(index._expand("frameworks"), {"frameworks": 1.0})
+        self.assertEqual(index._expand("x"), {})
+        # Exact matches rank above prefix matches.
+        self.assertEqual(index.search("frame")[0], "Frame")
+        self.assertEqual(set(index.search("fram")), {"Frame", "Framework", "Frameworks"})
+
+    def test_remove(self):
+        index = self.make_index({"Python": "A snake.", "Git": "A tool."})
+        index.remove("Python")
+        self.assertEqual(index.search("snake"), [])
+        self.assertNotIn("snake", index.terms)
+        self.assertEqual(index.search("tool"), ["Git"])
+
+    def test_load_save_round_trip(self):
+        index = self.make_index({"Python": "A snake.", "Git": "A tool, a tool."})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            index.save(path)
+            self.assertFalse(index.dirty)
+            loaded = search.SearchIndex()
+            loaded.load(path)
+        self.assertEqual(loaded.documents, index.documents)
+        self.assertEqual(loaded.signatures, index.signatures)
+        self.assertEqual(loaded.lengths, index.lengths)
+        self.assertEqual(loaded.total_length, index.total_length)
+        self.assertEqual(loaded.terms, index.terms)
+        self.assertEqual(loaded.search("a tool"), index.search("a tool"))
+
+    def test_load_ignores_missing_or_foreign_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            index = search.SearchIndex()
+            index.load(path)
+            with open(path, "w") as f:
+                f.write('{"format": 0, "documents": {"Python": {}}}')
+            index.load(path)
+        self.assertEqual(index.documents, {})
+
+
+class SearchTests(WikiTestCase):
+    def test_saved_entries_are_searchable(self):
+        util.save_entry("Python", "A snake.")
+        self.assertEqual(search.search("snake"), ["Python"])
+        util.save_entry("Python", "A language.")
+        self.assertEqual(search.search("snake"), [])
+        self.assertEqual(search.search("language"), ["Python"])
+
+    def test_external_changes_are_reindexed(self):
+        util.save_entry("Python", "A snake.")
+        util.save_entry("Git", "A tool.")
+        self.assertEqual(search.search("snake"), ["Python"])
+        util.get_backend().delete("Python")
+        self.touch_entries()
+        self.write_externally("Cobra", "Another snake.")
+        self.assertEqual(search.search("snake"), ["Cobra"])
+
+    def test_index_is_persisted(self):
+        util.save_entry("Python", "A snake.")
+        search.search("snake")
+        search.persist(force=True)
+        search.reset()
+        index = search.get_index()
+        self.assertIn("Python", index.documents)
+        self.assertEqual(index.signatures["Python"], util.entry_signature("Python"))
+
+
+class ArchiveTests(WikiTestCase):
+    def import_entries(self, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("import_entries", path, workers=1, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_export_import_round_trip(self):
+        entries = {"Python": "# Python\n\nA snäke.", "Git": "# Git", "C++": ""}
+        for title, content in entries.items():
+            util.save_entry(title, content)
+        for fmt in archive.FORMATS:
+            with self.subTest(fmt=fmt):
+                path = os.path.join(self.directory, f"entries.{fmt}")
+                call_command("export_entries", path, stdout=StringIO())
+                for title in entries:
+                    util.get_backend().delete(title)
+                util.rebuild_indexes()
+                self.assertEqual(util.list_entries(), ())
+                stdout, stderr = self.import_entries(path)
+                self.assertIn("Imported 3 entries", stdout)
+                self.assertEqual(stderr, "")
+                self.assertEqual({title: util.get_entry(title) for title in util.list_entries()}, entries)
+                self.assertEqual(search.search("snäke"), ["Python"])
+
+    def test_import_overwrites_existing_entries(self):
+        util.save_entry("Python", "# Old Python")
+        util.save_entry("Git", "# Git")
+        path = os.path.join(self.directory, "entries.jsonl")
+        archive.write_entries(path, "jsonl", [("Python", "# New Python".encode("utf-8"))])
+        self.import_entries(path)
+        self.assertEqual(util.get_entry("Python"), "# New Python")
+        # Entries missing from the archive are left alone.
+        self.assertEqual(util.get_entry("Git"), "# Git")
+        self.assertEqual(search.search("Old"), [])
+
+    def test_unsafe_member_names_are_skipped(self):
+        path = os.path.join(self.directory, "entries.tar")
+        with tarfile.open(path, "w") as tar:
+            for name in ["entries/Python.md", "../Evil.md", "/etc/Evil.md", "entries/../../Evil.md",
+                         "entries/.hidden.md", "entries/notes.txt"]:
+                info = tarfile.TarInfo(name)
+                info.size = 6
+                tar.addfile(info, BytesIO(b"# Text"))
+        stdout, stderr = self.import_entries(path)
+        self.assertEqual(util.list_entries(), ("Python",))
+        self.assertIn("Skipped 4 entries", stdout)
+        for title in ["../Evil", "/etc/Evil", "entries/../../Evil", ".hidden"]:
+            self.assertIn(repr(title), stderr)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "Evil.md")))
+
+        path = os.path.join(self.directory, "entries.zip")
+        with zipfile.ZipFile(path, "w") as archive_file:
+            archive_file.writestr("../Evil.md", "# Evil")
+        self.assertIn("Skipped 1 entries", self.import_entries(path)[0])
+
+        path = os.path.join(self.directory, "entries.jsonl")
+        archive.write_entries(path, "jsonl", [("a/../Evil", b"# Evil"), ("..", b""), ("", b"")])
+        self.assertIn("Skipped 3 entries", self.import_entries(path)[0])
+        self.assertEqual(util.list_entries(), ("Python",))
+
+
+class StaticExportTests(WikiTestCase):
+    def export(self, output):
+        stdout = StringIO()
+        call_command("export_static", output, workers=1, stdout=stdout)
+        return stdout.getvalue()
+
+    def read(self, *path):
+        with open(os.path.join(*path), encoding="utf-8") as f:
+            return f.read()
+
+    def test_pages_only_link_to_exported_pages(self):
+        util.save_entry("Python", "# Python\n\nSee [Git](/Git).")
+        util.save_entry("Git", "# Git")
+        output = os.path.join(self.directory, "site")
+        self.assertIn("Rendered 2 of 2 entries", self.export(output))
+        for page in [("index.html",), ("Python", "index.html")]:
+            html = self.read(output, *page)
+            self.assertIn('href="/"', html)
+            for url in ["/search", "/autocomplete", "/new_page", "/random_page", "autocomplete.js"]:
+                self.assertNotIn(url, html)
+        self.assertIn('href="/Git"', self.read(output, "Python", "index.html"))
+        self.assertIn('href="/Python"', self.read(output, "index.html"))
+
+    def test_only_changed_entries_are_rendered_again(self):
+        util.save_entry("Python", "# Python")
+        util.save_entry("Git", "# Git")
+        output = os.path.join(self.directory, "site")
+        self.export(output)
+        util.save_entry("Git", "# Git\n\nVersion control.")
+        util.get_backend().delete("Python")
+        self.assertIn("Rendered 1 of 1 entries, removed 1", self.export(output))
+        self.assertIn("Version control.", self.read(output, "Git", "index.html"))
+        self.assertFalse(os.path.exists(os.path.join(output, "Python")))
+
+
+    def test_titles_clashing_with_site_files_are_renamed(self):
+        for title in ["static", "Index.html", "manifest.json", "_entries", "Python"]:
+            util.save_entry(title, f"# {title} page")
+        output = os.path.join(self.directory, "site")
+        self.export(output)
+        self.assertTrue(os.path.exists(os.path.join(output, "static", "encyclopedia", "styles.css")))
+        json.loads(self.read(output, "manifest.json"))
+        index = self.read(output, "index.html")
+        for title in ["static", "Index.html", "manifest.json", "_entries"]:
+            self.assertIn(f"<h1>{title} page</h1>", self.read(output, "_entries", title, "index.html"))
+            self.assertIn(f'href="/_entries/{title}/"', index)
+        self.assertIn('href="/Python"', index)
+        self.assertIn("<h1>Python page</h1>", self.read(output, "Python", "index.html"))
+
+        util.get_backend().delete("static")
+        self.assertIn("removed 1", self.export(output))
+        self.assertFalse(os.path.exists(os.path.join(output, "_entries", "static")))
+        self.assertTrue(os.path.exists(os.path.join(output, "static", "encyclopedia", "styles.css")))
+
+
+class BenchmarkTests(WikiTestCase):
+    def benchmark(self, corpus_dir, **options):
+        options = {"entries": 5, "samples": 2, "workers": 1, "corpus_dir": corpus_dir, **options}
+        stdout = StringIO()
+        call_command("benchmark_wiki", stdout=stdout, stderr=StringIO(), **options)
+        return stdout.getvalue()
+
+    def test_corpus_is_reused(self):
+        corpus_dir = os.path.join(self.directory, "corpus")
+        self.assertIn('"generate"', self.benchmark(corpus_dir))
+        self.assertTrue(os.path.exists(os.path.join(corpus_dir, ".wiki-benchmark")))
+        self.assertNotIn('"generate"', self.benchmark(corpus_dir))
+        self.assertIn('"generate"', self.benchmark(corpus_dir, entries=3))
+        self.assertEqual(len(glob.glob(os.path.join(corpus_dir, "entries", "*.md"))), 3)
+
+    def test_unknown_directory_is_left_alone(self):
+        corpus_dir = os.path.join(self.directory, "corpus")
+        os.makedirs(os.path.join(corpus_dir, "entries"))
+        with open(os.path.join(corpus_dir, "entries", "Python.md"), "w") as f:
+            f.write("# Python")
+        with self.assertRaisesMessage(CommandError, "refusing to overwrite"):
+            self.benchmark(corpus_dir)
+        self.assertEqual(os.listdir(os.path.join(corpus_dir, "entries")), ["Python.md"])
+
+    def test_samples_are_validated(self):
+        with self.assertRaises(CommandError):
+            self.benchmark(os.path.join(self.directory, "corpus"), samples=0)
+
+
+class PopularityTests(WikiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(popularity, "_popularity", popularity.PopularityIndex()))
+
+    def test_prefix_sums(self):
+        index = popularity.PopularityIndex()
+        # Past the initial 16 slots, so the tree is rebuilt once.
+        for i in range(20):
+            index.hit(f"Entry{i}", i + 1)
+        for i in range(21):
+            self.assertEqual(index._prefix(i), sum(range(1, i + 1)))
+        index.hit("Entry3", 10)
+        index.forget("Entry10")
+        index.forget("Unknown")
+        weights = [i + 1 for i in range(20)]
+        weights[3] += 10
+        weights[10] = 0
+        for i in range(21):
+            self.assertEqual(index._prefix(i), sum(weights[:i]))
+
+    def test_sampling_favours_heavier_entries(self):
+        index = popularity.PopularityIndex()
+        self.assertIsNone(index.sample())
+        index.hit("Python", 9)
+        index.hit("Git")
+        rng = random.Random(0)
+        samples = [index.sample(rng) for _ in range(1000)]
+        self.assertEqual(set(samples), {"Python", "Git"})
+        self.assertGreater(samples.count("Python"), 850)
+        index.forget("Python")
+        self.assertEqual({index.sample(rng) for _ in range(100)}, {"Git"})
+        index.forget("Git")
+        self.assertIsNone(index.sample(rng))
+
+    def test_random_page_of_empty_wiki(self):
+        for weighted in ["0", "1"]:
+            response = self.client.get(reverse("random_page"), {"weighted": weighted})
+            self.assertRedirects(response, reverse("index"), fetch_redirect_response=False)
+
+    def test_weighted_random_page(self):
+        util.save_entry("Python", "# Python")
+        util.save_entry("Git", "# Git")
+        self.client.get(reverse("entry", args=["Python"]))
+        for _ in range(10):
+            response = self.client.get(reverse("random_page"), {"weighted": "1"})
+            self.assertRedirects(response, reverse("entry", args=["Python"]), fetch_redirect_response=False)
+        # Viewed entries that were deleted since are skipped.
+        popularity.forget("Python")
+        popularity.record_view("Deleted")
+        response = self.client.get(reverse("random_page"), {"weighted": "1"})
+        self.assertIn(response["Location"], [reverse("entry", args=[title]) for title in ["Python", "Git"]])
+        self.assertIsNone(popularity.sample())
+
+
+class RenderCacheTests(WikiTestCase):
+    def render(self, title, content):
+        with mock.patch.object(rendering.markdown2, "markdown", wraps=rendering.markdown2.markdown) as markdown:
+            html = rendering.render_entry(title, content)
+        return html, markdown.call_count
+
+    def test_same_content_is_rendered_once(self):
+        self.assertEqual(self.render("Python", "# Python"), ("<h1>Python</h1>\n", 1))
+        self.assertEqual(self.render("Python", "# Python"), ("<h1>Python</h1>\n", 0))
+        # Raw bytes of the same content hit too.
+        self.assertEqual(self.render("Python", memoryview(b"# Python")), ("<h1>Python</h1>\n", 0))
+
+    def test_changed_content_is_rendered_again(self):
+        self.render("Python", "# Python")
+        self.assertEqual(self.render("Python", "# Python 3"), ("<h1>Python 3</h1>\n", 1))
+        self.assertEqual(self.render("Python", "# Python 3"), ("<h1>Python 3</h1>\n", 0))
+        # Only the latest rendering of a title is kept.
+        self.assertEqual(list(rendering._cache.entries), ["Python"])
+        rendering.invalidate_entry("Python")
+        self.assertEqual(self.render("Python", "# Python 3")[1], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = rendering.RenderCache()
+        with override_settings(WIKI_RENDER_CACHE_BYTES=30):
+            cache.put("A", "a", "x" * 10)
+            cache.put("B", "b", "x" * 10)
+            cache.put("C", "c", "x" * 10)
+            self.assertEqual(cache.get("A", "a"), "x" * 10)
+            cache.put("D", "d", "x" * 10)
+            self.assertEqual(list(cache.entries), ["C", "A", "D"])
+            self.assertIsNone(cache.get("B", "b"))
+            self.assertEqual(cache.size, 30)
+            # Too large to be cached at all.
+            cache.put("E", "e", "x" * 31)
+            self.assertIsNone(cache.get("E", "e"))
+            self.assertEqual(cache.size, 30)
+        self.assertIsNone(cache.get("A", "other digest"))
+
+    @override_settings(WIKI_STREAM_CHUNK_BYTES=10)
+    def test_streamed_rendering_matches_whole(self):
+        content = "\n\n".join([
+            "# Streaming",
+            "See [Python][py] and [Git][].",
+            "* loose item one",
+            "* loose item two\n\n    continued paragraph",
+            "Para with ümlaut.",
+            "````\ncode with ```\ninside\n\nstill code\n````",
+            "  ```\n  indented fence\n\n  x\n  ```",
+            "    indented code\n\n    more code",
+            "<div>\nhtml block\n\nmore html\n</div>",
+            "<!-- a\n\ncomment -->",
+            "## Links",
+            "[py]: https://python.org \"Python\"\n[git]: https://git-scm.com",
+            "Use [py] once more.",
+        ])
+        pieces = list(rendering.render_blocks(content))
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), rendering.markdown2.markdown(content))
+        self.assertIn('<a href="https://python.org" title="Python">Python</a>', pieces[1])
+        # Pieces are cut by their size in bytes, not characters.
+        self.assertEqual(list(rendering._pieces("ä ä ä\n\nb\n".encode("utf-8"), 8)), ["ä ä ä\n\n", "b\n"])
+        self.assertEqual(list(rendering.render_blocks("[py]: https://python.org")), ["<p></p>\n"])
+
+
+class AutocompleteTests(WikiTestCase):
+    def setUp(self):
+        super().setUp()
+        for title in ["CSS", "Django", "django-rest", "Git", "GitHub", "Gitlab", "Python"]:
+            util.save_entry(title, f"# {title}")
+
+    def complete(self, **params):
+        response = self.client.get(reverse("autocomplete"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        return response.json()
+
+    def test_matches_prefixes_ignoring_case(self):
+        self.assertEqual(self.complete(q="git"), {"results": ["Git", "GitHub", "Gitlab"]})
+        self.assertEqual(self.complete(q="DJANGO"), {"results": ["Django", "django-rest"]})
+        self.assertEqual(self.complete(q="  py "), {"results": ["Python"]})
+        self.assertEqual(self.complete(q="Rust"), {"results": []})
+
+    def test_limit(self):
+        self.assertEqual(self.complete(q="g", limit=2), {"results": ["Git", "GitHub"]})
+        self.assertEqual(self.complete(q="g", limit="many"), {"results": ["Git", "GitHub", "Gitlab"]})
+        self.assertEqual(util.complete_entries("", 100), ["CSS", "Django", "django-rest", "Git", "GitHub",
+                                                          "Gitlab", "Python"])
+        for i in range(60):
+            util.save_entry(f"Go{i:02d}", "# Go")
+        self.assertEqual(len(self.complete(q="go", limit=100)["results"]), 50)
+        self.assertEqual(len(self.complete(q="go")["results"]), 10)
+
+    def test_empty_query(self):
+        self.assertEqual(self.complete(), {"results": []})
+        self.assertEqual(self.complete(q="   "), {"results": []})
+
+
+class RawEntryTests(WikiTestCase):
+    def test_raw_content(self):
+        content = "# Python\n\nA snäke."
+        util.save_entry("Python", content)
+        response = self.client.get(reverse("raw_entry", args=["Python"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/markdown; charset=utf-8")
+        self.assertEqual(response.content, content.encode("utf-8"))
+        self.assertEqual(response["ETag"], '"%s"' % rendering.content_digest(content))
+
+    def test_missing_entry(self):
+        response = self.client.get(reverse("raw_entry", args=["Python"]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content, b"Python not found")
+
+    def test_saved_entry_is_mapped_again(self):
+        util.save_entry("Python", "A snake.")
+        old = util.get_entry_bytes("Python")
+        self.assertEqual(self.client.get(reverse("raw_entry", args=["Python"])).content, b"A snake.")
+        # Same size, so only the new file tells them apart.
+        util.save_entry("Python", "A lizard")
+        self.assertEqual(self.client.get(reverse("raw_entry", args=["Python"])).content, b"A lizard")
+        # Views handed out before stay valid and unchanged.
+        self.assertEqual(bytes(old), b"A snake.")
+
+    def test_mappings_are_bounded(self):
+        mapped = util.get_backend().mapped
+        with override_settings(WIKI_MMAP_CACHE_SIZE=2):
+            for title in ["A", "B", "C"]:
+                util.save_entry(title, f"Entry {title}")
+                util.get_entry_bytes(title)
+            self.assertEqual([os.path.basename(path) for path in mapped.files], ["B.md", "C.md"])
+            self.assertEqual(util.get_entry("A"), "Entry A")
+
+    def test_empty_entry(self):
+        # mmap() can't map an empty file.
+        self.write_externally("Empty", "")
+        self.assertEqual(bytes(util.get_entry_bytes("Empty")), b"")
+        response = self.client.get(reverse("raw_entry", args=["Empty"]))
+        self.assertEqual((response.status_code, response.content), (200, b""))
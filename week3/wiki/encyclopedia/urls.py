@@ -5,9 +5,14 @@ from . import views
 urlpatterns = [
     path("", views.index, name="index"),
     path("search", views.search, name="search"),
+    path("autocomplete", views.autocomplete, name="autocomplete"),
     path("editor", views.editor, name="editor"),
     path("editor/<str:title>", views.editor, name="editor"),
     path("new_page", views.new_page, name="new_page"),
     path("random_page", views.random_page, name="random_page"),
+    path("<str:title>/raw", views.raw_entry, name="raw_entry"),
+    path("<str:title>/history", views.history, name="history"),
+    path("<str:title>/revision/<int:number>", views.revision, name="revision"),
+    path("<str:title>/diff/<int:a>/<int:b>", views.diff, name="diff"),
     path("<str:title>", views.entry, name="entry"),
 ]
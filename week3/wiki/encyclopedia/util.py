@@ -1,28 +1,293 @@
-import re
+import bisect
+import logging
+import random
+import threading
+import time
 
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from django.conf import settings
+from django.db import DatabaseError
+
+from . import backends, popularity, rendering, revisions, search
+
+logger = logging.getLogger(__name__)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Returns the storage backend selected by WIKI_STORAGE_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = backends.load_backend(
+                    getattr(settings, "WIKI_STORAGE_BACKEND", "filesystem"))
+    return _backend
+
+
+class EntryIndex:
+    """
+    Process-wide, sorted index of encyclopedia entry titles.
+
+    The index is built once from the storage backend and afterwards kept
+    up to date incrementally by save_entry. Entries added or removed
+    behind our back are picked up by polling the backend's version
+    token, e.g. the modification time of the entries directory, which
+    changes whenever a file in it is created, deleted or renamed.
+
+    Besides the sorted titles, the index keeps them sorted by their
+    case-folded form, which makes prefix lookups a binary search.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.titles = ()
+        self.lookup = frozenset()
+        self.folded = ()
+        self.version = None
+        self.checked_at = None
+        # Counts rebuilds, so that other indexes can tell when entries
+        # may have changed behind our back.
+        self.generation = 0
+
+    def _rebuild(self, version):
+        titles = tuple(sorted(get_backend().list_titles()))
+        self.titles = titles
+        self.lookup = frozenset(titles)
+        self.folded = tuple(sorted((title.casefold(), title) for title in titles))
+        self.version = version
+        self.generation += 1
+
+    def refresh(self):
+        """
+        Rebuilds the index if the stored entries changed since they were
+        last listed. The backend is polled at most once per
+        WIKI_INDEX_POLL_INTERVAL seconds.
+        """
+        interval = getattr(settings, "WIKI_INDEX_POLL_INTERVAL", 1.0)
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < interval:
+            return
+        with self.lock:
+            self.checked_at = now
+            version = get_backend().version()
+            if version is None or version != self.version:
+                self._rebuild(version)
+
+    def add(self, title, previous_version):
+        """
+        Records a freshly saved entry without listing every entry again.
+        `previous_version` is the backend's version token as read right
+        before the entry was written.
+        """
+        with self.lock:
+            if self.version is None or previous_version != self.version:
+                # Entries changed behind our back since the last poll;
+                # taking on the new version would hide them for good.
+                self._rebuild(get_backend().version())
+                return
+            if title not in self.lookup:
+                i = bisect.bisect_left(self.titles, title)
+                self.titles = self.titles[:i] + (title,) + self.titles[i:]
+                self.lookup = self.lookup | {title}
+                key = (title.casefold(), title)
+                i = bisect.bisect_left(self.folded, key)
+                self.folded = self.folded[:i] + (key,) + self.folded[i:]
+            # The save itself changed the version; don't treat that as
+            # an external change on the next poll.
+            self.version = get_backend().version()
+
+    def invalidate(self):
+        with self.lock:
+            self.version = None
+            self.checked_at = None
+
+
+_index = EntryIndex()
 
 
 def list_entries():
     """
-    Returns a list of all names of encyclopedia entries.
+    Returns a sorted tuple of all names of encyclopedia entries.
     """
-    _, filenames = default_storage.listdir("entries")
-    return list(sorted(re.sub(r"\.md$", "", filename)
-                for filename in filenames if filename.endswith(".md")))
+    _index.refresh()
+    return _index.titles
 
 
-def save_entry(title, content):
+def entry_exists(title):
+    """
+    Returns True if an encyclopedia entry with the given title exists.
+    """
+    _index.refresh()
+    return title in _index.lookup
+
+
+def index_generation():
+    """
+    Returns a number that changes whenever the entry index is rebuilt,
+    e.g. because entries were added, removed or rewritten by another
+    process.
+    """
+    _index.refresh()
+    return _index.generation
+
+
+def random_entry(weighted=False):
+    """
+    Returns the title of a random encyclopedia entry, or None if there
+    are no entries. With weighted=True, entries are picked in proportion
+    to how often they were viewed, and uniformly if none were.
+    """
+    _index.refresh()
+    if weighted:
+        for _ in range(3):
+            title = popularity.sample()
+            if title is None:
+                break
+            if title in _index.lookup:
+                return title
+            # Deleted since it was viewed.
+            popularity.forget(title)
+    titles = _index.titles
+    return random.choice(titles) if titles else None
+
+
+def complete_entries(prefix, limit=10):
+    """
+    Returns up to `limit` entry titles starting with the given prefix,
+    ignoring case, in alphabetical order.
+    """
+    _index.refresh()
+    folded = _index.folded
+    prefix = prefix.casefold()
+    matches = []
+    i = bisect.bisect_left(folded, (prefix,))
+    while i < len(folded) and len(matches) < limit:
+        key, title = folded[i]
+        if not key.startswith(prefix):
+            break
+        matches.append(title)
+        i += 1
+    return matches
+
+
+class EntryConflict(Exception):
+    """
+    Raised by save_entry when an entry changed since the editor loaded it.
+    """
+
+
+def entry_version(title):
+    """
+    Returns an opaque version tag for the current content of an entry,
+    or None if the entry does not exist. Editors send it back to
+    save_entry to detect concurrent edits.
+    """
+    content = get_entry(title)
+    return None if content is None else rendering.content_digest(content)
+
+
+def save_entry(title, content, expected_version=None, reindex=True):
     """
     Saves an encyclopedia entry, given its title and Markdown
     content. If an existing entry with the same title already exists,
     it is replaced.
+
+    If `expected_version` is given, the entry is only saved if its
+    current version (see entry_version) still matches, with "" standing
+    for an entry that doesn't exist yet; otherwise EntryConflict is
+    raised. Saving unchanged content is a no-op.
+
+    Unless WIKI_REVISIONS is off, every save adds a revision to the
+    entry's history. Bulk writers can pass reindex=False to skip the
+    history and the in-memory indexes, and call rebuild_indexes() once
+    they are done.
+
+    The check, the write and the revision happen under the backend's
+    lock on the entry, which other processes respect too, so revisions
+    are numbered in the order the saves were written.
+    """
+    backend = get_backend()
+    data = content.encode("utf-8")
+    with backend.lock(title):
+        current = get_entry(title)
+        if expected_version is not None:
+            current_version = None if current is None else rendering.content_digest(current)
+            if expected_version != (current_version or ""):
+                raise EntryConflict(title)
+        if current == content:
+            return
+        previous_version = backend.version()
+        backend.write(title, data)
+        if reindex and getattr(settings, "WIKI_REVISIONS", True):
+            try:
+                revisions.record(title, content, current)
+            except DatabaseError:
+                # E.g. the revision table hasn't been migrated yet; the
+                # entry itself is saved regardless.
+                logger.warning("Could not record a revision of %s; has `manage.py migrate` been run?",
+                               title, exc_info=True)
+    if not reindex:
+        return
+    _index.add(title, previous_version)
+    rendering.invalidate_entry(title)
+    if not rendering.should_stream(data):
+        rendering.render_entry(title, content)
+    search.update_entry(title, content, entry_signature(title))
+
+
+def rebuild_indexes():
+    """
+    Brings every in-memory index up to date with the stored entries,
+    e.g. after a bulk import with save_entry(..., reindex=False).
+    """
+    _index.invalidate()
+    _index.refresh()
+    rendering.clear()
+    search.refresh()
+
+
+def reset_caches():
+    """
+    Drops every in-memory index and cache, so that they are rebuilt from
+    storage on next use (e.g. after pointing MEDIA_ROOT elsewhere).
+    """
+    global _backend
+    _index.invalidate()
+    with _backend_lock:
+        if _backend is not None:
+            _backend.clear()
+        _backend = None
+    rendering.clear()
+    search.reset()
+
+
+def entry_signature(title):
+    """
+    Returns a signature of an entry's stored content that changes
+    whenever the entry is rewritten, or None if it doesn't exist.
+    """
+    return get_backend().signature(title)
+
+
+def entry_signatures():
+    """
+    Returns a dict mapping every entry title to its signature.
+    """
+    return get_backend().signatures()
+
+
+def get_entry_bytes(title):
+    """
+    Returns the raw UTF-8 Markdown of an encyclopedia entry as a
+    read-only memoryview, or None if no such entry exists. With the
+    filesystem backend this is a view of the memory-mapped file, so
+    nothing is copied.
     """
-    filename = f"entries/{title}.md"
-    if default_storage.exists(filename):
-        default_storage.delete(filename)
-    default_storage.save(filename, ContentFile(content))
+    return get_backend().read(title)
 
 
 def get_entry(title):
@@ -30,8 +295,7 @@ def get_entry(title):
     Retrieves an encyclopedia entry by its title. If no such
     entry exists, the function returns None.
     """
-    try:
-        f = default_storage.open(f"entries/{title}.md")
-        return f.read().decode("utf-8")
-    except FileNotFoundError:
+    raw = get_entry_bytes(title)
+    if raw is None:
         return None
+    return str(raw, "utf-8")
@@ -1,8 +1,9 @@
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.shortcuts import redirect
-import random
-import markdown2
-from . import util
+from . import popularity, rendering, revisions, search as wiki_search, util
 
 
 def index(request):
@@ -11,36 +12,111 @@ def index(request):
     })
 
 def entry(request, title):
-    content = util.get_entry(title)
+    content = util.get_entry_bytes(title)
     if content is None:
-        entries = util.list_entries()
-        entries = [entry for entry in entries if title in entry]
+        entries = wiki_search.search(title, limit=10)
         return render(request, "encyclopedia/error.html", {
             "error_message": f"{title} not found",
             "entries": entries
         })
     
+    popularity.record_view(title)
+    if rendering.should_stream(content) and rendering.cached_entry(title, content) is None:
+        return StreamingHttpResponse(stream_entry(request, title, content))
+
     return render(request, "encyclopedia/entry.html", {
         "entry_title": title,
-        "entry_content": markdown2.markdown(content)
+        "entry_content": rendering.render_entry(title, content)
+    })
+
+def stream_entry(request, title, content):
+    """
+    Yields the entry page in pieces: the page up to the entry body, the
+    body rendered block by block, then the rest of the page.
+    """
+    marker = "<!-- entry content -->"
+    page = render_to_string("encyclopedia/entry.html", {
+        "entry_title": title,
+        "entry_content": marker
+    }, request)
+    header, footer = page.split(marker, 1)
+    yield header
+    yield from rendering.render_blocks(content)
+    yield footer
+
+def raw_entry(request, title):
+    content = util.get_entry_bytes(title)
+    if content is None:
+        return HttpResponse(f"{title} not found", status=404, content_type="text/plain")
+    response = HttpResponse(content, content_type="text/markdown; charset=utf-8")
+    response["ETag"] = f'"{rendering.content_digest(content)}"'
+    return response
+
+def history(request, title):
+    return render(request, "encyclopedia/history.html", {
+        "entry_title": title,
+        "revisions": revisions.list_revisions(title)
+    })
+
+def revision(request, title, number):
+    content = revisions.get_revision(title, number)
+    if content is None:
+        return render(request, "encyclopedia/error.html", {
+            "error_message": f"{title} has no revision {number}"
+        }, status=404)
+    return render(request, "encyclopedia/entry.html", {
+        "entry_title": title,
+        "entry_content": rendering.render_entry(f"{title}@{number}", content),
+        "revision": number
+    })
+
+def diff(request, title, a, b):
+    lines = revisions.diff(title, a, b)
+    if lines is None:
+        return render(request, "encyclopedia/error.html", {
+            "error_message": f"{title} has no revisions {a} and {b}"
+        }, status=404)
+    return render(request, "encyclopedia/diff.html", {
+        "entry_title": title,
+        "a": a,
+        "b": b,
+        "lines": lines
     })
 
 def search(request):
-    query = request.GET.get("q")
-    return redirect("entry", title=query)
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return redirect("index")
+    if util.entry_exists(query):
+        return redirect("entry", title=query)
+    return render(request, "encyclopedia/search.html", {
+        "query": query,
+        "entries": wiki_search.search(query)
+    })
+
+def autocomplete(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = min(int(request.GET.get("limit", 10)), 50)
+    except ValueError:
+        limit = 10
+    return JsonResponse({
+        "results": util.complete_entries(query, limit) if query else []
+    })
 
 def new_page(request):
     if request.method == "POST":
         title = request.POST.get("title")
         content = request.POST.get("content")
         if title and content:
-            if title in util.list_entries():
+            try:
+                # Only creates the entry if nobody else did meanwhile.
+                util.save_entry(title, content, expected_version="")
+            except util.EntryConflict:
                 return render(request, "encyclopedia/error.html", {
                     "error_message": f"{title} already exists"
                 })
-            else:
-                util.save_entry(title, content)
-                return redirect("entry", title=title)
+            return redirect("entry", title=title)
         else:
             return render(request, "encyclopedia/error.html", {
                 "error_message": "Title and content are required"
@@ -56,19 +132,33 @@ def editor(request, title=None):
     if request.method == "POST":
         title = request.POST.get("title")
         content = request.POST.get("content")
+        # The version only guards the entry the editor was opened on.
+        version = request.POST.get("version") if request.POST.get("editing") == title else None
         if title and content:
-            util.save_entry(title, content)
+            try:
+                util.save_entry(title, content, version)
+            except util.EntryConflict:
+                return render(request, "encyclopedia/error.html", {
+                    "error_message": f"{title} was changed by someone else while you were editing it. "
+                                     "Reload the editor to see the latest version.",
+                    "entries": [title]
+                }, status=409)
             return redirect("entry", title=title)
         else:
             return render(request, "encyclopedia/error.html", {
                 "error_message": "Title and content are required"
             })
     else:
+        content = util.get_entry(title)
         return render(request, "encyclopedia/editor.html", {
             "title": title,
-            "content": util.get_entry(title)
+            "content": content,
+            "version": rendering.content_digest(content) if content is not None else ""
         })
 
 def random_page(request):
-    entries = util.list_entries()
-    return redirect("entry", title=random.choice(entries))
\ No newline at end of file
+    weighted = request.GET.get("weighted", "1" if getattr(settings, "WIKI_RANDOM_WEIGHTED", False) else "0") == "1"
+    title = util.random_entry(weighted)
+    if title is None:
+        return redirect("index")
+    return redirect("entry", title=title)
\ No newline at end of file
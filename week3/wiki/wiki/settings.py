@@ -119,3 +119,52 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Encyclopedia
+
+# How often (in seconds) the entry index checks the entries directory
+# for files that were added or removed outside of the app.
+WIKI_INDEX_POLL_INTERVAL = 1.0
+
+# Upper bound (in bytes) for rendered entry HTML kept in memory.
+WIKI_RENDER_CACHE_BYTES = 32 * 1024 * 1024
+
+# Optionally share rendered entries between processes through one of the
+# CACHES aliases (e.g. "default"). None keeps the cache in-process only.
+WIKI_RENDER_CACHE_ALIAS = None
+
+# Where the full-text search index is persisted between restarts, and
+# how often (in seconds) it is rewritten after entries change.
+WIKI_SEARCH_INDEX = os.path.join(BASE_DIR, "search_index.json")
+WIKI_SEARCH_PERSIST_INTERVAL = 30.0
+
+# How hard save_entry works to make writes durable: "never", "file"
+# (fsync the new entry before renaming it into place) or "always" (also
+# fsync the entries directory).
+WIKI_FSYNC = "file"
+
+# Maximum number of entry files kept memory-mapped for reading.
+WIKI_MMAP_CACHE_SIZE = 128
+
+# Entries larger than this many bytes are streamed to the client,
+# rendered roughly WIKI_STREAM_CHUNK_BYTES of Markdown at a time.
+WIKI_STREAM_THRESHOLD = 1024 * 1024
+WIKI_STREAM_CHUNK_BYTES = 64 * 1024
+
+# Where entries are stored: "filesystem" (one Markdown file per entry in
+# MEDIA_ROOT/entries), "database" (the Entry model) or the dotted path of
+# a backend class. Use `manage.py migrate_entries` to move between them.
+WIKI_STORAGE_BACKEND = "filesystem"
+
+# Keep the history of every entry. Revisions are stored as compressed
+# deltas; a full snapshot is written once the deltas since the last one
+# outweigh it WIKI_REVISION_CHAIN_FACTOR times, or after
+# WIKI_REVISION_MAX_CHAIN deltas.
+WIKI_REVISIONS = True
+WIKI_REVISION_CHAIN_FACTOR = 4
+WIKI_REVISION_MAX_CHAIN = 500
+
+# Make "Random Page" favour entries in proportion to their page views
+# (counted per process). Can be overridden per request with ?weighted=0/1.
+WIKI_RANDOM_WEIGHTED = False
@@ -11,7 +11,7 @@ class CommentsInline(admin.TabularInline):
 
 class ListingsAdmin(admin.ModelAdmin):
     inlines = [BidsInline, CommentsInline]
-    list_display = ('title', 'category', 'active', 'owner')
+    list_display = ('title', 'category', 'active', 'owner', 'current_price', 'bid_count', 'ends_at')
     list_filter = ('category', 'active', 'owner')
 
 admin.site.register(Listings, ListingsAdmin)
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from . import fragments, search, thumbnails, watchlist
+        Listings = self.get_model("Listings")
+        post_save.connect(search.listing_saved, sender=Listings)
+        post_save.connect(thumbnails.listing_saved, sender=Listings)
+        post_save.connect(fragments.listing_saved, sender=Listings)
+        for model, handler in [("Bids", fragments.bid_changed), ("Comments", fragments.comment_changed),
+                               ("Category", fragments.category_changed)]:
+            post_save.connect(handler, sender=self.get_model(model))
+            post_delete.connect(handler, sender=self.get_model(model))
+        m2m_changed.connect(watchlist.watchlist_changed, sender=Listings.watchlist.through)
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import queue
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """
+    Events published to one channel, for a consumer that blocks on
+    get() in its own thread (a streaming response under WSGI).
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.queue = queue.SimpleQueue()
+
+    def put(self, event):
+        self.queue.put(event)
+
+    def get(self, timeout=None):
+        """
+        Returns the next event, or None if none arrived within `timeout`
+        seconds.
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """
+    Events published to one channel, for a consumer awaiting aget() on
+    an event loop (a streaming response under ASGI). Events may be
+    published from any thread, including before the consumer starts.
+    """
+
+    def __init__(self, channel):
+        super().__init__(channel)
+        self.loop = None
+        self.wakeup = None
+
+    def put(self, event):
+        self.queue.put(event)
+        wakeup = self.wakeup
+        if wakeup is not None:
+            self.loop.call_soon_threadsafe(wakeup.set)
+
+    async def aget(self, timeout=None):
+        self.loop = asyncio.get_running_loop()
+        # Arm the wakeup before looking at the queue, so an event put in
+        # between is not missed.
+        self.wakeup = asyncio.Event()
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self.queue.get_nowait()
+
+
+class InProcessHub:
+    """
+    Fans events out to the subscribers of a channel in this process.
+
+    Only clients connected to the same server process see the events;
+    deployments running several processes should point
+    AUCTIONS_EVENT_HUB at a hub backed by a broker, with the same
+    publish/subscribe/unsubscribe methods.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def subscribe(self, channel, asynchronous=False):
+        subscription = (AsyncSubscription if asynchronous else Subscription)(channel)
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.channels[subscription.channel]
+
+    def publish(self, channel, event):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscriber_count(self, channel):
+        with self.lock:
+            return len(self.channels.get(channel, ()))
+
+
+@lru_cache(maxsize=None)
+def get_hub():
+    """
+    Returns the hub named by AUCTIONS_EVENT_HUB (a dotted class path).
+    """
+    return import_string(getattr(settings, "AUCTIONS_EVENT_HUB", "auctions.events.InProcessHub"))()
+
+
+def listing_channel(listing_id):
+    return f"listing:{listing_id}"
+
+
+def format_event(name, data, event_id=None):
+    """
+    Encodes one Server-Sent Event.
+    """
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {name}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
+
+
+def bid_event(bid, listing):
+    return format_event("bid", {
+        "amount": str(bid.amount),
+        "bidder": bid.user.username,
+        "bid_count": listing.bid_count,
+    }, bid.id)
+
+
+def close_event(winner):
+    """
+    Encodes the closing of an auction won by `winner` (a User, a
+    username, or None if there were no bids).
+    """
+    winner = getattr(winner, "username", winner)
+    return format_event("close", {"winner": winner})
+
+
+def publish(listing_id, event):
+    """
+    Sends an encoded event to a listing's subscribers once the current
+    transaction commits, so nobody hears about a bid that was rolled
+    back.
+    """
+    transaction.on_commit(lambda: get_hub().publish(listing_channel(listing_id), event))
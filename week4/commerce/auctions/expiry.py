@@ -0,0 +1,81 @@
+import heapq
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import events, fragments
+from .models import Listings
+
+
+def close_expired(listing_ids, now=None):
+    """
+    Closes those of `listing_ids` that are still open and whose end time
+    has passed, recording their highest bidders as winners, in a couple
+    of queries however many there are. Returns the number closed.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = (Listings.objects.select_for_update()
+               .filter(pk__in=listing_ids, active=True, ends_at__lte=now))
+        closed = list(due.values_list("pk", flat=True))
+        if not closed:
+            return 0
+        Listings.objects.filter(pk__in=closed).update(
+            active=False, closed_at=now, winner=F("highest_bidder"))
+        fragments.bump("listing", closed)
+        winners = Listings.objects.filter(pk__in=closed).values_list("pk", "winner__username")
+        for pk, winner in winners:
+            events.publish(pk, events.close_event(winner))
+    return len(closed)
+
+
+class ExpiryScheduler:
+    """
+    Closes auctions as their end times pass.
+
+    Upcoming expirations are kept in a heap of (ends_at, id), filled by
+    load() with the open auctions ending within `horizon` of now (a
+    range scan of the listings_open_ends_at index, never the whole
+    table). Entries can go stale when an auction is closed by hand or
+    its end time changes; close_expired() re-checks every row, so those
+    are simply dropped.
+    """
+
+    def __init__(self, horizon, batch_size=500):
+        self.horizon = horizon
+        self.batch_size = batch_size
+        self.heap = []
+        self.scheduled = set()
+
+    def load(self, now=None):
+        """
+        Adds the open auctions ending before now + horizon (including
+        any already overdue) that are not scheduled yet.
+        """
+        now = now or timezone.now()
+        upcoming = (Listings.objects.filter(active=True, ends_at__lte=now + self.horizon)
+                    .values_list("ends_at", "pk"))
+        for entry in upcoming:
+            if entry not in self.scheduled:
+                self.scheduled.add(entry)
+                heapq.heappush(self.heap, entry)
+
+    def next_expiry(self):
+        return self.heap[0][0] if self.heap else None
+
+    def run_due(self, now=None):
+        """
+        Closes every scheduled auction whose end time has passed, in
+        batches of `batch_size`. Returns the number closed.
+        """
+        now = now or timezone.now()
+        closed = 0
+        while self.heap and self.heap[0][0] <= now:
+            batch = []
+            while self.heap and self.heap[0][0] <= now and len(batch) < self.batch_size:
+                entry = heapq.heappop(self.heap)
+                self.scheduled.discard(entry)
+                batch.append(entry[1])
+            closed += close_expired(batch, now)
+        return closed
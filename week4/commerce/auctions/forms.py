@@ -1,4 +1,5 @@
 from django import forms
+from django.utils import timezone
 from .models import Listings, Category
 
 class ListingForm(forms.ModelForm):
@@ -6,7 +7,15 @@ class ListingForm(forms.ModelForm):
 
     class Meta:
         model = Listings
-        fields = ['title', 'description', 'starting_bid', 'image_url', 'category']
+        fields = ['title', 'description', 'starting_bid', 'image_url', 'category', 'ends_at']
+        labels = {'ends_at': "Ends at (optional)"}
+        widgets = {'ends_at': forms.DateTimeInput(attrs={'type': 'datetime-local'})}
+
+    def clean_ends_at(self):
+        ends_at = self.cleaned_data.get('ends_at')
+        if ends_at and ends_at <= timezone.now():
+            raise forms.ValidationError("The end time must be in the future.")
+        return ends_at
 
     def clean(self):
         cleaned_data = super().clean()
@@ -29,4 +38,38 @@ class ListingForm(forms.ModelForm):
         return instance
 
 class CommentForm(forms.Form):
-    comment = forms.CharField(widget=forms.Textarea(attrs={"rows": 4, "cols": 40}))
\ No newline at end of file
+    comment = forms.CharField(widget=forms.Textarea(attrs={"rows": 4, "cols": 40}))
+
+class ListingFilterForm(forms.Form):
+    STATUS_CHOICES = [("active", "Active"), ("closed", "Closed"), ("all", "All")]
+
+    status = forms.ChoiceField(choices=STATUS_CHOICES, required=False)
+    category = forms.ModelChoiceField(queryset=Category.objects.order_by("name"), to_field_name="name",
+                                      required=False, empty_label="Any category")
+    min_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+    def filter(self, listings, exclude=None):
+        """
+        Narrows `listings` down to the filters that are valid (invalid
+        ones are ignored), except the one named `exclude`. Only active
+        listings are shown unless another status is asked for.
+        """
+        self.is_valid()
+        data = self.cleaned_data
+        status = data.get("status") or "active"
+        if status != "all" and exclude != "status":
+            listings = listings.filter(active=status == "active")
+        if data.get("category") and exclude != "category":
+            listings = listings.filter(category=data["category"])
+        if data.get("min_price") is not None:
+            listings = listings.filter(current_price__gte=data["min_price"])
+        if data.get("max_price") is not None:
+            listings = listings.filter(current_price__lte=data["max_price"])
+        return listings
+
+
+class SearchForm(ListingFilterForm):
+    q = forms.CharField(label="Search", required=False)
+
+    field_order = ["q"]
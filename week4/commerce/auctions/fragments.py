@@ -0,0 +1,96 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def get_cache():
+    return caches[getattr(settings, "AUCTIONS_FRAGMENT_CACHE", "default")]
+
+
+def _key(scope, pk):
+    return f"auctions:fragments:{scope}:{pk}"
+
+
+def _fresh():
+    # A counter that was evicted starts again from a value it has never
+    # had (the clock only moves on), so fragments cached under its old
+    # values can't be served again.
+    return time.time_ns()
+
+
+def versions(scope, ids):
+    """
+    Returns the current version of each of `ids` in `scope` ("listing",
+    "comments" or "category"), in one cache round trip.
+    """
+    cache = get_cache()
+    keys = {_key(scope, pk): pk for pk in set(ids) if pk is not None}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        cache.add(key, _fresh(), None)
+        found[key] = cache.get(key)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def _bump(scope, ids):
+    cache = get_cache()
+    for pk in ids:
+        try:
+            cache.incr(_key(scope, pk))
+        except ValueError:
+            cache.add(_key(scope, pk), _fresh(), None)
+
+
+def bump(scope, ids):
+    """
+    Retires the fragments cached for `ids` in `scope`, right away and
+    again once the current transaction commits: a page rendered in
+    between from the data as it was before may have cached fragments
+    under the new version.
+    """
+    ids = [pk for pk in set(ids) if pk is not None]
+    _bump(scope, ids)
+    transaction.on_commit(lambda: _bump(scope, ids))
+
+
+def prepare(listings):
+    """
+    Gives each of `listings` the fragment_version its cached fragments
+    are kept under, looking them all up at once.
+    """
+    listing_versions = versions("listing", [listing.pk for listing in listings])
+    category_versions = versions("category", [listing.category_id for listing in listings])
+    for listing in listings:
+        listing._fragment_version = (f"{listing_versions[listing.pk]}."
+                                     f"{category_versions.get(listing.category_id, 0)}")
+    return listings
+
+
+def context(request):
+    """
+    A template context processor for the {% cache %} tags of listing
+    pages.
+    """
+    return {
+        "fragment_cache": getattr(settings, "AUCTIONS_FRAGMENT_CACHE", "default"),
+        "fragment_timeout": getattr(settings, "AUCTIONS_FRAGMENT_CACHE_TIMEOUT", 600),
+    }
+
+
+def listing_saved(sender, instance, created=False, **kwargs):
+    if not created:
+        bump("listing", [instance.pk])
+
+
+def bid_changed(sender, instance, **kwargs):
+    bump("listing", [instance.listing_id])
+
+
+def comment_changed(sender, instance, **kwargs):
+    bump("comments", [instance.listing_id])
+
+
+def category_changed(sender, instance, **kwargs):
+    bump("category", [instance.pk])
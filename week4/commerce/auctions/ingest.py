@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+
+from django import forms
+from django.conf import settings
+from django.db import transaction
+
+from . import search, thumbnails
+from .forms import ListingForm
+from .models import Category, Listings
+
+FORMATS = ("csv", "jsonl")
+
+UNKNOWN_CATEGORY = "Select a valid category, or give a new_category to create it."
+NOT_UTF8 = "Expected UTF-8 text."
+
+
+class ListingImportForm(ListingForm):
+    """
+    ListingForm's rules for one imported row, except that the category
+    is given by name, so that validating a row needs no queries.
+    Categories are looked up for many rows at once by import_listings():
+    `category` must name an existing one, `new_category` is created if
+    need be.
+    """
+    category = forms.CharField(max_length=64, required=False)
+    new_category = forms.CharField(max_length=64, required=False)
+
+    class Meta(ListingForm.Meta):
+        fields = ['title', 'description', 'starting_bid', 'image_url', 'ends_at']
+
+    def category_name(self):
+        return self.cleaned_data.get('new_category') or self.cleaned_data.get('category')
+
+
+def _undecodable(text):
+    # Whether text decoded with errors="surrogateescape" had bytes that
+    # aren't UTF-8 in it.
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def _json_rows(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        if _undecodable(line):
+            yield NOT_UTF8
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield f"Invalid JSON: {e}"
+            continue
+        yield row if isinstance(row, dict) else "Expected a JSON object."
+
+
+def _csv_rows(lines):
+    reader = csv.DictReader(lines)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # The reader carries on from the next line.
+            yield f"Invalid CSV: {e}"
+            continue
+        values = [key for key in row if isinstance(key, str)]
+        values += [value for value in row.values() if isinstance(value, str)]
+        yield NOT_UTF8 if any(_undecodable(value) for value in values) else row
+
+
+def read_rows(lines, format):
+    """
+    Yields a dict per listing in `lines` (text, CSV with a header row
+    or one JSON object per line), or an error message in place of a
+    row that can't be read, so that the rows around it are imported
+    regardless.
+
+    To report bytes that aren't UTF-8 row by row, `lines` should be
+    decoded with errors="surrogateescape" (see open_lines()); otherwise
+    the first such line ends the rows, with an error in its place.
+    """
+    rows = _csv_rows(lines) if format == "csv" else _json_rows(lines)
+    try:
+        yield from rows
+    except UnicodeDecodeError:
+        yield NOT_UTF8
+
+
+def open_lines(binary):
+    """
+    Wraps a binary file for read_rows().
+    """
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", errors="surrogateescape", newline="")
+
+
+def _category_ids(pending, known):
+    # Looks up the categories `pending` forms name that aren't in `known`
+    # yet, creating those given as new_category that don't exist, in a
+    # few queries however many.
+    names = {form.category_name() for form in pending}
+    missing = names - known.keys()
+    if missing:
+        known.update(Category.objects.filter(name__in=missing).values_list("name", "id"))
+        new = {form.cleaned_data["new_category"] for form in pending} & (missing - known.keys())
+        if new:
+            Category.objects.bulk_create([Category(name=name) for name in new], ignore_conflicts=True)
+            known.update(Category.objects.filter(name__in=new).values_list("name", "id"))
+    return known
+
+
+def _insert(pending, owner, categories):
+    # Returns the ids of the listings created from `pending` (row
+    # number, form) pairs and the errors of rows naming an unknown
+    # category.
+    _category_ids([form for _, form in pending], categories)
+    listings, errors = [], []
+    for number, form in pending:
+        category_id = categories.get(form.category_name())
+        if category_id is None:
+            errors.append({"row": number, "errors": {"category": [UNKNOWN_CATEGORY]}})
+            continue
+        listing = form.instance
+        listing.owner = owner
+        listing.category_id = category_id
+        # bulk_create() doesn't call save(), which would set this.
+        listing.current_price = listing.starting_bid
+        listings.append(listing)
+    with transaction.atomic():
+        created = Listings.objects.bulk_create(listings)
+        # Nor does it send post_save, which keeps the term index current
+        # where FTS5 isn't used and has thumbnails made.
+        search.index_listings(created)
+        thumbnails.schedule([listing.pk for listing in created if listing.image_url])
+    return [listing.pk for listing in created], errors
+
+
+def import_listings(rows, owner, batch_size=None):
+    """
+    Creates a listing owned by `owner` for each valid row of `rows`
+    (dicts of ListingImportForm fields, as read by read_rows()),
+    `batch_size` at a time (AUCTIONS_IMPORT_BATCH_SIZE by default).
+
+    Invalid rows, including those whose category doesn't exist, are
+    reported and skipped; the others are imported regardless. Returns {"created": [ids], "errors": [{"row": n,
+    "errors": {field: [messages]}}]}, rows being numbered from 1.
+    """
+    batch_size = batch_size or getattr(settings, "AUCTIONS_IMPORT_BATCH_SIZE", 500)
+    created, errors, pending = [], [], []
+    categories = {}
+    for number, row in enumerate(rows, 1):
+        if isinstance(row, str):
+            errors.append({"row": number, "errors": {"__all__": [row]}})
+            continue
+        form = ListingImportForm(row)
+        if not form.is_valid():
+            errors.append({"row": number, "errors": {field: list(messages)
+                                                     for field, messages in form.errors.items()}})
+            continue
+        pending.append((number, form))
+        if len(pending) >= batch_size:
+            ids, unknown = _insert(pending, owner, categories)
+            created += ids
+            errors += unknown
+            pending = []
+    if pending:
+        ids, unknown = _insert(pending, owner, categories)
+        created += ids
+        errors += unknown
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "errors": errors}
@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F
+
+from auctions import thumbnails
+from auctions.models import Listings
+
+
+class Command(BaseCommand):
+    help = ("Makes thumbnails of the listing images that have none yet, or whose image_url "
+            "changed since, e.g. for listings created before thumbnails existed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Images fetched and resized at once.")
+        parser.add_argument("--all", action="store_true",
+                            help="Remake thumbnails of every listing image.")
+
+    def handle(self, *args, **options):
+        listings = Listings.objects.exclude(image_url="")
+        if not options["all"]:
+            listings = listings.exclude(thumbnail_source=F("image_url"))
+        ids = list(listings.values_list("pk", flat=True))
+        start = time.perf_counter()
+
+        def work(listing_id):
+            try:
+                return thumbnails.generate(listing_id)
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max(options["workers"], 1)) as pool:
+            made = sum(digest is not None for digest in pool.map(work, ids))
+        self.stdout.write(self.style.SUCCESS(
+            f"Made thumbnails for {made} of {len(ids)} listings in {time.perf_counter() - start:.1f}s."))
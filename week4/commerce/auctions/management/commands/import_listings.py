@@ -0,0 +1,43 @@
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions import ingest
+
+
+class Command(BaseCommand):
+    help = ("Creates listings in bulk from a CSV file with a header row (title, description, "
+            "starting_bid, image_url, category or new_category, ends_at) or a file of JSON objects, "
+            "one per line. Only new_category creates categories. Invalid rows are reported and skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file to import, or - for standard input.")
+        parser.add_argument("--owner", required=True, help="Username of the seller.")
+        parser.add_argument("--format", choices=ingest.FORMATS,
+                            help="csv or jsonl; by default, csv if the file name ends in .csv.")
+        parser.add_argument("--batch-size", type=int,
+                            help="Listings inserted per query (AUCTIONS_IMPORT_BATCH_SIZE by default).")
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(username=options["owner"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['owner']!r}.")
+        path = options["path"]
+        format = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        start = time.perf_counter()
+        if path == "-":
+            binary = open(sys.stdin.fileno(), "rb", closefd=False)
+        else:
+            binary = open(path, "rb")
+        with ingest.open_lines(binary) as lines:
+            result = ingest.import_listings(ingest.read_rows(lines, format), owner, options["batch_size"])
+        for error in result["errors"]:
+            messages = "; ".join(f"{field}: {' '.join(errors)}" if field != "__all__" else " ".join(errors)
+                                 for field, errors in error["errors"].items())
+            self.stderr.write(f"Row {error['row']}: {messages}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(result['created'])} listings in {time.perf_counter() - start:.1f}s; "
+            f"skipped {len(result['errors'])} invalid rows."))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions import rollups
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the per-minute and per-hour bid rollups behind the bid statistics API "
+            "from the bids table, e.g. for bids placed before the rollups existed.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt the bid rollups in {time.perf_counter() - start:.1f}s."))
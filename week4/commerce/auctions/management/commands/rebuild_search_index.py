@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions import search
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the listing search index: the FTS5 table where SQLite has it, "
+            "the ListingTerm table otherwise.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        search.rebuild()
+        kind = "FTS5" if search.uses_fts() else "term"
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt the {kind} search index in {time.perf_counter() - start:.1f}s."))
@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.expiry import ExpiryScheduler
+
+
+class Command(BaseCommand):
+    help = ("Closes auctions when their end time passes, recording the highest bidder "
+            "as the winner. Runs until interrupted unless --once is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Close the auctions that are already due and exit (e.g. from cron).")
+        parser.add_argument("--poll", type=float, default=5,
+                            help="Seconds between looks for newly created or changed auctions.")
+        parser.add_argument("--horizon", type=float, default=300,
+                            help="Seconds ahead to schedule expirations for on each look.")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Auctions closed per transaction.")
+
+    def handle(self, *args, **options):
+        scheduler = ExpiryScheduler(timedelta(seconds=max(options["horizon"], options["poll"])),
+                                    options["batch_size"])
+        poll = timedelta(seconds=options["poll"])
+        next_load = timezone.now()
+        try:
+            while True:
+                now = timezone.now()
+                if now >= next_load:
+                    scheduler.load(now)
+                    next_load = now + poll
+                closed = scheduler.run_due(now)
+                if closed:
+                    self.stdout.write(f"{now.isoformat()} closed {closed} auction{'s' if closed != 1 else ''}")
+                if options["once"]:
+                    break
+                # Sleep until the next auction ends or it's time to look
+                # for new ones, whichever comes first.
+                wake = min(filter(None, [scheduler.next_expiry(), next_load]))
+                time.sleep(max((wake - timezone.now()).total_seconds(), 0))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_prices(apps, schema_editor):
+    Listings = apps.get_model('auctions', 'Listings')
+    Bids = apps.get_model('auctions', 'Bids')
+    for listing in Listings.objects.all():
+        bids = Bids.objects.filter(listing=listing).order_by('-amount', '-id')
+        highest = bids.first()
+        listing.bid_count = bids.count()
+        listing.current_price = highest.amount if highest else listing.starting_bid
+        listing.highest_bidder_id = highest.user_id if highest else None
+        listing.save(update_fields=['bid_count', 'current_price', 'highest_bidder'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_category_remove_listings_category_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listings',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listings',
+            name='current_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='listings',
+            name='highest_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_bids', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='listings',
+            name='current_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0008_listings_current_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listings',
+            index=models.Index(fields=['-created_at', '-id'], name='listings_created'),
+        ),
+        migrations.AddIndex(
+            model_name='listings',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='listings_category_created'),
+        ),
+    ]
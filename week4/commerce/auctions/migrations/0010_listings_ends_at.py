@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_winners(apps, schema_editor):
+    # Auctions closed before winners were recorded went to their highest bidder.
+    Listings = apps.get_model('auctions', 'Listings')
+    Listings.objects.filter(active=False).update(
+        winner=models.F('highest_bidder'), closed_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_listings_browse_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listings',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listings',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listings',
+            name='winner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='won_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='listings',
+            index=models.Index(condition=models.Q(('active', True)), fields=['ends_at'], name='listings_open_ends_at'),
+        ),
+        migrations.RunPython(record_winners, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:26
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models, transaction
+
+# The FTS5 table indexes title and description without storing them
+# again (content=auctions_listings); the triggers keep it in step. The
+# prefix indexes keep searches for short prefixes ("w*", "wo*") from
+# having to merge the entries of every word they expand to.
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE auctions_listings_fts USING fts5("
+    "title, description, content='auctions_listings', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER auctions_listings_fts_insert AFTER INSERT ON auctions_listings BEGIN "
+    "INSERT INTO auctions_listings_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER auctions_listings_fts_delete AFTER DELETE ON auctions_listings BEGIN "
+    "INSERT INTO auctions_listings_fts(auctions_listings_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER auctions_listings_fts_update AFTER UPDATE OF title, description ON auctions_listings BEGIN "
+    "INSERT INTO auctions_listings_fts(auctions_listings_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO auctions_listings_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO auctions_listings_fts(auctions_listings_fts) VALUES ('rebuild')",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for statement in FTS_SCHEMA:
+                schema_editor.execute(statement)
+    except OperationalError:
+        # SQLite built without FTS5: search falls back to ListingTerm,
+        # filled in by the rebuild_search_index command.
+        pass
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        # The triggers would otherwise outlive the table and make every
+        # write to auctions_listings fail.
+        for action in ('insert', 'delete', 'update'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS auctions_listings_fts_{action}")
+        schema_editor.execute("DROP TABLE IF EXISTS auctions_listings_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_listings_ends_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.listings')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'listing'), name='listing_term_unique')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_listing_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryBidRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'minute'), ('hour', 'hour')], max_length=6)),
+                ('start', models.DateTimeField()),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('max_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bid_rollups', to='auctions.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'resolution', 'start'), name='category_bid_rollup_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListingBidRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'minute'), ('hour', 'hour')], max_length=6)),
+                ('start', models.DateTimeField()),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('max_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bid_rollups', to='auctions.listings')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'resolution', 'start'), name='listing_bid_rollup_unique')],
+            },
+        ),
+    ]
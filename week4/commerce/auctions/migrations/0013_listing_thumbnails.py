@@ -0,0 +1,56 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+# Adding columns makes Django rebuild auctions_listings on SQLite, which
+# drops the triggers that keep the FTS5 table of migration 0011 up to
+# date (the index itself is unaffected: ids are kept). They are created
+# again as they were, after adding the columns and, when migrating
+# backwards, after removing them (which may rebuild the table too).
+FTS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS auctions_listings_fts_insert AFTER INSERT ON auctions_listings BEGIN "
+    "INSERT INTO auctions_listings_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS auctions_listings_fts_delete AFTER DELETE ON auctions_listings BEGIN "
+    "INSERT INTO auctions_listings_fts(auctions_listings_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS auctions_listings_fts_update AFTER UPDATE OF title, description "
+    "ON auctions_listings BEGIN "
+    "INSERT INTO auctions_listings_fts(auctions_listings_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO auctions_listings_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if 'auctions_listings_fts' not in connection.introspection.table_names(cursor):
+            return
+    for statement in FTS_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_bid_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='listings',
+            name='thumbnail_digest',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='listings',
+            name='thumbnail_source',
+            field=models.URLField(blank=True),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
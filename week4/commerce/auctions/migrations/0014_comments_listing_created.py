@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0013_listing_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['listing', '-created_at', '-id'], name='comments_listing_created'),
+        ),
+    ]
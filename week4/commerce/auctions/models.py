@@ -1,5 +1,13 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.urls import reverse
+from django.utils import timezone
+
+from . import events, fragments
 
 
 class User(AbstractUser):
@@ -13,6 +21,16 @@ class Category(models.Model):
         return self.name
 
 
+class ListingsQuerySet(models.QuerySet):
+    def for_display(self):
+        """
+        Fetches everything listing pages show about each listing in this
+        one query: owner, category and winner. Whether the user watches
+        it comes from watchlist.watched_ids().
+        """
+        return self.select_related("owner", "category", "winner")
+
+
 class Listings(models.Model):
     id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=64)
@@ -25,10 +43,121 @@ class Listings(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="listings")
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="listings")
     watchlist = models.ManyToManyField(User, blank=True, related_name="watchlist")
+    # Denormalized from Bids by place_bid(), so pages never aggregate bids.
+    current_price = models.DecimalField(max_digits=10, decimal_places=2)
+    bid_count = models.PositiveIntegerField(default=0)
+    highest_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="leading_bids")
+    # Auctions with an end time are closed by the run_auction_scheduler
+    # command; the others stay open until their owner closes them.
+    ends_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="won_listings")
+    # The image_url thumbnails were last made of, and the SHA-256 of the
+    # image; see thumbnails.py.
+    thumbnail_source = models.URLField(blank=True)
+    thumbnail_digest = models.CharField(max_length=64, blank=True)
+
+    # Longest edge in pixels of each size of thumbnail.
+    THUMBNAIL_SIZES = {"small": 160, "medium": 480}
+
+    objects = ListingsQuerySet.as_manager()
+
+    class Meta:
+        # Browsing pages through listings newest first by (created_at, id),
+        # optionally within a category; see pagination.KeysetPage. Most
+        # listings are active, so the status filter just skips the rest.
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="listings_created"),
+            models.Index(fields=["category", "-created_at", "-id"], name="listings_category_created"),
+            # Upcoming expirations, for the scheduler.
+            models.Index(fields=["ends_at"], condition=Q(active=True), name="listings_open_ends_at"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.id}) by {self.owner}"
+
+    @property
+    def thumbnails(self):
+        """
+        The URL of each size of thumbnail of the image, if they have been
+        made of the current image_url (none otherwise).
+        """
+        if not self.thumbnail_digest or self.thumbnail_source != self.image_url:
+            return {}
+        return {size: reverse("thumbnail", args=[self.thumbnail_digest, size]) for size in self.THUMBNAIL_SIZES}
+
+    @property
+    def fragment_version(self):
+        """
+        What the cached fragments of this listing's pages are keyed on;
+        it changes whenever the listing, its bids or its category do.
+        See fragments.prepare(), which looks it up for many at once.
+        """
+        if not hasattr(self, "_fragment_version"):
+            fragments.prepare([self])
+        return self._fragment_version
+
+    def save(self, *args, **kwargs):
+        if self.current_price is None:
+            self.current_price = self.starting_bid
+        super().save(*args, **kwargs)
+
+    def place_bid(self, user, amount):
+        """
+        Records a bid if the auction is still open (and has not passed
+        its end time, even if the scheduler has yet to close it) and
+        `amount` is higher than the current price (the starting bid if
+        nobody has bid yet).
+
+        The check and the update of the listing are one conditional
+        UPDATE, so of two concurrent bidders only one can win. Returns
+        the new bid, or None if it was rejected.
+        """
+        with transaction.atomic():
+            updated = Listings.objects.filter(
+                Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()),
+                pk=self.pk, active=True, current_price__lt=amount
+            ).update(
+                current_price=amount,
+                bid_count=F("bid_count") + 1,
+                highest_bidder=user,
+            )
+            if not updated:
+                return None
+            bid = Bids.objects.create(amount=amount, user=user, listing=self)
+            ListingBidRollup.record(bid.amount, bid.created_at, listing_id=self.pk)
+            if self.category_id is not None:
+                CategoryBidRollup.record(bid.amount, bid.created_at, category_id=self.category_id)
+        self.refresh_from_db(fields=["current_price", "bid_count", "highest_bidder"])
+        events.publish(self.pk, events.bid_event(bid, self))
+        return bid
+
+    def close(self):
+        """
+        Ends the auction; the highest bidder, if any, wins. Returns
+        False if it was already closed.
+        """
+        closed = Listings.objects.filter(pk=self.pk, active=True).update(
+            active=False, closed_at=timezone.now(), winner=F("highest_bidder"))
+        self.refresh_from_db(fields=["active", "closed_at", "winner"])
+        if closed:
+            fragments.bump("listing", [self.pk])
+            events.publish(self.pk, events.close_event(self.winner))
+        return bool(closed)
     
+class ListingTerm(models.Model):
+    """
+    A word of a listing's title or description, for searching databases
+    without SQLite's FTS5 (see search.py).
+    """
+    term = models.CharField(max_length=64)
+    listing = models.ForeignKey(Listings, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["term", "listing"], name="listing_term_unique"),
+        ]
+
 class Bids(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,5 +175,79 @@ class Comments(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     listing = models.ForeignKey(Listings, on_delete=models.CASCADE, related_name="comments")
 
+    class Meta:
+        # A listing's comments, paged through newest first by
+        # (created_at, id); see pagination.KeysetPage.
+        indexes = [
+            models.Index(fields=["listing", "-created_at", "-id"], name="comments_listing_created"),
+        ]
+
     def __str__(self):
         return f"{self.comment} ({self.id}) by {self.user}"
+
+
+class BidRollup(models.Model):
+    """
+    The number of bids on something, and the highest of them, per
+    minute or per hour. Kept up to date by place_bid() so that bid
+    statistics never have to aggregate Bids; see rollups.py.
+    """
+    RESOLUTIONS = {
+        "minute": timedelta(minutes=1),
+        "hour": timedelta(hours=1),
+    }
+
+    resolution = models.CharField(max_length=6, choices=[(r, r) for r in RESOLUTIONS])
+    start = models.DateTimeField()
+    bid_count = models.PositiveIntegerField(default=0)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def bucket(when, resolution):
+        """
+        Returns the start of the `resolution` bucket `when` falls in.
+        """
+        if resolution == "hour":
+            return when.replace(minute=0, second=0, microsecond=0)
+        return when.replace(second=0, microsecond=0)
+
+    @classmethod
+    def record(cls, amount, when, **scope):
+        """
+        Counts a bid of `amount` made at `when` in every resolution.
+        `scope` picks what it was a bid on, e.g. listing_id=...
+        """
+        amount = Value(amount, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+        for resolution in cls.RESOLUTIONS:
+            rows = cls.objects.filter(resolution=resolution, start=cls.bucket(when, resolution), **scope)
+            increment = {"bid_count": F("bid_count") + 1, "max_amount": Greatest("max_amount", amount)}
+            if rows.update(**increment):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(resolution=resolution, start=cls.bucket(when, resolution),
+                                       bid_count=1, max_amount=amount.value, **scope)
+            except IntegrityError:
+                # Another bid created the bucket first.
+                rows.update(**increment)
+
+
+class ListingBidRollup(BidRollup):
+    listing = models.ForeignKey(Listings, on_delete=models.CASCADE, related_name="bid_rollups")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "resolution", "start"], name="listing_bid_rollup_unique"),
+        ]
+
+
+class CategoryBidRollup(BidRollup):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="bid_rollups")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "resolution", "start"], name="category_bid_rollup_unique"),
+        ]
@@ -0,0 +1,112 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+def page_size(requested=None):
+    """
+    Returns the number of listings per page: `requested` if it is a
+    positive number no larger than AUCTIONS_MAX_PAGE_SIZE, otherwise
+    AUCTIONS_PAGE_SIZE.
+    """
+    default = getattr(settings, "AUCTIONS_PAGE_SIZE", 25)
+    maximum = getattr(settings, "AUCTIONS_MAX_PAGE_SIZE", 100)
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return default
+    return requested if 0 < requested <= maximum else default
+
+
+def encode_cursor(key):
+    """
+    Returns an opaque cursor for a row's position, given its sort key.
+    """
+    text = "|".join(str(value) for value in key)
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Returns the parts of the sort key a cursor holds, as strings, or
+    None if it is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """
+    One page of a queryset ordered newest first by (created_at, id).
+
+    Pages are found by comparing against the key of the last (or first)
+    row of the neighbouring page rather than with OFFSET, so with an
+    index on the ordering every page costs the same to fetch however
+    deep it is. Subclasses can page through other orderings by
+    overriding key(), parse_key(), order(), older() and newer().
+    """
+
+    def __init__(self, queryset, size, after=None, before=None):
+        after, before = self._decode(after), self._decode(before)
+        if before and not after:
+            # Walk backwards from the cursor, then flip the page round.
+            rows = list(self.order(queryset.filter(self.newer(before)), descending=False)[:size + 1])
+            self.has_previous = len(rows) > size
+            self.has_next = True
+            self.object_list = rows[:size][::-1]
+        else:
+            if after:
+                queryset = queryset.filter(self.older(after))
+            rows = list(self.order(queryset, descending=True)[:size + 1])
+            self.has_previous = after is not None
+            self.has_next = len(rows) > size
+            self.object_list = rows[:size]
+        if not self.object_list:
+            self.has_previous = self.has_next = False
+
+    def _decode(self, cursor):
+        parts = decode_cursor(cursor)
+        try:
+            return self.parse_key(parts) if parts else None
+        except ValueError:
+            return None
+
+    def key(self, obj):
+        return obj.created_at.isoformat(), obj.pk
+
+    def parse_key(self, parts):
+        created_at, pk = parts
+        return datetime.fromisoformat(created_at), int(pk)
+
+    def order(self, queryset, descending):
+        return queryset.order_by("-created_at", "-id") if descending else queryset.order_by("created_at", "id")
+
+    def older(self, key):
+        created_at, pk = key
+        # The redundant bound on created_at lets the database seek
+        # straight to the cursor in the index instead of scanning to it.
+        return Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+    def newer(self, key):
+        created_at, pk = key
+        return Q(created_at__gte=created_at) & (Q(created_at__gt=created_at) | Q(id__gt=pk))
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.key(self.object_list[-1])) if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.key(self.object_list[0])) if self.has_previous else None
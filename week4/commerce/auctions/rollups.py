@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncHour, TruncMinute
+
+from .models import BidRollup, Bids, CategoryBidRollup, ListingBidRollup
+
+TRUNCATE = {"minute": TruncMinute, "hour": TruncHour}
+
+# The window series() covers when none is asked for, and the longest
+# it will cover, per resolution (up to 1440 and 2160 buckets).
+DEFAULT_WINDOW = {"minute": timedelta(hours=1), "hour": timedelta(days=7)}
+MAX_WINDOW = {"minute": timedelta(days=1), "hour": timedelta(days=90)}
+
+
+def series(rollups, resolution, since, until):
+    """
+    Returns the bid statistics of `rollups` (the rollups of one listing
+    or category) between `since` and `until`: a bucket per `resolution`
+    that had bids (buckets without bids are left out), and totals with
+    the average number of bids per minute and per hour over the window.
+    """
+    buckets = list(rollups.filter(resolution=resolution, start__gte=BidRollup.bucket(since, resolution),
+                                  start__lt=until)
+                   .order_by("start").values_list("start", "bid_count", "max_amount"))
+    total = sum(count for _, count, _ in buckets)
+    highest = max((amount for _, _, amount in buckets), default=None)
+    minutes = max((until - since).total_seconds() / 60, 1)
+    return {
+        "resolution": resolution,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "count": total,
+        "max": str(highest) if highest is not None else None,
+        "per_minute": round(total / minutes, 4),
+        "per_hour": round(total / minutes * 60, 4),
+        "buckets": [{"start": start.isoformat(), "count": count, "max": str(amount)}
+                    for start, count, amount in buckets],
+    }
+
+
+def rebuild(batch_size=1000):
+    """
+    Recomputes every rollup from Bids, e.g. for bids placed before the
+    rollups existed. Aggregates in the database, one query per kind of
+    rollup and resolution.
+    """
+    with transaction.atomic():
+        ListingBidRollup.objects.all().delete()
+        CategoryBidRollup.objects.all().delete()
+        for resolution, truncate in TRUNCATE.items():
+            bids = Bids.objects.annotate(bucket=truncate("created_at")).order_by()
+            ListingBidRollup.objects.bulk_create((
+                ListingBidRollup(listing_id=row["listing"], resolution=resolution, start=row["bucket"],
+                                 bid_count=row["count"], max_amount=row["max"])
+                for row in bids.values("listing", "bucket").annotate(count=Count("id"), max=Max("amount"))
+            ), batch_size=batch_size)
+            CategoryBidRollup.objects.bulk_create((
+                CategoryBidRollup(category_id=row["listing__category"], resolution=resolution, start=row["bucket"],
+                                  bid_count=row["count"], max_amount=row["max"])
+                for row in (bids.filter(listing__category__isnull=False)
+                            .values("listing__category", "bucket").annotate(count=Count("id"), max=Max("amount")))
+            ), batch_size=batch_size)
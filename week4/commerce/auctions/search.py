@@ -0,0 +1,166 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Listings, ListingTerm
+from .pagination import KeysetPage
+
+# Created by migration 0011 where SQLite has FTS5.
+FTS_TABLE = "auctions_listings_fts"
+
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text):
+    """
+    Splits text into the lowercase words that are searched for.
+    """
+    return [word[:MAX_TERM_LENGTH] for word in re.findall(r"\w+", text.lower())]
+
+
+@lru_cache(maxsize=None)
+def _has_fts_table(database):
+    with connection.cursor() as cursor:
+        return FTS_TABLE in connection.introspection.table_names(cursor)
+
+
+def uses_fts():
+    """
+    Whether searches go through the FTS5 table: only on SQLite builds
+    with FTS5, and unless AUCTIONS_SEARCH_FTS is False. Otherwise the
+    ListingTerm index is used.
+    """
+    return (getattr(settings, "AUCTIONS_SEARCH_FTS", True) and connection.vendor == "sqlite"
+            and _has_fts_table(connection.settings_dict["NAME"]))
+
+
+def _match_expression(words):
+    # Quote each word so that FTS5 query syntax in it is taken literally;
+    # only the last one, which may still be being typed, is a prefix.
+    quoted = ['"{}"'.format(word.replace('"', '""')) for word in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def matching(listings, query, limit=None):
+    """
+    Narrows `listings` to those whose title or description has each
+    word of `query` (the last one as a prefix), or to those among the
+    newest `limit` matches.
+    """
+    words = tokenize(query)
+    if not words:
+        return listings.none()
+    if uses_fts():
+        if limit:
+            return listings.filter(id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s",
+                [_match_expression(words), limit]))
+        # A join rather than id IN (...), so that results can be read in
+        # the FTS table's rowid order (see SearchPage).
+        return listings.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = auctions_listings.id", f"{FTS_TABLE} MATCH %s"],
+            params=[_match_expression(words)])
+    matches = Listings.objects.all()
+    for i, word in enumerate(words):
+        if i == len(words) - 1:
+            # A range rather than startswith, which the term index can serve.
+            terms = ListingTerm.objects.filter(term__gte=word, term__lt=word + "\U0010ffff")
+        else:
+            terms = ListingTerm.objects.filter(term=word)
+        matches = matches.filter(id__in=terms.values("listing_id"))
+    if limit:
+        matches = matches.order_by("-id")[:limit]
+    return listings.filter(id__in=matches.values("id"))
+
+
+class SearchPage(KeysetPage):
+    """
+    A page of matching() results, newest first by id.
+
+    FTS5 hands matches over in rowid order and takes the cursor as a
+    rowid bound, so a page reads only as many matches as it needs,
+    however common the words searched for are.
+    """
+
+    def key(self, obj):
+        return (obj.pk,)
+
+    def parse_key(self, parts):
+        pk, = parts
+        return int(pk)
+
+    def order(self, queryset, descending):
+        if uses_fts():
+            rowid = RawSQL(f"{FTS_TABLE}.rowid", [])
+            return queryset.order_by(rowid.desc() if descending else rowid.asc())
+        return queryset.order_by("-id" if descending else "id")
+
+    def older(self, pk):
+        if uses_fts():
+            return RawSQL(f"{FTS_TABLE}.rowid < %s", [pk], output_field=BooleanField())
+        return Q(id__lt=pk)
+
+    def newer(self, pk):
+        if uses_fts():
+            return RawSQL(f"{FTS_TABLE}.rowid > %s", [pk], output_field=BooleanField())
+        return Q(id__gt=pk)
+
+
+def facet(listings, name):
+    """
+    Counts `listings` per "category" or per "status", as (value, count)
+    pairs.
+    """
+    listings = listings.order_by()
+    if name == "category":
+        return list(listings.values_list("category__name").annotate(count=Count("id"))
+                    .order_by("-count", "category__name"))
+    status = dict(listings.values_list("active").annotate(count=Count("id")))
+    return [("active", status.get(True, 0)), ("closed", status.get(False, 0))]
+
+
+def index_listings(listings):
+    """
+    Replaces the ListingTerm rows of `listings`. Does nothing while the
+    FTS5 table is in use, which its triggers keep up to date.
+    """
+    if uses_fts():
+        return
+    with transaction.atomic():
+        ListingTerm.objects.filter(listing__in=[listing.pk for listing in listings]).delete()
+        ListingTerm.objects.bulk_create([
+            ListingTerm(term=term, listing_id=listing.pk)
+            for listing in listings
+            for term in set(tokenize(f"{listing.title} {listing.description}"))
+        ], batch_size=1000)
+
+
+def listing_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {"title", "description"} & set(update_fields):
+        index_listings([instance])
+
+
+def rebuild(batch_size=1000):
+    """
+    Reindexes every listing, e.g. after a bulk import that bypassed the
+    post_save signal or after switching AUCTIONS_SEARCH_FTS.
+    """
+    if uses_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        return
+    ListingTerm.objects.all().delete()
+    listings = Listings.objects.only("title", "description").order_by("id")
+    last = 0
+    while True:
+        batch = list(listings.filter(id__gt=last)[:batch_size])
+        if not batch:
+            break
+        index_listings(batch)
+        last = batch[-1].pk
@@ -0,0 +1,64 @@
+// Loads older comments a page at a time.
+document.addEventListener("DOMContentLoaded", () => {
+    const more = document.querySelector("#more-comments");
+    if (!more) {
+        return;
+    }
+    const comments = document.querySelector("#comments");
+    more.addEventListener("click", () => {
+        more.disabled = true;
+        fetch(`${more.dataset.url}?after=${more.dataset.after}`)
+            .then(response => response.json())
+            .then(page => {
+                for (const comment of page.comments) {
+                    const item = document.createElement("p");
+                    item.dataset.commentId = comment.id;
+                    item.textContent = `${comment.user} - ${comment.comment}`;
+                    comments.append(item);
+                }
+                if (page.next) {
+                    more.dataset.after = page.next;
+                    more.disabled = false;
+                } else {
+                    more.remove();
+                }
+            })
+            .catch(() => {
+                more.disabled = false;
+            });
+    });
+});
+
+// Shows new bids on a listing page as they are placed, and reloads the
+// page when the auction closes.
+document.addEventListener("DOMContentLoaded", () => {
+    const listing = document.querySelector("#listing");
+    if (!listing || !listing.dataset.eventsUrl || !window.EventSource) {
+        return;
+    }
+    const highestBid = listing.querySelector(".highest-bid");
+    const history = listing.querySelector("#bid-history");
+    // Start from the newest bid shown; the server resends any after it.
+    const newest = history.querySelector("[data-bid-id]");
+    const source = new EventSource(`${listing.dataset.eventsUrl}?last_event_id=${newest ? newest.dataset.bidId : 0}`);
+
+    source.addEventListener("bid", event => {
+        // After a reconnect the server may resend bids already shown.
+        if (history.querySelector(`[data-bid-id="${event.lastEventId}"]`)) {
+            return;
+        }
+        const bid = JSON.parse(event.data);
+        highestBid.textContent = `Highest bid: $${bid.amount} (${bid.bid_count} bid${bid.bid_count === 1 ? "" : "s"})`;
+        highestBid.hidden = false;
+        const item = document.createElement("li");
+        item.dataset.bidId = event.lastEventId;
+        item.textContent = `${bid.bidder} - $${bid.amount}`;
+        history.querySelector("ul").prepend(item);
+        history.hidden = false;
+    });
+
+    source.addEventListener("close", () => {
+        source.close();
+        window.location.reload();
+    });
+});
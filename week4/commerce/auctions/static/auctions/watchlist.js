@@ -0,0 +1,25 @@
+// Adds and removes listings from the watchlist without reloading the
+// page; without JavaScript the forms post to the watchlist view instead.
+document.addEventListener("submit", event => {
+    const form = event.target.closest(".watch-toggle");
+    if (!form) {
+        return;
+    }
+    event.preventDefault();
+    const button = form.querySelector("[name=action]");
+    button.disabled = true;
+    fetch(form.dataset.toggleUrl, {method: "POST", body: new FormData(form), credentials: "same-origin"})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        })
+        .then(result => {
+            button.value = result.watched ? "Remove from Watchlist" : "Add to Watchlist";
+        })
+        .catch(() => window.location.reload())
+        .finally(() => {
+            button.disabled = false;
+        });
+});
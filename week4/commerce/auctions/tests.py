@@ -1,3 +1,916 @@
-from django.test import TestCase
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO, TextIOWrapper
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import events, fragments, ingest, rollups, search, thumbnails, watchlist
+from .expiry import ExpiryScheduler
+from .models import User, Listings, Bids, Comments, Category, CategoryBidRollup, ListingBidRollup
+
+
+class ListingPageQueryTests(TestCase):
+    """
+    Listing pages must cost a fixed number of queries, however many
+    listings, bids, comments and watchers there are.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        cls.category = Category.objects.create(name="Books")
+
+    def setUp(self):
+        cache.clear()
+
+    def create_listings(self, count, bids=0, comments=0):
+        listings = []
+        for i in range(count):
+            listing = Listings.objects.create(
+                title=f"Listing {i}", description="Description", starting_bid=Decimal("1.00"),
+                owner=self.owner, category=self.category)
+            for amount in range(2, bids + 2):
+                listing.place_bid(self.viewer, Decimal(amount))
+            for _ in range(comments):
+                Comments.objects.create(comment="Nice", user=self.viewer, listing=listing)
+            listing.watchlist.add(self.viewer)
+            listings.append(listing)
+        return listings
+
+    def test_index(self):
+        self.create_listings(2, bids=1)
+        self.client.force_login(self.viewer)
+        # Session, user, categories for the filter form, watched listing
+        # ids, listings.
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("index"))
+        self.create_listings(20, bids=3)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, "Listing 19")
+        self.assertContains(response, "Highest bid: $4.00")
+
+    def test_category(self):
+        self.create_listings(2, bids=1)
+        self.client.force_login(self.viewer)
+        url = reverse("category_detail", args=[self.category.name])
+        # Session, user, category, watched listing ids, listings.
+        with self.assertNumQueries(5):
+            self.client.get(url)
+        self.create_listings(20, bids=3)
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+    def test_watchlist(self):
+        self.create_listings(2)
+        self.client.force_login(self.viewer)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("watchlist"))
+        self.create_listings(20, bids=2)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("watchlist"))
+        self.assertContains(response, "Listing 19")
+
+    def test_listing(self):
+        listing, = self.create_listings(1, bids=1, comments=1)
+        self.client.force_login(self.viewer)
+        url = reverse("listing", args=[listing.id])
+        # Session, user, listing, watched listing ids, bids, comments.
+        with self.assertNumQueries(6):
+            self.client.get(url)
+        for amount in range(10, 30):
+            listing.place_bid(self.owner, Decimal(amount))
+            Comments.objects.create(comment="More", user=self.owner, listing=listing)
+        # The watched listing ids are cached now.
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, "Remove from Watchlist")
+        self.assertContains(response, "owner - $29.00")
+
+    def test_unchanged_listing_page_is_served_from_fragments(self):
+        listing, = self.create_listings(1, bids=2, comments=2)
+        url = reverse("listing", args=[listing.id])
+        self.client.get(url)
+        # Just the listing: its bids and comments are cached.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, "viewer - $3.00")
+        Comments.objects.create(comment="Late", user=self.owner, listing=listing)
+        # Only the comments are read again.
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, "owner - Late")
+        listing.place_bid(self.owner, Decimal("9.00"))
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, "owner - $9.00")
+        self.assertContains(response, "Highest bid: $9.00")
+
+    def test_listing_anonymous(self):
+        listing, = self.create_listings(1, bids=5, comments=5)
+        # Listing, bids, comments.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("listing", args=[listing.id]))
+        self.assertNotContains(response, "Add to Watchlist")
+
+
+@override_settings(AUCTIONS_COMMENTS_PAGE_SIZE=3)
+class CommentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.listing = Listings.objects.create(title="Lamp", description="Description",
+                                              starting_bid=Decimal("1.00"), owner=cls.owner)
+        cls.comments = [Comments.objects.create(comment=f"Comment {i}", user=cls.owner, listing=cls.listing)
+                        for i in range(7)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listing_page_shows_newest_comments(self):
+        response = self.client.get(reverse("listing", args=[self.listing.id]))
+        self.assertEqual([c.comment for c in response.context["comments"]], ["Comment 6", "Comment 5", "Comment 4"])
+        self.assertContains(response, 'id="more-comments"')
+
+    def test_older_comments_as_json(self):
+        url = reverse("listing_comments", args=[self.listing.id])
+        page = self.client.get(url).json()
+        seen = [c["comment"] for c in page["comments"]]
+        # Comments added meanwhile don't shift the pages.
+        Comments.objects.create(comment="New", user=self.owner, listing=self.listing)
+        while page["next"]:
+            # Listing, comments with their authors.
+            with self.assertNumQueries(2):
+                page = self.client.get(url, {"after": page["next"]}).json()
+            seen += [c["comment"] for c in page["comments"]]
+        self.assertEqual(seen, [f"Comment {i}" for i in reversed(range(7))])
+        self.assertEqual(page["comments"][-1]["user"], "owner")
+        self.assertEqual(self.client.get(url, {"after": "garbage"}).json()["comments"][0]["comment"], "New")
+        self.assertEqual(self.client.get(reverse("listing_comments", args=[0])).status_code, 404)
+
+
+class FragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.books = Category.objects.create(name="Books")
+        cls.listings = [
+            Listings.objects.create(title=f"Listing {i}", description="Description",
+                                    starting_bid=Decimal("1.00"), owner=cls.owner, category=cls.books)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_versions_change_with_their_objects(self):
+        first, second, _ = self.listings
+        before = {listing.pk: fragments.prepare([listing])[0].fragment_version for listing in self.listings}
+        first.place_bid(self.owner, Decimal("2.00"))
+        second.close()
+        after = {listing.pk: fragments.prepare([listing])[0].fragment_version for listing in self.listings}
+        self.assertNotEqual(before[first.pk], after[first.pk])
+        self.assertNotEqual(before[second.pk], after[second.pk])
+        self.assertEqual(before[self.listings[2].pk], after[self.listings[2].pk])
+        self.books.name = "Old books"
+        self.books.save()
+        fragments.prepare(self.listings)
+        self.assertTrue(all(after[listing.pk] != listing.fragment_version for listing in self.listings))
+
+    def test_evicted_versions_start_afresh(self):
+        listing = self.listings[0]
+        old = fragments.versions("listing", [listing.pk])[listing.pk]
+        cache.clear()
+        self.assertNotEqual(fragments.versions("listing", [listing.pk])[listing.pk], old)
+
+    def test_index_shows_changes(self):
+        self.client.get(reverse("index"))
+        listing = self.listings[1]
+        listing.title = "Renamed"
+        listing.save()
+        self.books.name = "Old books"
+        self.books.save()
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "Renamed")
+        self.assertContains(response, "Category: <a href=\"/category/Old%20books\">Old books</a>", count=3, html=True)
+
+
+class BrowseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.books = Category.objects.create(name="Books")
+        cls.games = Category.objects.create(name="Games")
+        cls.listings = [
+            Listings.objects.create(
+                title=f"Listing {i}", description="Description", starting_bid=Decimal(i + 1),
+                owner=cls.owner, category=cls.books if i % 2 else cls.games, active=i != 3)
+            for i in range(8)
+        ]
+        # Several listings created at the same moment must still be paged
+        # through exactly once each.
+        Listings.objects.filter(pk__in=[l.pk for l in cls.listings[2:6]]).update(created_at=timezone.now())
+
+    def titles(self, response):
+        return [listing.title for listing in response.context["listings"]]
+
+    def walk(self, url, **params):
+        pages = []
+        response = self.client.get(url, dict(params, page_size=2))
+        while True:
+            pages.append(self.titles(response))
+            if "next_query" not in response.context:
+                return pages, response
+            response = self.client.get(f"{url}?{response.context['next_query']}")
+
+    def test_pages_cover_every_listing_once(self):
+        pages, last = self.walk(reverse("index"), status="all")
+        titles = [title for page in pages for title in page]
+        expected = Listings.objects.order_by("-created_at", "-id").values_list("title", flat=True)
+        self.assertEqual(titles, list(expected))
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 2])
+
+        # And back again.
+        response = last
+        while "previous_query" in response.context:
+            response = self.client.get(f"{reverse('index')}?{response.context['previous_query']}")
+            self.assertEqual(self.titles(response), pages[len(pages) - 2])
+            pages.pop()
+        self.assertEqual(len(pages), 1)
+
+    def test_filters(self):
+        pages, _ = self.walk(reverse("index"))
+        self.assertNotIn("Listing 3", sum(pages, []))
+        self.assertEqual(len(sum(pages, [])), 7)
+
+        pages, _ = self.walk(reverse("index"), status="closed")
+        self.assertEqual(pages, [["Listing 3"]])
+
+        pages, _ = self.walk(reverse("index"), category="Books", min_price="3", max_price="6")
+        self.assertEqual(sorted(sum(pages, [])), ["Listing 5"])
+
+        pages, _ = self.walk(reverse("category_detail", args=["Games"]), status="all", max_price="5")
+        self.assertEqual(sorted(sum(pages, [])), ["Listing 0", "Listing 2", "Listing 4"])
+
+    def test_invalid_parameters_are_ignored(self):
+        response = self.client.get(reverse("index"), {
+            "after": "not-a-cursor", "page_size": "100000", "min_price": "cheap"})
+        self.assertEqual(len(self.titles(response)), 7)
+
+    def test_deep_pages_cost_the_same(self):
+        pages = []
+        response = self.client.get(reverse("index"), {"page_size": 1})
+        while "next_query" in response.context:
+            with self.assertNumQueries(2):
+                response = self.client.get(f"{reverse('index')}?{response.context['next_query']}")
+            pages.append(response)
+        self.assertEqual(len(pages), 6)
+
+
+class BidTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        cls.listing = Listings.objects.create(title="Lamp", description="Description",
+                                              starting_bid=Decimal("5.00"), owner=cls.owner)
+
+    def test_bid_must_beat_current_price(self):
+        self.assertIsNone(self.listing.place_bid(self.alice, Decimal("4.99")))
+        self.assertIsNone(self.listing.place_bid(self.alice, Decimal("5.00")))
+        self.assertIsNotNone(self.listing.place_bid(self.alice, Decimal("6.00")))
+        self.assertIsNone(self.listing.place_bid(self.bob, Decimal("6.00")))
+        self.assertEqual(Bids.objects.count(), 1)
+
+    def test_bid_updates_listing(self):
+        bid = self.listing.place_bid(self.alice, Decimal("6.00"))
+        self.assertEqual((bid.amount, bid.user, bid.listing), (Decimal("6.00"), self.alice, self.listing))
+        self.listing.place_bid(self.bob, Decimal("7.50"))
+        for listing in [self.listing, Listings.objects.get(pk=self.listing.pk)]:
+            self.assertEqual(listing.current_price, Decimal("7.50"))
+            self.assertEqual(listing.bid_count, 2)
+            self.assertEqual(listing.highest_bidder, self.bob)
+
+    def test_one_of_two_equal_bids_wins(self):
+        # Both bidders loaded the listing before either bid.
+        alices = Listings.objects.get(pk=self.listing.pk)
+        bobs = Listings.objects.get(pk=self.listing.pk)
+        self.assertIsNotNone(alices.place_bid(self.alice, Decimal("6.00")))
+        self.assertIsNone(bobs.place_bid(self.bob, Decimal("6.00")))
+        listing = Listings.objects.get(pk=self.listing.pk)
+        self.assertEqual((listing.bid_count, listing.highest_bidder), (1, self.alice))
+        self.assertEqual(list(Bids.objects.values_list("user", flat=True)), [self.alice.pk])
+
+    def test_view_rejects_invalid_amounts(self):
+        self.client.force_login(self.alice)
+        for amount in ["", "abc", "NaN", "sNaN", "Infinity", "-Infinity", "12345678901", "1e20"]:
+            response = self.client.post(reverse("bid"), {"listing_id": self.listing.pk, "bid": amount},
+                                        follow=True)
+            self.assertEqual(response.status_code, 200, amount)
+            self.assertContains(response, "Please enter a valid bid.")
+        self.assertFalse(Bids.objects.exists())
+        response = self.client.post(reverse("bid"), {"listing_id": self.listing.pk, "bid": "99999999.99"},
+                                    follow=True)
+        self.assertContains(response, "Bid placed successfully.")
+
+
+    def test_only_owner_can_close_auction(self):
+        self.listing.place_bid(self.alice, Decimal("6.00"))
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse("close_auction"), {"listing_id": self.listing.pk})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Listings.objects.get(pk=self.listing.pk).active)
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse("close_auction"), {"listing_id": self.listing.pk})
+        self.assertRedirects(response, reverse("listing", args=[self.listing.pk]))
+        listing = Listings.objects.get(pk=self.listing.pk)
+        self.assertEqual((listing.active, listing.winner), (False, self.alice))
+
+
+class ListingEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+
+    def setUp(self):
+        self.listing = Listings.objects.create(
+            title="Lamp", description="Description", starting_bid=Decimal("1.00"), owner=self.owner)
+
+    def subscribe(self):
+        hub = events.get_hub()
+        subscription = hub.subscribe(events.listing_channel(self.listing.pk))
+        self.addCleanup(hub.unsubscribe, subscription)
+        return subscription
+
+    def test_bids_and_close_are_published_on_commit(self):
+        subscription = self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            bid = self.listing.place_bid(self.bidder, Decimal("5.00"))
+            self.assertIsNone(subscription.get(0))
+        self.assertEqual(subscription.get(0), (
+            f'id: {bid.id}\nevent: bid\ndata: {{"amount":"5.00","bidder":"bidder","bid_count":1}}\n\n'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.place_bid(self.bidder, Decimal("4.00"))
+            self.assertTrue(self.listing.close())
+            self.assertFalse(self.listing.close())
+        self.assertEqual(subscription.get(0), 'event: close\ndata: {"winner":"bidder"}\n\n')
+        self.assertIsNone(subscription.get(0))
+
+    def test_stream(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.listing.place_bid(self.bidder, Decimal("2.00"))
+            second = self.listing.place_bid(self.bidder, Decimal("3.00"))
+        url = reverse("listing_events", args=[self.listing.pk])
+        response = self.client.get(url, {"last_event_id": first.id})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(events.get_hub().subscriber_count(events.listing_channel(self.listing.pk)), 1)
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).startswith(f"id: {second.id}\n".encode()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            third = self.listing.place_bid(self.bidder, Decimal("4.00"))
+            self.listing.close()
+        self.assertTrue(next(stream).startswith(f"id: {third.id}\n".encode()))
+        self.assertTrue(next(stream).startswith(b"event: close\n"))
+        self.assertEqual(list(stream), [])
+        self.assertEqual(events.get_hub().subscriber_count(events.listing_channel(self.listing.pk)), 0)
+
+    def test_stream_of_closed_listing(self):
+        self.listing.close()
+        response = self.client.get(reverse("listing_events", args=[self.listing.pk]),
+                                   HTTP_LAST_EVENT_ID="0")
+        self.assertEqual(list(response.streaming_content), [b'event: close\ndata: {"winner":null}\n\n'])
+
+
+class ExpiryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+
+    def create(self, ends_in, count=1):
+        ends_at = timezone.now() + timedelta(seconds=ends_in)
+        return [Listings.objects.create(title="Lamp", description="Description", starting_bid=Decimal("1.00"),
+                                        owner=self.owner, ends_at=ends_at) for _ in range(count)]
+
+    def test_scheduler_closes_due_auctions_in_bulk(self):
+        due = self.create(10, count=30)
+        due[0].place_bid(self.bidder, Decimal("2.00"))
+        later, = self.create(1000)
+        scheduler = ExpiryScheduler(timedelta(seconds=60), batch_size=7)
+        scheduler.load()
+        self.assertEqual(len(scheduler.heap), 30)
+        self.assertEqual(scheduler.run_due(), 0)
+
+        # Closed by hand in the meantime: dropped without being counted.
+        due[1].close()
+        when = timezone.now() + timedelta(seconds=11)
+        # Five batches, each a savepoint, the due rows, the update, the
+        # winners and the release, however many auctions are in it.
+        with self.assertNumQueries(5 * 5):
+            self.assertEqual(scheduler.run_due(when), 29)
+        self.assertFalse(scheduler.heap)
+        self.assertFalse(Listings.objects.filter(pk__in=[l.pk for l in due], active=True).exists())
+        due[0].refresh_from_db()
+        self.assertEqual((due[0].winner, due[0].closed_at), (self.bidder, when))
+        later.refresh_from_db()
+        self.assertTrue(later.active)
+
+    def test_extended_auction_is_not_closed_early(self):
+        listing, = self.create(10)
+        scheduler = ExpiryScheduler(timedelta(seconds=60))
+        scheduler.load()
+        Listings.objects.filter(pk=listing.pk).update(ends_at=listing.ends_at + timedelta(seconds=100))
+        self.assertEqual(scheduler.run_due(timezone.now() + timedelta(seconds=20)), 0)
+        listing.refresh_from_db()
+        self.assertTrue(listing.active)
+
+    def test_no_bids_after_end_time(self):
+        listing, = self.create(-1)
+        self.assertIsNone(listing.place_bid(self.bidder, Decimal("2.00")))
+
+    def test_command_closes_overdue_auctions(self):
+        overdue = self.create(-5, count=3)
+        self.create(5)
+        out = StringIO()
+        call_command("run_auction_scheduler", "--once", stdout=out)
+        self.assertIn("closed 3 auctions", out.getvalue())
+        self.assertEqual(Listings.objects.filter(active=False).count(), 3)
+        self.assertFalse(Listings.objects.filter(pk__in=[l.pk for l in overdue], active=True).exists())
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.books = Category.objects.create(name="Books")
+        cls.games = Category.objects.create(name="Games")
+        for title, description, category, price, active in [
+            ("Chess set", "Wooden board and pieces", cls.games, "20.00", True),
+            ("Chess openings", "A book about chess", cls.books, "15.00", True),
+            ("Go board", "Wooden board, complete", cls.games, "40.00", False),
+            ("Cookbook", "Recipes", cls.books, "10.00", True),
+        ]:
+            Listings.objects.create(title=title, description=description, category=category,
+                                    starting_bid=Decimal(price), owner=cls.owner, active=active)
+
+    def titles(self, query):
+        return sorted(search.matching(Listings.objects.all(), query).values_list("title", flat=True))
+
+    def check_matching(self):
+        self.assertEqual(self.titles("chess"), ["Chess openings", "Chess set"])
+        self.assertEqual(self.titles("WOODEN boa"), ["Chess set", "Go board"])
+        self.assertEqual(self.titles("wood board"), [])
+        self.assertEqual(self.titles("chess wooden"), ["Chess set"])
+        self.assertEqual(self.titles('"board" OR NEAR('), [])
+        self.assertEqual(self.titles("  "), [])
+
+    def test_fts(self):
+        self.assertTrue(search.uses_fts())
+        self.check_matching()
+        listing = Listings.objects.get(title="Cookbook")
+        listing.title = "Chess cookbook"
+        listing.save()
+        self.assertEqual(self.titles("chess"), ["Chess cookbook", "Chess openings", "Chess set"])
+        listing.delete()
+        self.assertEqual(self.titles("cook"), [])
+
+    @override_settings(AUCTIONS_SEARCH_FTS=False)
+    def test_term_index(self):
+        search.rebuild()
+        self.check_matching()
+        listing = Listings.objects.get(title="Cookbook")
+        listing.title = "Chess cookbook"
+        listing.save()
+        self.assertEqual(self.titles("chess"), ["Chess cookbook", "Chess openings", "Chess set"])
+
+    def test_facets(self):
+        response = self.client.get(reverse("search"), {"q": "board", "status": "all"})
+        self.assertEqual([l.title for l in response.context["listings"]], ["Go board", "Chess set"])
+        facets = dict(response.context["facets"])
+        self.assertEqual([(l["value"], l["count"]) for l in facets["Category"]], [("Games", 2)])
+        self.assertEqual([(l["value"], l["count"], l["selected"]) for l in facets["Status"]],
+                         [("active", 1, False), ("closed", 1, False)])
+
+        # Choosing a category narrows the status counts, not the
+        # category counts.
+        response = self.client.get(reverse("search"), {"q": "chess", "category": "Books"})
+        facets = dict(response.context["facets"])
+        self.assertEqual([(l["value"], l["count"]) for l in facets["Category"]], [("Books", 1), ("Games", 1)])
+        self.assertEqual([(l["value"], l["count"]) for l in facets["Status"]], [("active", 1), ("closed", 0)])
+        self.assertEqual([l.title for l in response.context["listings"]], ["Chess openings"])
+        self.assertIsNone(response.context["facet_limit"])
+
+    @override_settings(AUCTIONS_SEARCH_FACET_LIMIT=2)
+    def test_facets_of_common_words_are_sampled(self):
+        response = self.client.get(reverse("search"), {"q": "c", "status": "all"})
+        facets = dict(response.context["facets"])
+        self.assertEqual(sum(l["count"] for l in facets["Status"]), 2)
+        self.assertEqual(response.context["facet_limit"], 2)
+
+    def test_pages(self):
+        for fts in (True, False):
+            with self.subTest(fts=fts), self.settings(AUCTIONS_SEARCH_FTS=fts):
+                search.rebuild()
+                titles = []
+                response = self.client.get(reverse("search"), {"q": "c", "status": "all", "page_size": 1})
+                while True:
+                    titles += [l.title for l in response.context["listings"]]
+                    if "next_query" not in response.context:
+                        break
+                    response = self.client.get(f"{reverse('search')}?{response.context['next_query']}")
+                self.assertEqual(titles, ["Cookbook", "Go board", "Chess openings", "Chess set"])
+                response = self.client.get(f"{reverse('search')}?{response.context['previous_query']}")
+                self.assertEqual([l.title for l in response.context["listings"]], ["Chess openings"])
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 search is SQLite only")
+class SearchMigrationTests(TransactionTestCase):
+    TRIGGERS = ["auctions_listings_fts_delete", "auctions_listings_fts_insert", "auctions_listings_fts_update"]
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        if target is None:
+            targets = executor.loader.graph.leaf_nodes("auctions")
+        else:
+            targets = [("auctions", target)]
+        executor.migrate(targets)
+
+    def triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                           "AND tbl_name = 'auctions_listings' ORDER BY name")
+            return [name for name, in cursor.fetchall()]
+
+    def test_triggers_follow_migrations_backwards(self):
+        self.assertEqual(self.triggers(), self.TRIGGERS)
+        try:
+            # Removing the thumbnail columns may rebuild the table.
+            self.migrate("0012_bid_rollups")
+            self.assertEqual(self.triggers(), self.TRIGGERS)
+            self.migrate("0010_listings_ends_at")
+            self.assertEqual(self.triggers(), [])
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO auctions_listings SELECT * FROM auctions_listings WHERE 0")
+        finally:
+            self.migrate(None)
+        self.assertEqual(self.triggers(), self.TRIGGERS)
+
+
+class WatchlistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        cls.listings = [
+            Listings.objects.create(title=f"Listing {i}", description="Description",
+                                    starting_bid=Decimal("1.00"), owner=cls.owner)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.viewer)
+
+    def test_watched_ids_are_cached_until_changed(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(watchlist.watched_ids(self.viewer), set())
+        with self.assertNumQueries(0):
+            watchlist.watched_ids(self.viewer)
+        # Changed from the listing's side.
+        self.listings[0].watchlist.add(self.viewer)
+        self.assertEqual(watchlist.watched_ids(self.viewer), {self.listings[0].pk})
+        self.listings[0].watchlist.clear()
+        self.assertEqual(watchlist.watched_ids(self.viewer), set())
+
+    def test_toggle(self):
+        listing = self.listings[1]
+        url = reverse("watchlist_toggle")
+        response = self.client.post(url, {"listing_id": listing.pk})
+        self.assertEqual(response.json(), {"listing_id": listing.pk, "watched": True, "count": 1})
+        self.assertTrue(self.viewer.watchlist.filter(pk=listing.pk).exists())
+        response = self.client.post(url, {"listing_id": listing.pk})
+        self.assertEqual(response.json(), {"listing_id": listing.pk, "watched": False, "count": 0})
+        self.assertEqual(self.client.post(url, {"listing_id": 0}).status_code, 404)
+        self.assertEqual(self.client.post(url, {}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+    def test_bulk(self):
+        url = reverse("watchlist_bulk")
+        ids = [listing.pk for listing in self.listings]
+        response = self.client.post(url, {"action": "add", "listing_ids": ids + [0]},
+                                    content_type="application/json")
+        self.assertEqual(response.json(), {"action": "add", "listing_ids": sorted(ids), "count": 5})
+        response = self.client.post(url, {"action": "remove", "listing_id": ids[:3]})
+        self.assertRedirects(response, reverse("watchlist"))
+        self.assertEqual(watchlist.watched_ids(self.viewer), set(ids[3:]))
+        self.assertEqual(self.client.post(url, {"action": "drop", "listing_ids": ids},
+                                          content_type="application/json").status_code, 400)
+
+    def test_form_redirects_back(self):
+        listing = self.listings[2]
+        response = self.client.post(reverse("watchlist"), {
+            "listing_id": listing.pk, "action": "Add to Watchlist", "next": "/?status=all"})
+        self.assertRedirects(response, "/?status=all")
+        response = self.client.post(reverse("watchlist"), {
+            "listing_id": listing.pk, "action": "Remove from Watchlist", "next": "https://example.com/"})
+        self.assertRedirects(response, reverse("listing", args=[listing.pk]))
+        self.assertEqual(watchlist.watched_ids(self.viewer), set())
+
+
+class BidRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.category = Category.objects.create(name="Tools")
+        cls.listing = Listings.objects.create(title="Hammer", description="Description",
+                                              starting_bid=Decimal("1.00"), owner=cls.owner,
+                                              category=cls.category)
+
+    def test_record_buckets_by_minute_and_hour(self):
+        start = timezone.now().replace(minute=10, second=0, microsecond=0) - timedelta(hours=1)
+        for offset, amount in [(5, "2.00"), (30, "4.00"), (65, "3.00")]:
+            ListingBidRollup.record(Decimal(amount), start + timedelta(seconds=offset), listing_id=self.listing.pk)
+        minutes = self.listing.bid_rollups.filter(resolution="minute").order_by("start")
+        self.assertEqual([(r.start, r.bid_count, r.max_amount) for r in minutes], [
+            (start, 2, Decimal("4.00")), (start + timedelta(minutes=1), 1, Decimal("3.00"))])
+        hour = self.listing.bid_rollups.get(resolution="hour")
+        self.assertEqual((hour.start, hour.bid_count, hour.max_amount),
+                         (start.replace(minute=0), 3, Decimal("4.00")))
+
+    def test_place_bid_updates_listing_and_category_rollups(self):
+        for amount in ["2.00", "3.00", "2.50"]:
+            self.listing.place_bid(self.bidder, Decimal(amount))
+        for rollup in (self.listing.bid_rollups, self.category.bid_rollups):
+            totals = {r.resolution: (r.bid_count, r.max_amount) for r in rollup.all()}
+            # The rejected 2.50 bid isn't counted.
+            self.assertEqual(totals, {"minute": (2, Decimal("3.00")), "hour": (2, Decimal("3.00"))})
+
+    def test_api(self):
+        self.listing.place_bid(self.bidder, Decimal("2.00"))
+        self.listing.place_bid(self.bidder, Decimal("5.00"))
+        response = self.client.get(reverse("listing_bid_stats", args=[self.listing.pk]))
+        data = response.json()
+        self.assertEqual((data["resolution"], data["count"], data["max"]), ("minute", 2, "5.00"))
+        self.assertEqual(data["per_minute"], round(2 / 60, 4))
+        # One bucket, or two if the minute turned between the bids.
+        self.assertEqual(sum(b["count"] for b in data["buckets"]), 2)
+        self.assertEqual(data["buckets"][-1]["max"], "5.00")
+        url = reverse("category_bid_stats", args=[self.category.name])
+        data = self.client.get(url, {"resolution": "hour"}).json()
+        self.assertEqual((data["count"], data["per_hour"]), (2, round(2 / (7 * 24), 4)))
+        since = (timezone.now() + timedelta(minutes=5)).isoformat()
+        self.assertEqual(self.client.get(url, {"since": since}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"resolution": "day"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"until": "yesterday"}).status_code, 400)
+        since = (timezone.now() - timedelta(days=2)).isoformat()
+        self.assertEqual(self.client.get(url, {"since": since}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"since": since, "resolution": "hour"}).status_code, 200)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for amount in ["2.00", "3.00"]:
+            self.listing.place_bid(self.bidder, Decimal(amount))
+        Bids.objects.filter(amount=Decimal("2.00")).update(created_at=timezone.now() - timedelta(hours=2))
+        expected = {"minute": 2, "hour": 2}
+        call_command("rebuild_bid_rollups", stdout=StringIO())
+        for model in (ListingBidRollup, CategoryBidRollup):
+            counts = {}
+            for rollup in model.objects.all():
+                counts[rollup.resolution] = counts.get(rollup.resolution, 0) + 1
+                self.assertEqual(rollup.bid_count, 1)
+            self.assertEqual(counts, expected)
+        self.assertEqual(self.listing.bid_rollups.order_by("-start").first().max_amount, Decimal("3.00"))
+        self.assertEqual(rollups.series(self.listing.bid_rollups.all(), "hour",
+                                        timezone.now() - timedelta(hours=3), timezone.now())["count"], 2)
+
+
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        Category.objects.create(name="Tools")
+
+    def test_import_validates_rows_and_batches_categories(self):
+        future = (timezone.now() + timedelta(days=1)).isoformat()
+        rows = [
+            {"title": "Hammer", "description": "Claw hammer", "starting_bid": "5.00", "category": "Tools"},
+            {"title": "Saw", "description": "", "starting_bid": "3.00", "category": "Tools"},
+            {"title": "Vase", "description": "Blue vase", "starting_bid": "9.50", "new_category": "Pottery",
+             "ends_at": future},
+            {"title": "Bowl", "description": "Clay bowl", "starting_bid": "2", "category": "Pottery"},
+            {"title": "Clock", "description": "Old clock", "starting_bid": "1.00"},
+            "Invalid JSON",
+            {"title": "Rake", "description": "Garden rake", "starting_bid": "4", "category": "Garden"},
+            {"title": "Pliers", "description": "Small pliers", "starting_bid": "3", "category": "Tools"},
+        ]
+        # Looking up and creating categories takes three queries for the
+        # first batch, one for the second (an unknown `category` isn't
+        # created) and none for the third; each batch is inserted in a
+        # savepoint of its own, three queries.
+        with self.assertNumQueries(13):
+            result = ingest.import_listings(rows, self.owner, batch_size=2)
+        self.assertEqual([(e["row"], list(e["errors"])) for e in result["errors"]],
+                         [(2, ["description"]), (5, ["__all__"]), (6, ["__all__"]), (7, ["category"])])
+        self.assertFalse(Category.objects.filter(name="Garden").exists())
+        listings = Listings.objects.filter(pk__in=result["created"]).order_by("pk")
+        self.assertEqual([(l.title, l.category.name, l.current_price, l.owner) for l in listings], [
+            ("Hammer", "Tools", Decimal("5.00"), self.owner),
+            ("Vase", "Pottery", Decimal("9.50"), self.owner),
+            ("Bowl", "Pottery", Decimal("2.00"), self.owner),
+            ("Pliers", "Tools", Decimal("3.00"), self.owner),
+        ])
+        self.assertIsNotNone(listings[1].ends_at)
+        self.assertEqual(Category.objects.filter(name="Pottery").count(), 1)
+        self.assertEqual([l.pk for l in search.matching(Listings.objects.all(), "clay")], [listings[2].pk])
+
+    @override_settings(AUCTIONS_SEARCH_FTS=False)
+    def test_import_indexes_terms_without_fts(self):
+        result = ingest.import_listings([{"title": "Anvil", "description": "Heavy", "starting_bid": "8",
+                                          "category": "Tools"}], self.owner)
+        self.assertEqual([l.pk for l in search.matching(Listings.objects.all(), "anvil")], result["created"])
+
+    def test_api(self):
+        self.client.force_login(self.owner)
+        url = reverse("import_listings")
+        body = ("title,description,starting_bid,category\n"
+                "Hammer,\"Claw, steel\",5.00,Tools\n"
+                "Saw,Rusty,free,Tools\n")
+        response = self.client.post(url, body, content_type="text/csv")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(len(data["created"]), 1)
+        self.assertEqual(data["errors"], [{"row": 2, "errors": {"starting_bid": ["Enter a number."]}}])
+        self.assertEqual(Listings.objects.get(pk=data["created"][0]).description, "Claw, steel")
+        body = '{"title": "Drill", "description": "Cordless", "starting_bid": 20, "category": "Tools"}\n'
+        response = self.client.post(url, body, content_type="application/x-ndjson")
+        self.assertEqual(len(response.json()["created"]), 1)
+        self.assertEqual(self.client.post(url + "?format=xml", body, content_type="text/xml").status_code, 400)
+
+    def test_command(self):
+        path = self.enterContext(tempfile.TemporaryDirectory()) + "/listings.jsonl"
+        with open(path, "w") as f:
+            f.write('{"title": "Drill", "description": "Cordless", "starting_bid": 20, "category": "Tools"}\n'
+                    '{"title": "Drill"}\n')
+        out, err = StringIO(), StringIO()
+        call_command("import_listings", path, owner="owner", stdout=out, stderr=err)
+        self.assertIn("Imported 1 listings", out.getvalue())
+        self.assertIn("Row 2: description: This field is required.", err.getvalue())
+
+    def test_unreadable_rows_are_skipped(self):
+        self.client.force_login(self.owner)
+        url = reverse("import_listings")
+        body = (b"title,description,starting_bid,category\n"
+                b"Hammer,Claw,5.00,Tools\n"
+                b"Saw,Rusty \xff,3.00,Tools\n"
+                b"Rake,\"" + b"x" * 200000 + b"\",4.00,Tools\n"
+                b"Drill,Cordless,20,Tools\n")
+        with self.settings(AUCTIONS_IMPORT_BATCH_SIZE=1):
+            response = self.client.post(url, {"file": ContentFile(body, name="listings.csv")})
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual([l.title for l in Listings.objects.filter(pk__in=data["created"]).order_by("pk")],
+                         ["Hammer", "Drill"])
+        self.assertEqual(data["errors"][0], {"row": 2, "errors": {"__all__": [ingest.NOT_UTF8]}})
+        self.assertEqual(data["errors"][1]["row"], 3)
+        self.assertTrue(data["errors"][1]["errors"]["__all__"][0].startswith("Invalid CSV"))
+
+        body = (b'\xef\xbb\xbf{"title": "Drill", "description": "Cordless", "starting_bid": 20, "category": "Tools"}\n'
+                b'{"title": "Saw \xc3", "description": "Rusty", "starting_bid": 3, "category": "Tools"}\n')
+        response = self.client.post(url, body, content_type="application/x-ndjson")
+        self.assertEqual(len(response.json()["created"]), 1)
+        self.assertEqual(response.json()["errors"], [{"row": 2, "errors": {"__all__": [ingest.NOT_UTF8]}}])
+
+        path = self.enterContext(tempfile.TemporaryDirectory()) + "/listings.jsonl"
+        with open(path, "wb") as f:
+            f.write(body)
+        out, err = StringIO(), StringIO()
+        call_command("import_listings", path, owner="owner", stdout=out, stderr=err)
+        self.assertIn("Imported 1 listings", out.getvalue())
+        self.assertIn(f"Row 2: {ingest.NOT_UTF8}", err.getvalue())
+
+        # Text decoded strictly ends at the first bytes that aren't UTF-8.
+        rows = list(ingest.read_rows(TextIOWrapper(BytesIO(body), encoding="utf-8"), "jsonl"))
+        self.assertEqual(rows[-1], ingest.NOT_UTF8)
+
+
+def fetch_test_image(url):
+    """
+    Stands in for thumbnails.fetch_url() in tests: a 1000x500 PNG whose
+    colour depends on the URL.
+    """
+    from PIL import Image
+    output = BytesIO()
+    Image.new("RGB", (1000, 500), "red" if "red" in url else "blue").save(output, "PNG")
+    return output.getvalue()
+
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "password")
+        cls.listing = Listings.objects.create(title="Lamp", description="Description", starting_bid=Decimal("1.00"),
+                                              owner=cls.owner, image_url="https://example.com/red.png")
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(AUCTIONS_THUMBNAIL_DIR=directory, AUCTIONS_THUMBNAIL_WORKERS=0,
+                                            AUCTIONS_THUMBNAIL_FETCHER="auctions.tests.fetch_test_image"))
+
+    def test_pages_use_thumbnails_once_made(self):
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, 'src="https://example.com/red.png"')
+        digest = "ab" * 32
+        Listings.objects.filter(pk=self.listing.pk).update(thumbnail_source=self.listing.image_url,
+                                                           thumbnail_digest=digest)
+        fragments.bump("listing", [self.listing.pk])
+        response = self.client.get(reverse("index"))
+        self.assertNotContains(response, "https://example.com/red.png")
+        self.assertContains(response, f'src="/thumbnail/{digest}/medium.jpg"')
+        # Thumbnails of a previous image aren't shown.
+        Listings.objects.filter(pk=self.listing.pk).update(image_url="https://example.com/blue.png")
+        self.assertEqual(Listings.objects.get(pk=self.listing.pk).thumbnails, {})
+
+    def test_serves_thumbnails_with_cache_headers(self):
+        digest = "cd" * 32
+        thumbnails.storage().save(thumbnails.name(digest, "small"), ContentFile(b"jpeg"))
+        url = reverse("thumbnail", args=[digest, "small"])
+        response = self.client.get(url)
+        self.assertEqual(b"".join(response.streaming_content), b"jpeg")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(reverse("thumbnail", args=[digest, "huge"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("thumbnail", args=["ef" * 32, "small"])).status_code, 404)
+        self.assertEqual(self.client.get(f"/thumbnail/{'AB' * 32}/small.jpg").status_code, 404)
+
+    def test_fetch_url_only_fetches_http(self):
+        with self.assertRaises(ValueError):
+            thumbnails.fetch_url("file:///etc/passwd")
+
+    def test_fetch_url_only_fetches_public_hosts(self):
+        for address in ["127.0.0.1", "10.1.2.3", "172.16.0.1", "192.168.1.1", "169.254.169.254", "0.0.0.0",
+                        "224.0.0.1", "::1", "fe80::1", "fc00::1", "::ffff:127.0.0.1"]:
+            self.assertFalse(thumbnails.is_public(address), address)
+        for address in ["93.184.216.34", "2606:4700::1111"]:
+            self.assertTrue(thumbnails.is_public(address), address)
+        for url in ["http://127.0.0.1/red.png", "https://localhost/red.png", "http://[::1]:8000/red.png",
+                    "http://169.254.169.254/latest/meta-data/"]:
+            with self.assertRaises(ValueError):
+                thumbnails.fetch_url(url)
+
+    def test_fetch_url_checks_redirects(self):
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append(self.path)
+                self.send_response(302)
+                self.send_header("Location", f"http://127.0.0.1:{self.server.server_port}/internal")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.addCleanup(server.server_close)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        # Let the first connection through as if the host were public.
+        allowed = iter([True])
+        with mock.patch.object(thumbnails, "is_public", lambda address: next(allowed, False)):
+            with self.assertRaises(ValueError):
+                thumbnails.fetch_url(f"http://127.0.0.1:{server.server_port}/red.png")
+        self.assertEqual(requests, ["/red.png"])
+
+    def test_generate(self):
+        from PIL import Image
+        digest = thumbnails.generate(self.listing.pk)
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.thumbnail_digest, self.listing.thumbnail_source),
+                         (digest, self.listing.image_url))
+        for size, pixels in thumbnails.SIZES.items():
+            with thumbnails.storage().open(thumbnails.name(digest, size)) as f, Image.open(f) as image:
+                self.assertEqual(image.size, (pixels, pixels // 2))
+        # A listing with the same image shares its thumbnails; a new
+        # listing has them made when it is saved.
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Listings.objects.create(title="Lamp", description="Description", starting_bid=Decimal("1.00"),
+                                            owner=self.owner, image_url="https://example.com/red.png?copy")
+        other.refresh_from_db()
+        self.assertEqual(other.thumbnail_digest, digest)
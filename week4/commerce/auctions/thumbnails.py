@@ -0,0 +1,195 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import socket
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from . import fragments
+from .models import Listings
+
+logger = logging.getLogger(__name__)
+
+SIZES = Listings.THUMBNAIL_SIZES
+
+
+def storage():
+    return FileSystemStorage(location=getattr(settings, "AUCTIONS_THUMBNAIL_DIR", None))
+
+
+def name(digest, size):
+    """
+    The storage name of a thumbnail. Thumbnails are named after the
+    SHA-256 of the image they were made from, so a name always refers
+    to the same content and listings sharing an image share its files.
+    """
+    return f"{digest[:2]}/{digest}-{size}.jpg"
+
+
+def is_public(address):
+    """
+    Whether an IP address is one anybody on the internet could reach,
+    i.e. not loopback, link-local, private, reserved or multicast.
+    """
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None, **kwargs):
+    # Stands in for socket.create_connection(): resolves the host once,
+    # refuses it unless every address is public, and connects to those
+    # very addresses, so a second lookup can't point elsewhere.
+    host, port = address
+    addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    for ip in addresses:
+        if not is_public(ip):
+            raise ValueError(f"Refusing to fetch from {host} ({ip}): not a public address")
+    error = None
+    for ip in addresses:
+        try:
+            return socket.create_connection((ip, port), timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Certificates are still checked against the host name.
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+def _opener():
+    # Only HTTP(S), without proxies from the environment, and redirects
+    # go through the same handlers, so they are checked too.
+    opener = urllib.request.OpenerDirector()
+    for handler in [_PublicHTTPHandler(), _PublicHTTPSHandler(), urllib.request.HTTPRedirectHandler(),
+                    urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor()]:
+        opener.add_handler(handler)
+    return opener
+
+
+def fetch_url(url):
+    """
+    Downloads an image over HTTP(S), refusing anything larger than
+    AUCTIONS_THUMBNAIL_MAX_BYTES, and hosts (including those redirected
+    to) that aren't on the public internet: image URLs come from users,
+    and must not reach the server's own network.
+    """
+    if not url.lower().startswith(("http://", "https://")):
+        raise ValueError(f"Not an HTTP(S) URL: {url}")
+    limit = getattr(settings, "AUCTIONS_THUMBNAIL_MAX_BYTES", 10 * 1024 * 1024)
+    request = urllib.request.Request(url, headers={"User-Agent": "commerce-thumbnailer"})
+    with _opener().open(request, timeout=getattr(settings, "AUCTIONS_THUMBNAIL_TIMEOUT", 10)) as response:
+        data = response.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f"Image larger than {limit} bytes: {url}")
+    return data
+
+
+def resize(data, size):
+    """
+    Returns the JPEG bytes of the image in `data` scaled down to fit
+    `size` pixels square.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size, size))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+
+def generate(listing_id):
+    """
+    Fetches a listing's image with AUCTIONS_THUMBNAIL_FETCHER, stores
+    it in every size, and records its digest on the listing. Returns
+    the digest, or None if the image couldn't be fetched or read.
+    """
+    listing = Listings.objects.filter(pk=listing_id).only("image_url").first()
+    if listing is None or not listing.image_url:
+        return None
+    url = listing.image_url
+    fetch = import_string(getattr(settings, "AUCTIONS_THUMBNAIL_FETCHER", "auctions.thumbnails.fetch_url"))
+    try:
+        data = fetch(url)
+        digest = hashlib.sha256(data).hexdigest()
+        files = storage()
+        for size, pixels in SIZES.items():
+            if not files.exists(name(digest, size)):
+                files.save(name(digest, size), ContentFile(resize(data, pixels)))
+    except Exception:
+        logger.warning("Could not make thumbnails of %s for listing %s", url, listing_id, exc_info=True)
+        return None
+    # Unless the image was changed meanwhile.
+    if Listings.objects.filter(pk=listing_id, image_url=url).update(thumbnail_source=url, thumbnail_digest=digest):
+        fragments.bump("listing", [listing_id])
+    return digest
+
+
+def _work(listing_id):
+    try:
+        generate(listing_id)
+    finally:
+        close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def get_pool():
+    """
+    The threads thumbnails are made in, AUCTIONS_THUMBNAIL_WORKERS of
+    them, or None to make them right away in the caller's thread.
+    """
+    workers = getattr(settings, "AUCTIONS_THUMBNAIL_WORKERS", 2)
+    return ThreadPoolExecutor(workers, thread_name_prefix="thumbnails") if workers else None
+
+
+def schedule(listing_ids):
+    """
+    Has thumbnails made for `listing_ids` in the background once the
+    current transaction commits.
+    """
+    def submit():
+        pool = get_pool()
+        for listing_id in listing_ids:
+            if pool is None:
+                generate(listing_id)
+            else:
+                pool.submit(_work, listing_id)
+
+    transaction.on_commit(submit)
+
+
+def listing_saved(sender, instance, **kwargs):
+    if instance.image_url and instance.image_url != instance.thumbnail_source:
+        schedule([instance.pk])
@@ -9,10 +9,19 @@ urlpatterns = [
     path("register", views.register, name="register"),
     path("create_listing", views.create_listing, name="create_listing"),
     path("listing/<int:listing_id>", views.listing, name="listing"),
+    path("listing/<int:listing_id>/events", views.listing_events, name="listing_events"),
+    path("listing/<int:listing_id>/comments", views.listing_comments, name="listing_comments"),
     path("watchlist", views.watchlist, name="watchlist"),
+    path("watchlist/toggle", views.watchlist_toggle, name="watchlist_toggle"),
+    path("watchlist/bulk", views.watchlist_bulk, name="watchlist_bulk"),
     path("close_auction", views.close_auction, name="close_auction"),
     path("bid", views.bid, name="bid"),
     path("comment", views.comment, name="comment"),
+    path("search", views.search, name="search"),
+    path("thumbnail/<str:digest>/<str:size>.jpg", views.thumbnail, name="thumbnail"),
+    path("api/listings/import", views.import_listings, name="import_listings"),
+    path("api/listings/<int:listing_id>/bids", views.listing_bid_stats, name="listing_bid_stats"),
+    path("api/categories/<str:category>/bids", views.category_bid_stats, name="category_bid_stats"),
     path("category", views.category, name="category_list"),
     path("category/<str:category>", views.category, name="category_detail"),
 ]
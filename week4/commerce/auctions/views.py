@@ -1,28 +1,208 @@
+import io
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
 from django.contrib.auth import authenticate, login, logout
+from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import etag, require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 
+from . import events, fragments, ingest, rollups, search as listing_search, thumbnails, watchlist as watchlists
 from .models import User, Listings, Bids, Comments, Category
-from .forms import ListingForm, CommentForm
+from .forms import ListingForm, CommentForm, ListingFilterForm, SearchForm
+from .pagination import KeysetPage, page_size
+
+def browse(request, listings, form, page_class=KeysetPage):
+    """
+    Filters `listings` by the query string and returns the context for
+    one keyset-paginated page of them, with the query strings of the
+    neighbouring pages.
+    """
+    page = page_class(form.filter(listings), page_size(request.GET.get("page_size")),
+                      after=request.GET.get("after"), before=request.GET.get("before"))
+    params = request.GET.copy()
+    params.pop("after", None)
+    params.pop("before", None)
+    fragments.prepare(page.object_list)
+    context = {"listings": page, "filter_form": form, "watched_ids": watchlists.watched_ids(request.user)}
+    if page.has_next:
+        params["after"] = page.next_cursor
+        context["next_query"] = params.urlencode()
+        del params["after"]
+    if page.has_previous:
+        params["before"] = page.previous_cursor
+        context["previous_query"] = params.urlencode()
+    return context
 
 def index(request):
-    return render(request, "auctions/index.html", {
-        "listings": Listings.objects.all()
-    })
+    return render(request, "auctions/index.html", browse(
+        request, Listings.objects.for_display(), ListingFilterForm(request.GET)))
+
+def facet_links(request, name, counts, selected):
+    """
+    Returns a link per value of a search facet, to the same search
+    with that value chosen.
+    """
+    links = []
+    for value, count in counts:
+        if value is None:
+            continue
+        params = request.GET.copy()
+        params.pop("after", None)
+        params.pop("before", None)
+        params[name] = value
+        links.append({"value": value, "count": count, "query": params.urlencode(), "selected": value == selected})
+    return links
+
+def search(request):
+    """
+    Searches listing titles and descriptions, with the filters of the
+    browse pages, and counts the matches per category and status.
+    """
+    form = SearchForm(request.GET)
+    form.is_valid()
+    query = form.cleaned_data.get("q", "")
+    matches = listing_search.matching(Listings.objects.all(), query)
+    context = browse(request, matches.for_display(), form, listing_search.SearchPage)
+    context["query"] = query
+    if query:
+        # Each facet counts the matches under the other filters, so that
+        # its counts say what choosing one of its values would show.
+        # Counting every match of a common word would cost as much as
+        # reading them all, so only the newest matches are counted.
+        limit = getattr(settings, "AUCTIONS_SEARCH_FACET_LIMIT", 500)
+        sample = listing_search.matching(Listings.objects.all(), query, limit)
+        category = form.cleaned_data.get("category")
+        context["facets"] = [
+            ("Category", facet_links(request, "category",
+                                     listing_search.facet(form.filter(sample, exclude="category"), "category"),
+                                     category.name if category else None)),
+            ("Status", facet_links(request, "status",
+                                   listing_search.facet(form.filter(sample, exclude="status"), "status"),
+                                   form.cleaned_data.get("status") or "active")),
+        ]
+        sampled = listing_search.matching(Listings.objects.all(), query, limit + 1).count() > limit
+        context["facet_limit"] = limit if sampled else None
+    return render(request, "auctions/search.html", context)
 
 def listing(request, listing_id):
-    listing = Listings.objects.get(pk=listing_id)
+    listing = get_object_or_404(Listings.objects.for_display(), pk=listing_id)
     return render(request, "auctions/listing.html", {
         "listing": listing,
-        "watchlist": request.user.watchlist.all() if request.user.is_authenticated else None,
-        "bids": Bids.objects.filter(listing=listing) if len(Bids.objects.filter(listing=listing)) > 0 else None,
+        "watched_ids": watchlists.watched_ids(request.user),
+        # Only read if their cached fragments are out of date.
+        "bids": listing.bids.select_related("user").order_by("-created_at", "-id"),
+        "comments": SimpleLazyObject(lambda: comment_page(listing)),
+        "comments_version": fragments.versions("comments", [listing.pk])[listing.pk],
         "comment_form": CommentForm()
     })
 
+def comment_page(listing, after=None):
+    """
+    Returns a page of a listing's comments, newest first, with their
+    authors.
+    """
+    return KeysetPage(listing.comments.select_related("user"),
+                      getattr(settings, "AUCTIONS_COMMENTS_PAGE_SIZE", 20), after=after)
+
+def listing_comments(request, listing_id):
+    """
+    Returns the page of a listing's comments after the ?after= cursor
+    as JSON, for the listing page to load older comments with.
+    """
+    listing = get_object_or_404(Listings, pk=listing_id)
+    page = comment_page(listing, request.GET.get("after"))
+    return JsonResponse({
+        "comments": [{
+            "id": comment.id,
+            "user": comment.user.username,
+            "comment": comment.comment,
+            "created_at": comment.created_at.isoformat(),
+        } for comment in page],
+        "next": page.next_cursor,
+    })
+
+def listing_events(request, listing_id):
+    """
+    Streams a listing's new bids and its closing as Server-Sent Events.
+    A client reconnecting with Last-Event-ID (or connecting with
+    ?last_event_id=, the newest bid on the page it has) first gets the
+    bids it missed; the stream ends once the auction closes.
+    """
+    listing = get_object_or_404(Listings.objects.select_related("winner"), pk=listing_id)
+    hub = events.get_hub()
+    asynchronous = isinstance(request, ASGIRequest)
+    # Subscribe before reading the backlog so that no bid falls between
+    # the two; the client ignores bids it has already seen.
+    subscription = hub.subscribe(events.listing_channel(listing.pk), asynchronous) if listing.active else None
+    backlog = []
+    last_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id", "")
+    if last_id.isdigit():
+        missed = listing.bids.filter(id__gt=int(last_id)).select_related("user").order_by("id")
+        backlog = [events.bid_event(bid, listing) for bid in missed]
+    if subscription is None:
+        backlog.append(events.close_event(listing.winner))
+    keepalive = getattr(settings, "AUCTIONS_EVENTS_KEEPALIVE", 15)
+
+    def stream():
+        try:
+            yield from backlog
+            while subscription is not None:
+                event = subscription.get(keepalive)
+                # A comment line; writing it notices clients that left.
+                yield event or ": keepalive\n\n"
+                if event and event.startswith("event: close"):
+                    break
+        finally:
+            if subscription is not None:
+                hub.unsubscribe(subscription)
+
+    async def astream():
+        try:
+            for event in backlog:
+                yield event
+            while subscription is not None:
+                event = await subscription.aget(keepalive)
+                yield event or ": keepalive\n\n"
+                if event and event.startswith("event: close"):
+                    break
+        finally:
+            if subscription is not None:
+                hub.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(astream() if asynchronous else stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@etag(lambda request, digest, size: f"{digest}-{size}")
+def thumbnail(request, digest, size):
+    """
+    Serves a listing image thumbnail. Its URL names its content (see
+    thumbnails.name()), so browsers and proxies may keep it for good.
+    """
+    if size not in thumbnails.SIZES or not re.fullmatch(r"[0-9a-f]{64}", digest):
+        raise Http404
+    try:
+        image = thumbnails.storage().open(thumbnails.name(digest, size))
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(image, content_type="image/jpeg")
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
 @login_required
 def comment(request):
     listing_id = request.POST["listing_id"]
@@ -34,51 +214,143 @@ def comment(request):
         new_comment.save()
     return HttpResponseRedirect(reverse("listing", args=[listing_id]))
 
+def _redirect_back(request, default):
+    next_url = request.POST.get("next")
+    if next_url and url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        return HttpResponseRedirect(next_url)
+    return HttpResponseRedirect(default)
+
 @login_required
 def watchlist(request):
     if request.method == "POST":
         listing_id = request.POST["listing_id"]
-        listing = Listings.objects.get(pk=listing_id)
-        user = request.user
+        listing = get_object_or_404(Listings, pk=listing_id)
         if request.POST["action"] == "Add to Watchlist":
-            user.watchlist.add(listing)
-            return render(request, "auctions/listing.html", {
-                "listing": listing,
-                "watchlist": request.user.watchlist.all() if request.user.is_authenticated else None
-            })
+            watchlists.add(request.user, [listing.pk])
         elif request.POST["action"] == "Remove from Watchlist":
-            user.watchlist.remove(listing)
-            return render(request, "auctions/listing.html", {
-                "listing": listing,
-                "watchlist": request.user.watchlist.all() if request.user.is_authenticated else None
-            })
+            watchlists.remove(request.user, [listing.pk])
+        return _redirect_back(request, reverse("listing", args=[listing_id]))
     else:
         return render(request, "auctions/watchlist.html", {
-            "watchlist": request.user.watchlist.all() if request.user.is_authenticated else None
+            "watchlist": fragments.prepare(list(request.user.watchlist.for_display()))
         })
 
+@login_required
+@require_POST
+def watchlist_toggle(request):
+    """
+    Adds a listing to the watchlist, or removes it if it is already
+    there, and returns whether it is now watched as JSON.
+    """
+    try:
+        listing_id = int(request.POST["listing_id"])
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "listing_id is required."}, status=400)
+    if listing_id in watchlists.watched_ids(request.user):
+        watchlists.remove(request.user, [listing_id])
+        watched = False
+    elif watchlists.add(request.user, [listing_id]):
+        watched = True
+    else:
+        return JsonResponse({"error": "No such listing."}, status=404)
+    return JsonResponse({"listing_id": listing_id, "watched": watched,
+                         "count": len(watchlists.watched_ids(request.user))})
+
+@login_required
+@require_POST
+def watchlist_bulk(request):
+    """
+    Adds or removes many listings at once. Takes a JSON body
+    {"action": "add" | "remove", "listing_ids": [...]} and answers in
+    JSON, or a form with an action and listing_id fields and redirects
+    back.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body)
+            action, ids = data["action"], [int(i) for i in data["listing_ids"]]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"error": "Expected an action and a list of listing_ids."}, status=400)
+    else:
+        action = request.POST.get("action")
+        ids = [int(i) for i in request.POST.getlist("listing_id") if i.isdigit()]
+    if action not in ("add", "remove"):
+        return JsonResponse({"error": 'action must be "add" or "remove".'}, status=400)
+    changed = (watchlists.add if action == "add" else watchlists.remove)(request.user, ids)
+    if request.content_type != "application/json":
+        return _redirect_back(request, reverse("watchlist"))
+    return JsonResponse({"action": action, "listing_ids": sorted(changed),
+                         "count": len(watchlists.watched_ids(request.user))})
+
+def _bid_stats(request, bid_rollups):
+    resolution = request.GET.get("resolution", "minute")
+    if resolution not in rollups.TRUNCATE:
+        return JsonResponse({"error": 'resolution must be "minute" or "hour".'}, status=400)
+    window = {}
+    for name in ("since", "until"):
+        value = request.GET.get(name)
+        if value:
+            window[name] = parse_datetime(value)
+            if window[name] is None:
+                return JsonResponse({"error": f"{name} must be an ISO 8601 date and time."}, status=400)
+            if timezone.is_naive(window[name]):
+                window[name] = timezone.make_aware(window[name])
+    until = window.get("until") or timezone.now()
+    since = window.get("since") or until - rollups.DEFAULT_WINDOW[resolution]
+    if not since < until <= since + rollups.MAX_WINDOW[resolution]:
+        return JsonResponse({"error": f"since must be before until, and at most "
+                                      f"{rollups.MAX_WINDOW[resolution]} before it."}, status=400)
+    return JsonResponse(rollups.series(bid_rollups, resolution, since, until))
+
+def listing_bid_stats(request, listing_id):
+    """
+    Bids on a listing per minute or hour as JSON; see rollups.series().
+    Takes ?resolution=minute|hour and an optional ?since= and ?until=.
+    """
+    listing = get_object_or_404(Listings, pk=listing_id)
+    return _bid_stats(request, listing.bid_rollups.all())
+
+def category_bid_stats(request, category):
+    """
+    Bids on a category's listings per minute or hour as JSON, like
+    listing_bid_stats().
+    """
+    category_obj = get_object_or_404(Category, name=category)
+    return _bid_stats(request, category_obj.bid_rollups.all())
+
 @login_required
 def close_auction(request):
     listing_id = request.POST["listing_id"]
     listing = Listings.objects.get(pk=listing_id)
-    listing.active = False
-    listing.save()
+    if listing.owner_id != request.user.id:
+        return HttpResponseForbidden("Only the owner of a listing can close it.")
+    listing.close()
     return HttpResponseRedirect(reverse("listing", args=[listing_id]))
 
 @login_required
 def bid(request):
     listing_id = request.POST["listing_id"]
     listing = Listings.objects.get(pk=listing_id)
-    bids = Bids.objects.filter(listing=listing)
-    bid = float(request.POST["bid"])
-    if (len(bids) == 0 and bid > listing.starting_bid) or (len(bids) > 0 and bid > max([bid.amount for bid in bids])):
-        new_bid = Bids(amount=bid, user=request.user, listing=listing)
-        new_bid.save()
+    try:
+        amount = Decimal(request.POST["bid"]).quantize(Decimal("0.01"))
+        # Rejects NaN and amounts with more digits than can be stored.
+        Bids._meta.get_field("amount").run_validators(amount)
+    except (InvalidOperation, KeyError):
+        messages.error(request, "Please enter a valid bid.")
+        return HttpResponseRedirect(reverse("listing", args=[listing_id]))
+    except ValidationError as e:
+        messages.error(request, " ".join(["Please enter a valid bid."] + e.messages))
+        return HttpResponseRedirect(reverse("listing", args=[listing_id]))
+    if listing.place_bid(request.user, amount):
         messages.success(request, "Bid placed successfully.")
-    elif len(bids) > 0:
-        messages.error(request, "Bid must be greater than the current highest bid.")
     else:
-        messages.error(request, "Bid must be greater than the starting bid.")
+        listing.refresh_from_db()
+        if not listing.active:
+            messages.error(request, "This auction is closed.")
+        elif listing.bid_count > 0:
+            messages.error(request, "Bid must be greater than the current highest bid.")
+        else:
+            messages.error(request, "Bid must be greater than the starting bid.")
     return HttpResponseRedirect(reverse("listing", args=[listing_id]))
 
 def login_view(request):
@@ -150,14 +422,38 @@ def create_listing(request):
             "form": ListingForm()
         })
     
+@login_required
+@require_POST
+def import_listings(request):
+    """
+    Creates many listings owned by the user at once, from an uploaded
+    `file` or the request body: CSV with a header row naming
+    ListingForm's fields, or JSON lines. Answers with the new listings'
+    ids and the errors of the rows that were skipped; see
+    ingest.import_listings().
+    """
+    upload = request.FILES.get("file")
+    format = request.GET.get("format") or request.POST.get("format")
+    if not format:
+        name = upload.name if upload else ""
+        if name.endswith(".csv") or (not upload and request.content_type == "text/csv"):
+            format = "csv"
+        else:
+            format = "jsonl"
+    if format not in ingest.FORMATS:
+        return JsonResponse({"error": 'format must be "csv" or "jsonl".'}, status=400)
+    lines = ingest.open_lines(upload or io.BytesIO(request.body))
+    result = ingest.import_listings(ingest.read_rows(lines, format), request.user)
+    return JsonResponse(result, status=201 if result["created"] else 200)
+
 def category(request, category=None):
     if category:
-        category_obj = Category.objects.get(name=category)
-        listings = Listings.objects.filter(category=category_obj, active=True)
-        return render(request, "auctions/category.html", {
-            "category": category_obj,
-            "listings": listings
-        })
+        category_obj = get_object_or_404(Category, name=category)
+        form = ListingFilterForm(request.GET)
+        del form.fields["category"]
+        context = browse(request, Listings.objects.for_display().filter(category=category_obj), form)
+        context["category"] = category_obj
+        return render(request, "auctions/category.html", context)
     else:
         categories = Category.objects.all()
         return render(request, "auctions/categories.html", {
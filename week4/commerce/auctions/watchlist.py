@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Listings
+
+
+def _cache():
+    return caches[getattr(settings, "AUCTIONS_WATCHLIST_CACHE", "default")]
+
+
+def _key(user_id):
+    return f"auctions:watchlist:{user_id}"
+
+
+def watched_ids(user):
+    """
+    Returns the set of ids of the listings `user` watches, from the
+    cache when possible.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    cache = _cache()
+    ids = cache.get(_key(user.pk))
+    if ids is None:
+        ids = frozenset(user.watchlist.values_list("pk", flat=True))
+        cache.set(_key(user.pk), ids, getattr(settings, "AUCTIONS_WATCHLIST_CACHE_TIMEOUT", 300))
+    return ids
+
+
+def invalidate(user_ids):
+    _cache().delete_many([_key(user_id) for user_id in user_ids])
+
+
+def watchlist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops the cached watchlists that a change to Listings.watchlist
+    touched, whichever side it was made from (user.watchlist.add(), the
+    admin, ...).
+    """
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if isinstance(instance, Listings):
+        if action == "pre_clear":
+            pk_set = set(instance.watchlist.values_list("pk", flat=True))
+        invalidate(pk_set or ())
+    else:
+        invalidate([instance.pk])
+
+
+def add(user, listing_ids):
+    """
+    Adds the listings among `listing_ids` that exist to `user`'s
+    watchlist, in one query however many there are. Returns the ids
+    added.
+    """
+    ids = set(Listings.objects.filter(pk__in=listing_ids).values_list("pk", flat=True))
+    if ids:
+        user.watchlist.add(*ids)
+    return ids
+
+
+def remove(user, listing_ids):
+    """
+    Removes `listing_ids` from `user`'s watchlist.
+    """
+    ids = set(listing_ids)
+    if ids:
+        user.watchlist.remove(*ids)
+    return ids
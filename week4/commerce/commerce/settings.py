@@ -63,6 +63,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'auctions.fragments.context',
             ],
         },
     },
@@ -120,3 +121,77 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Listing browse pages (index and categories) are paginated by cursor;
+# ?page_size= can ask for up to AUCTIONS_MAX_PAGE_SIZE listings per page.
+
+AUCTIONS_PAGE_SIZE = 25
+
+AUCTIONS_MAX_PAGE_SIZE = 100
+
+
+# Listing pages show a listing's newest comments, this many at a time.
+
+AUCTIONS_COMMENTS_PAGE_SIZE = 20
+
+
+# Listing pages receive new bids and auction closings as Server-Sent
+# Events. The default hub only reaches clients of the same process; run
+# under ASGI (commerce/asgi.py) so open streams don't each hold a thread.
+
+AUCTIONS_EVENT_HUB = "auctions.events.InProcessHub"
+
+AUCTIONS_EVENTS_KEEPALIVE = 15
+
+
+# Listing search uses SQLite's FTS5 where it is available, and the
+# ListingTerm table otherwise (or if AUCTIONS_SEARCH_FTS is False; run
+# rebuild_search_index after changing it). Facet counts are taken over
+# the newest AUCTIONS_SEARCH_FACET_LIMIT matches.
+
+AUCTIONS_SEARCH_FTS = True
+
+AUCTIONS_SEARCH_FACET_LIMIT = 500
+
+
+# Each user's set of watched listing ids is cached in this cache (the
+# default in-memory one unless CACHES says otherwise) and dropped when
+# their watchlist changes.
+
+AUCTIONS_WATCHLIST_CACHE = "default"
+
+AUCTIONS_WATCHLIST_CACHE_TIMEOUT = 300
+
+
+# Listings imported in bulk (the import_listings command, or a POST of
+# CSV or JSON lines to /api/listings/import) are validated one row at a
+# time and inserted AUCTIONS_IMPORT_BATCH_SIZE at a time.
+
+AUCTIONS_IMPORT_BATCH_SIZE = 500
+
+
+# Listing images are fetched and resized to thumbnails by
+# AUCTIONS_THUMBNAIL_WORKERS background threads, 0 to do it in the
+# request instead; generate_thumbnails makes any missing ones.
+# They are stored in AUCTIONS_THUMBNAIL_DIR, named after their content.
+
+AUCTIONS_THUMBNAIL_DIR = os.path.join(BASE_DIR, 'thumbnails')
+
+AUCTIONS_THUMBNAIL_WORKERS = 2
+
+AUCTIONS_THUMBNAIL_FETCHER = "auctions.thumbnails.fetch_url"
+
+AUCTIONS_THUMBNAIL_MAX_BYTES = 10 * 1024 * 1024
+
+AUCTIONS_THUMBNAIL_TIMEOUT = 10
+
+
+# Parts of listing pages (each listing's details, its bid history and
+# comments) are cached in this cache, keyed on version counters kept
+# there too and bumped when listings, bids, comments or categories
+# change. Several server processes need a cache they share.
+
+AUCTIONS_FRAGMENT_CACHE = "default"
+
+AUCTIONS_FRAGMENT_CACHE_TIMEOUT = 600